@@ -0,0 +1,121 @@
+# Compute mean temperature for each of the 5 levermann regions for a range of years in parallel
+# Replaces calling ComputeThetaoSectors.py for each leg (TSwrapper.sh); years already in the
+# output file are skipped and the output file is written once, ordered by year.
+
+## Import modules
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+import SectorIndex as SI
+import NemoOutput as NO
+
+## Sector names, consistent with linear response functions
+sectors = ['eais','wedd','amun','ross','apen']
+
+##################### Sector mean thetao computation ############################
+
+def init_worker(index, budget):
+    global sector_index, memory_budget
+    sector_index = index
+    memory_budget = budget
+
+def process_year(year_file):
+    year, file = year_file
+    thetao_sectors = NO.sector_mean_thetao(file, sector_index, sectors, memory_budget)
+    return year, [thetao_sectors[sector] for sector in sectors]
+
+def report_failed(failed):
+    '''
+    Print the years that could not be computed and the error of each, run again to retry them
+    '''
+    print(f'##### Failed to compute {len(failed)} years (not in the output file) ##############')
+    for year in sorted(failed):
+        print(year, failed[year])
+
+def main():
+    print('Argument List:', str(sys.argv))
+
+    ## Year of run + total experiment, optional: range of legs and number of workers
+    year_min = int(sys.argv[1])
+    year_max = int(sys.argv[2])
+    exp_name = str(sys.argv[3])
+    start_dir = str(sys.argv[4])
+    run_dir = str(sys.argv[5])
+    leg_first = int(sys.argv[6]) if len(sys.argv) > 6 else 1
+    leg_last = int(sys.argv[7]) if len(sys.argv) > 7 else year_max+1-year_min
+    n_workers = int(sys.argv[8]) if len(sys.argv) > 8 else os.cpu_count()
+    memory_budget = float(sys.argv[9]) if len(sys.argv) > 9 else None # [MB] per worker, for eORCA025/eORCA12 output
+
+    ########################## File definition #########################
+    ## Paths
+    path_input = f'{start_dir}/fwf/interactive/input/'
+    path_output = f'{start_dir}/fwf/interactive/forcing_files/{exp_name}/'
+
+    ## Input data
+    file_area = f'{path_input}/areacello_Ofx_EC-Earth3_historical_r1i1p1f1_gn.nc'
+    file_sector_index = f'{path_input}/SectorIndex_ORCA1.npz' # cached, rebuilt when area file or sectors change
+
+    ## Output data
+    output_thetao =f'{path_output}/OceanSectorThetao_{exp_name}_{year_min}_{year_max}.csv'
+
+    ##################### Find years to process ############################
+
+    def file_thetao(leg):
+        year = year_min + leg - 1
+        leg_number = str(leg).zfill(3)
+        return f'{run_dir}/output/nemo/{leg_number}/{exp_name}_1m_{year}0101_{year}1231_opa_grid_T_3D.nc'
+
+    if os.path.isfile(output_thetao):
+        # Exact round trip, the years already done are written again unchanged
+        df_thetao_done = pd.read_csv(output_thetao, index_col=0, float_precision='round_trip')
+        # A year appended twice (e.g. a resubmitted leg of the csv version of the coupler): keep the last row
+        df_thetao_done = df_thetao_done[~df_thetao_done.index.duplicated(keep='last')]
+    else:
+        df_thetao_done = pd.DataFrame(columns=sectors, dtype=float)
+        df_thetao_done.index.name = 'year'
+
+    todo = [(year_min+leg-1, file_thetao(leg)) for leg in range(leg_first, leg_last+1)
+            if year_min+leg-1 not in df_thetao_done.index and os.path.isfile(file_thetao(leg))]
+    print(f'{len(todo)} years to process, {len(df_thetao_done)} years already in {output_thetao}')
+    if not todo:
+        return
+
+    ## Build or load sector index once, shared by all workers
+    index = SI.load_sector_index(file_area, file_sector_index, sectors)
+
+    ## A failing year (e.g. corrupt NEMO output) does not discard the years computed by the other workers
+    results = {}
+    failed = {}
+    with ProcessPoolExecutor(max_workers=n_workers, initializer=init_worker, initargs=(index, memory_budget)) as pool:
+        futures = {pool.submit(process_year, year_file): year_file for year_file in todo}
+        for future in as_completed(futures):
+            year, file = futures[future]
+            try:
+                results[year] = future.result()[1]
+            except Exception as error:
+                failed[year] = f'{file}: {error!r}'
+
+    if not results:
+        print('No years computed')
+        report_failed(failed)
+        sys.exit(1)
+
+    df_thetao_new = pd.DataFrame.from_dict(results, orient='index', columns=sectors)
+    df_thetao_all = pd.concat([df_thetao_done, df_thetao_new]).sort_index()
+    df_thetao_all.index.name = 'year'
+
+    ## Export data in one step (via temporary file, so that the output is never left incomplete)
+    print(f'##### Exporting data of {len(df_thetao_new)} years to csv file ##############')
+    print(output_thetao)
+    df_thetao_all.to_csv(f'{output_thetao}.tmp')
+    os.replace(f'{output_thetao}.tmp', output_thetao)
+
+    if failed:
+        report_failed(failed)
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
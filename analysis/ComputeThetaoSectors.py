@@ -3,12 +3,12 @@
 
 ## Import modules
 import os
-import xarray as xr
 import pandas as pd
-import numpy as np
 import sys
 
-import ThetaoSectors as TS
+import SectorIndex as SI
+import NemoOutput as NO
+import SectorOperator as SO
 
 print('Number of arguments:', len(sys.argv), 'arguments.')
 print('Argument List:', str(sys.argv))
@@ -35,45 +35,40 @@ path_output = f'{start_dir}/fwf/interactive/forcing_files/{exp_name}/'
 ## Output file from nemo: input file for freshwater forcing
 file_thetao = f'{run_dir}/output/nemo/{leg_number}/{exp_name}_1m_{year}0101_{year}1231_opa_grid_T_3D.nc' #other output format
 file_area = f'{path_input}/areacello_Ofx_EC-Earth3_historical_r1i1p1f1_gn.nc'
+file_sector_index = f'{path_input}/SectorIndex_ORCA1.npz' # cached, rebuilt when area file or sectors change
 
 ## Output data
 output_thetao =f'{path_output}/OceanSectorThetao_{exp_name}_{year_min}_{year_max}.csv'
 
 ##################### Sector mean thetao computation ############################
 
-## Open thetao dataset + rename dimensions (to be consistent with areacello file)
-ds = xr.open_dataset(file_thetao)
-ds = ds.rename({'y':'j','x':'i','nav_lon':'longitude','nav_lat':'latitude','olevel':'lev'})
+## Sector names, consistent with linear response functions
+sectors = ['eais','wedd','amun','ross','apen']
 
-## Compute time mean value over annual file 
-ds_thetao_year = ds['thetao'].mean('time_counter')
+## Load sector index (cells and area weights per sector)
+sector_index = SI.load_sector_index(file_area, file_sector_index, sectors)
 
-# Read lev bnds
-ds_lev_bnds = ds['olevel_bounds']
+## Open thetao dataset, only the rows and layers covering the sectors (renamed consistent with areacello file)
+ds, sector_index_subset = NO.open_thetao_subset(file_thetao, sector_index, sectors)
 
-## Open areacello dataset
-ds_area = xr.open_dataset(file_area)
+## Compute month length weighted time mean value over annual file (one month at a time)
+ds_thetao_year = NO.annual_mean(ds, 'thetao')
 
-## Sector names, consistent with linear response functions
-sectors = ['eais','wedd','amun','ross','apen']
+# Read lev bnds
+ds_lev_bnds = ds['olevel_bounds']
 
 ## Create dataframe for mean ocean temperatures per sector
 df_thetao_year = pd.DataFrame(columns=sectors, index=[year])
 df_thetao_year.index.name = 'year'
 
-## Loop over oceanic sectors
-for sector in sectors:
-
-    # Compute area weighted mean temperature
-    print('Computing area weighted mean of thetao for ', sector, 'sector')           
-    thetao_area_weighted_mean = TS.area_weighted_mean(ds_thetao_year,ds_area,sector)
-
-    # Compute layer weighted mean of area weighted mean --> volume weighted mean
-    thetao_volume_weighted_mean = TS.lev_weighted_mean(thetao_area_weighted_mean,ds_lev_bnds,sector)
+## Compute volume weighted mean temperature of all sectors in one pass 
+print('Computing volume weighted mean of thetao for all sectors')
+volume_operator = SO.build_volume_operator(sector_index_subset, ds_lev_bnds, sectors, ds_thetao_year.shape)
+thetao_volume_weighted_mean = SO.apply_volume_operator(volume_operator, ds_thetao_year)
 
-    # Create dataframe from dataarray
-    print('Fill dataframe for sector ', sector)
-    df_thetao_year[sector] = [thetao_volume_weighted_mean.values]
+# Fill dataframe
+for sector in sectors:
+    df_thetao_year[sector] = [thetao_volume_weighted_mean[sector]]
 
 ## Export data 
 print(f'##### Exporting data of year {year} to csv file ##############')
@@ -89,5 +84,4 @@ elif year>year_min:
     # Append to existing file (if file exists)
     df_thetao_year.to_csv(output_thetao, mode='a', header=not os.path.exists(output_thetao))
 
-ds_area.close()
 
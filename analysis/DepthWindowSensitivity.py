@@ -0,0 +1,83 @@
+# Sensitivity of the sector mean ocean temperatures to the depth window: mean temperature of each sector for
+# all combinations of shelf depth and window thickness, from one computation of the sector profiles
+# (see DepthIntegral.py)
+#
+# Usage: python DepthWindowSensitivity.py year_min year_max leg exp_name start_dir run_dir [thicknesses] [offsets]
+#   thicknesses: window thicknesses [m], comma separated (default 50,100,200,300)
+#   offsets: shelf depths relative to the shelf depth of each sector [m], comma separated (default -100 to 100 m in steps of 25 m)
+
+## Import modules
+import sys
+
+import netCDF4
+import numpy as np
+import pandas as pd
+
+import DataVariablesParameters as dvp
+import DepthIntegral as DI
+import SectorIndex as SI
+import NemoOutput as NO
+
+print('Argument List:', str(sys.argv))
+
+## Year of run + total experiment
+year_min = int(sys.argv[1])
+year_max = int(sys.argv[2])
+leg = int(sys.argv[3])
+leg_number = str(sys.argv[3]).zfill(3) # add leading zeros
+exp_name = str(sys.argv[4])
+start_dir = str(sys.argv[5])
+run_dir = str(sys.argv[6])
+thicknesses = [float(value) for value in sys.argv[7].split(',')] if len(sys.argv) > 7 else [50, 100, 200, 300]
+offsets = [float(value) for value in sys.argv[8].split(',')] if len(sys.argv) > 8 else np.arange(-100, 101, 25)
+
+year = year_min + leg - 1
+print('year: ', year)
+
+########################## File definition #########################
+## Paths
+path_input = f'{start_dir}/fwf/interactive/input/'
+path_output = f'{start_dir}/fwf/interactive/forcing_files/{exp_name}/'
+
+## Input data
+file_thetao = f'{run_dir}/output/nemo/{leg_number}/{exp_name}_1m_{year}0101_{year}1231_opa_grid_T_3D.nc'
+file_area = f'{path_input}/areacello_Ofx_EC-Earth3_historical_r1i1p1f1_gn.nc'
+file_sector_index = f'{path_input}/SectorIndex_ORCA1.npz' # cached, rebuilt when area file or sectors change
+
+## Output data
+output_windows = f'{path_output}/OceanSectorThetaoWindows_{exp_name}_{year}.csv'
+
+##################### Sector profiles ############################
+
+## Sector names, consistent with linear response functions
+sectors = ['eais','wedd','amun','ross','apen']
+
+## Load sector index (cells and area weights per sector)
+sector_index = SI.load_sector_index(file_area, file_sector_index, sectors)
+
+## Annual mean of all layers of the rows covering the sectors, area weighted mean per layer and sector
+with netCDF4.Dataset(file_thetao) as nc:
+    lev_bnds = np.asarray(nc['olevel_bounds'][:])
+    j_min, j_max = NO.sector_rows(sector_index, sectors)
+    print(f'Reading rows {j_min}:{j_max} and all layers of {file_thetao}')
+    thetao_year = NO.annual_mean_block(nc['thetao'], NO.record_lengths_netcdf(nc), slice(0, len(lev_bnds)), slice(j_min, j_max))
+profiles = DI.sector_profiles(thetao_year, NO.subset_sector_index(sector_index, j_min), sectors)
+integral = DI.depth_integral(profiles, lev_bnds)
+
+##################### Depth windows ############################
+
+## Windows centred around the shelf depth of each sector plus offset (sector, offset, thickness)
+shelf_depths = np.array([dvp.shelf_depths[sector] for sector in sectors])[:,None] + np.asarray(offsets)[None,:]
+depth_top, depth_bottom = DI.centred_windows(shelf_depths.reshape(-1), thicknesses)
+
+## Mean of each sector over its own windows (sector, offset, thickness)
+means = DI.window_mean(integral, depth_top.reshape(len(sectors), len(offsets), -1),
+                       depth_bottom.reshape(len(sectors), len(offsets), -1), per_profile=True)
+index = pd.MultiIndex.from_product([sectors, offsets, thicknesses], names=['sector','offset','thickness'])
+df_windows = pd.DataFrame({'shelf_depth': np.repeat(shelf_depths.reshape(-1), len(thicknesses)),
+                           'thetao': means.reshape(-1)}, index=index)
+
+## Export data
+print(f'##### Exporting {len(df_windows)} depth windows of year {year} to csv file ##############')
+print(output_windows)
+df_windows.to_csv(output_windows)
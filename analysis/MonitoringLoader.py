@@ -0,0 +1,226 @@
+import io
+import json
+import os
+import re
+import zlib
+
+import pandas as pd
+
+###############################################################################
+# Loader of the monitoring csv files of any number of experiments for the
+# analysis notebooks. The csv files of an experiment are converted once into a
+# columnar cache (Parquet, one file per experiment) with one row per variable,
+# year and sector; when the csv files change only the new lines are parsed
+# (lines appended to a file) or the changed files are parsed again (rewritten).
+# Years that resubmitted legs appended more than once have the values of the
+# last line of the year.
+#
+# Example:
+#   import MonitoringLoader as ML
+#   df = ML.load_experiments({'lnic': '/perm/.../forcing_files/lnic', 'lric': '/perm/.../forcing_files/lric'})
+#   ML.wide(df, 'OceanSectorThetao').plot()   # year x (experiment, sector)
+###############################################################################
+
+## Columns of the tidy frame
+columns = ['experiment', 'variable', 'year', 'sector', 'value']
+## Default cache directory (the output directories of other users are usually not writable)
+path_cache_default = os.path.expanduser('~/.cache/fwf_monitoring')
+cache_version = 1
+
+def monitoring_files(path_output, exp_name):
+    '''
+    Monitoring csv files of an experiment: {name}_{exp}_{year_min}_{year_max}.csv and {name}_{exp}_Future.csv
+
+    Args:
+        path_output: directory of monitoring files
+        exp_name: experiment name
+
+    Returns:
+        Dictionary with variable (name of the monitoring file, e.g. OceanSectorThetao_30yRM) and file name
+    '''
+    pattern = re.compile(rf'^(?P<variable>.+)_{re.escape(exp_name)}_(\d+_\d+|Future)\.csv$')
+    files = {}
+    for file in sorted(os.listdir(path_output)):
+        match = pattern.match(file)
+        if match:
+            files[match['variable']] = file
+    return files
+
+def tidy(df_csv, exp_name, variable):
+    '''
+    Convert rows of a monitoring csv file (first column: year, or time step for the Future file;
+    other columns: sectors, or '0' for the total) to the tidy format
+    '''
+    df = df_csv.rename(columns={df_csv.columns[0]: 'year', '0': 'total'})
+    df = df.melt(id_vars='year', var_name='sector', value_name='value')
+    df['experiment'] = exp_name
+    df['variable'] = variable
+    return df[columns]
+
+def parse_csv(data, header=None):
+    '''
+    Parse csv data (bytes), with the column names of the header line when data does not start with it
+    '''
+    if header is None:
+        return pd.read_csv(io.BytesIO(data))
+    return pd.read_csv(io.BytesIO(data), header=None, names=header)
+
+def read_source(file, source):
+    '''
+    Read the lines of a monitoring csv file that are not in the cache yet
+
+    Args:
+        file: path of csv file
+        source: cached state of the file (size, mtime, parsed offset, crc of the parsed part, header), None if not cached
+
+    Returns:
+        Dataframe with the new lines, whether the file was parsed from the start, new state of the file
+    '''
+    stat = os.stat(file)
+    with open(file, 'rb') as f:
+        data = f.read()
+    # Only complete lines (a line may be being written)
+    end = data.rfind(b'\n') + 1
+
+    appended = (source is not None and end >= source['offset']
+                and zlib.crc32(data[:source['offset']]) == source['crc'])
+    if appended:
+        df = parse_csv(data[source['offset']:end], source['header']) if end > source['offset'] else None
+        header = source['header']
+    else:
+        df = parse_csv(data[:end])
+        header = list(df.columns)
+    state = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'offset': end,
+             'crc': zlib.crc32(data[:end]), 'header': header}
+    return df, not appended, state
+
+def cache_files(path_cache, path_output, exp_name):
+    '''
+    Paths of the cache (Parquet) and its state (json) of an experiment, keyed by experiment name and output directory
+    '''
+    key = f'{exp_name}_{zlib.crc32(os.path.abspath(path_output).encode()):08x}'
+    return f'{path_cache}/{key}.parquet', f'{path_cache}/{key}.json'
+
+def load_experiment(path_output, exp_name=None, path_cache=path_cache_default):
+    '''
+    Load the monitoring files of an experiment, refreshing the cache when the csv files changed
+
+    Args:
+        path_output: directory of monitoring files (fwf/interactive/forcing_files/{exp})
+        exp_name: experiment name (default: name of the directory)
+        path_cache: directory of the cache files
+
+    Returns:
+        Tidy dataframe with columns experiment, variable, year, sector, value
+    '''
+    exp_name = exp_name or os.path.basename(os.path.normpath(path_output))
+    file_cache, file_state = cache_files(path_cache, path_output, exp_name)
+    state = {'version': cache_version, 'sources': {}}
+    if os.path.isfile(file_state) and os.path.isfile(file_cache):
+        with open(file_state) as f:
+            state = json.load(f)
+        if state.get('version') != cache_version:
+            state = {'version': cache_version, 'sources': {}}
+
+    ## Files that are new or changed since the cache was written (size and modification time)
+    files = monitoring_files(path_output, exp_name)
+    if not files:
+        raise FileNotFoundError(f'No monitoring files {{name}}_{exp_name}_*.csv in {path_output}, check the experiment name')
+    changed = {}
+    for variable, file in files.items():
+        stat = os.stat(f'{path_output}/{file}')
+        source = state['sources'].get(variable)
+        if source is None or source['file'] != file or (source['size'], source['mtime_ns']) != (stat.st_size, stat.st_mtime_ns):
+            changed[variable] = file
+    removed = set(state['sources']) - set(files)
+
+    df = pd.read_parquet(file_cache) if state['sources'] else pd.DataFrame(columns=columns)
+    if not changed and not removed:
+        return df
+
+    ## Parse the new lines (or the whole file) of the changed files and replace the rows of these years
+    parts = [df[~df['variable'].isin(removed)]]
+    for variable, file in changed.items():
+        source = state['sources'].get(variable)
+        df_new, full, source_new = read_source(f'{path_output}/{file}', source if source and source['file'] == file else None)
+        state['sources'][variable] = dict(source_new, file=file)
+        if full:
+            parts[0] = parts[0][parts[0]['variable'] != variable]
+        if df_new is not None and len(df_new):
+            df_new = tidy(df_new, exp_name, variable)
+            if not full:
+                replaced = (parts[0]['variable'] == variable) & parts[0]['year'].isin(df_new['year'])
+                parts[0] = parts[0][~replaced]
+            parts.append(df_new)
+    for variable in removed:
+        del state['sources'][variable]
+
+    # Years appended twice (resubmitted legs of the csv version of the coupler): last line of the year
+    df = pd.concat([part for part in parts if len(part)], ignore_index=True)
+    df = df.drop_duplicates(['experiment', 'variable', 'year', 'sector'], keep='last').sort_values(['variable', 'sector', 'year'], kind='stable', ignore_index=True)
+    df = df.astype({'experiment': 'category', 'variable': 'category', 'sector': 'category',
+                    'year': 'int64', 'value': 'float64'})
+
+    ## Write cache (via temporary files, so that the cache is never left incomplete)
+    os.makedirs(path_cache, exist_ok=True)
+    df.to_parquet(f'{file_cache}.tmp', index=False)
+    with open(f'{file_state}.tmp', 'w') as f:
+        json.dump(state, f)
+    os.replace(f'{file_cache}.tmp', file_cache)
+    os.replace(f'{file_state}.tmp', file_state)
+    return df
+
+def load_experiments(experiments, path_cache=path_cache_default):
+    '''
+    Load the monitoring files of any number of experiments into one tidy dataframe
+
+    Args:
+        experiments: dictionary with label and directory of monitoring files, or (directory, experiment name) when the
+                     label is not the experiment name in the file names; or list of directories (label and experiment
+                     name: name of the directory)
+        path_cache: directory of the cache files
+
+    Returns:
+        Tidy dataframe with columns experiment (label), variable, year, sector, value
+    '''
+    if not isinstance(experiments, dict):
+        labels = [os.path.basename(os.path.normpath(path)) for path in experiments]
+        duplicates = sorted({label for label in labels if labels.count(label) > 1})
+        if duplicates:
+            raise ValueError(f'Experiments {duplicates} occur more than once, give them different labels with a dictionary')
+        experiments = dict(zip(labels, experiments))
+
+    parts = []
+    for label, source in experiments.items():
+        path, exp_name = source if isinstance(source, (tuple, list)) else (source, label)
+        df = load_experiment(path, exp_name, path_cache)
+        parts.append(df.assign(experiment=label) if label != exp_name else df)
+    df = pd.concat(parts, ignore_index=True)
+    # Categories differ per experiment
+    return df.astype({'experiment': 'category', 'variable': 'category', 'sector': 'category'})
+
+def wide(df, variable, sectors=None, experiments=None):
+    '''
+    One variable as a wide table for plotting: years as rows, (experiment, sector) as columns
+
+    Args:
+        df: tidy dataframe (see load_experiments)
+        variable: name of the monitoring file, e.g. OceanSectorThetao, BasalMeltAnomaly, TotalFreshwaterForcing
+        sectors: list of sectors (optional, default: all)
+        experiments: list of experiments (optional, default: all, in the order of df)
+
+    Returns:
+        Dataframe with years as index and columns (experiment, sector)
+    '''
+    df = df[df['variable'] == variable]
+    if sectors is not None:
+        df = df[df['sector'].isin(sectors)]
+    if experiments is not None:
+        df = df[df['experiment'].isin(experiments)]
+    duplicated = df.duplicated(['experiment', 'sector', 'year'])
+    if duplicated.any():
+        raise ValueError(f"Experiments {sorted(df.loc[duplicated, 'experiment'].unique())} have more than one value per year "
+                         f'and sector of {variable}, load them with different labels')
+    table = df.pivot_table(index='year', columns=['experiment', 'sector'], values='value', observed=True, dropna=False)
+    order = experiments or list(dict.fromkeys(df['experiment']))
+    return table.reindex(columns=order, level='experiment')
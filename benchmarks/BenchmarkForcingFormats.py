@@ -0,0 +1,81 @@
+# Benchmark on-disk layouts of the FWF_LRF forcing files: write time, file size and read time
+# Usage: python BenchmarkForcingFormats.py [n_years] [path_tmp]
+
+## Import modules
+import os
+import sys
+import shutil
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+import ForcingTemplate as FT
+
+n_years = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+path_tmp = tempfile.mkdtemp(dir=sys.argv[2] if len(sys.argv) > 2 else None)
+
+## Layouts to compare (see ForcingTemplate.default_layout)
+layouts = {'float64 netCDF4 (original)': {},
+           'float32 netCDF4': {'dtype': 'float32'},
+           'float32 netCDF4 deflate': {'dtype': 'float32', 'complevel': 4, 'chunksizes': (1, 292, 362)},
+           'float32 netCDF3-classic': {'dtype': 'float32', 'format': 'NETCDF3_CLASSIC'},
+           'float32 netCDF3-classic 1 record': {'dtype': 'float32', 'format': 'NETCDF3_CLASSIC', 'n_time': 1}}
+
+######################## Synthetic ORCA1 masks and areas ########################
+
+print(f'Creating synthetic ORCA1 masks in {path_tmp}')
+rng = np.random.default_rng(0)
+ny, nx = 292, 362
+area = xr.DataArray(rng.uniform(1e9, 1e10, (ny, nx)), dims=('j','i'), name='areacello')
+area[:5] = np.nan # land
+file_area = f'{path_tmp}/areacello.nc'
+area.to_dataset().to_netcdf(file_area)
+
+file_masks = {}
+for var, name in FT.forcing_masks.items():
+    # Coastal Antarctic cells, about 1500 per mask as for ORCA1
+    mask = np.zeros((ny, nx))
+    mask[rng.integers(5, 60, 1500), rng.integers(0, nx, 1500)] = 1
+    file_masks[var] = f'{path_tmp}/{name}.nc'
+    xr.DataArray(mask, dims=('j','i'), name=name).to_dataset().to_netcdf(file_masks[var])
+
+time_months = np.array(['1851-01-16'], dtype='datetime64[ns]') + np.arange(12)*np.timedelta64(30,'D')
+
+############################### Benchmark ###############################
+
+def read_forcing(file_forcing):
+    '''
+    Read all values of the forcing file, as NEMO does at the start of every leg
+    '''
+    with xr.open_dataset(file_forcing) as ds:
+        return {var: ds[var].values for var in FT.forcing_masks}
+
+results = pd.DataFrame(columns=['write [ms]', 'size [kB]', 'read [ms]', f'{n_years} yr [MB]'])
+for name, layout in layouts.items():
+    file_template = f'{path_tmp}/template.nc'
+    template = FT.load_forcing_template(file_masks, file_area, file_template, layout)
+
+    start = time.perf_counter()
+    for year in range(n_years):
+        FT.write_forcing(template, file_template, f'{path_tmp}/FWF_LRF_y{1851+year}.nc',
+                         {var: 1e-5*(1+year) for var in FT.forcing_masks}, time_months + np.timedelta64(365*year,'D'))
+    time_write = (time.perf_counter() - start)/n_years
+
+    start = time.perf_counter()
+    for year in range(n_years):
+        read_forcing(f'{path_tmp}/FWF_LRF_y{1851+year}.nc')
+    time_read = (time.perf_counter() - start)/n_years
+
+    size = os.path.getsize(f'{path_tmp}/FWF_LRF_y1851.nc')
+    results.loc[name] = [1e3*time_write, size/1e3, 1e3*time_read, n_years*size/1e6]
+
+    for year in range(n_years):
+        os.remove(f'{path_tmp}/FWF_LRF_y{1851+year}.nc')
+
+shutil.rmtree(path_tmp)
+
+print(results.round(1).to_string())
@@ -0,0 +1,243 @@
+# Benchmark the stages of the freshwater forcing pipeline on synthetic inputs (see SyntheticInputs.py)
+# Every stage runs in a new python process, which records wall time, CPU time, peak RSS and the bytes
+# read; the results are appended as json lines (one per stage and year), tagged with the git commit,
+# so that runs of different commits can be compared.
+#
+# Usage: python BenchmarkPipeline.py run [grid] [n_years] [results_file] [path_tmp]
+#          grid: ORCA1 (default), ORCA025 or eORCA12; results_file: default benchmarks/results.jsonl
+#        python BenchmarkPipeline.py compare [results_file] [commit_old] [commit_new]
+#          default: the last two commits in the results file
+
+## Import modules
+import contextlib
+import json
+import os
+import platform
+import resource
+import runpy
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+path_benchmarks = os.path.dirname(os.path.abspath(__file__))
+path_repo = os.path.dirname(path_benchmarks)
+path_scripts = f'{path_repo}/scripts'
+path_analysis = f'{path_repo}/analysis'
+
+year_min = 1850
+exp_name = 'bench'
+
+## Stages: (directory of scripts, description); scripts are run as from the command line,
+## in-process stages call the coupler functions with the static inputs loaded beforehand
+stages = {'grid': (path_scripts, 'fwf.py grid: grid descriptor from NEMO output'),
+          'initialise': (path_scripts, 'InitialiseFreshwaterForcing.py (first year)'),
+          'interactive': (path_scripts, 'ThetaoDrivenFreshwaterForcing.py (per year, first year builds caches)'),
+          'prescribed': (path_scripts, 'PrescribedFreshwaterForcing.py (per year)'),
+          'load_static': (path_scripts, 'Coupler.load_static (cached sector index, template)'),
+          'read_thetao': (path_scripts, 'NemoOutput: annual mean of sector rows and layers'),
+          'sector_mean': (path_scripts, 'SectorOperator: volume weighted sector means'),
+          'couple_year': (path_scripts, 'Coupler.couple_year (static inputs loaded)'),
+          'write_forcing': (path_scripts, 'ForcingTemplate.write_forcing'),
+          'analysis_year': (path_analysis, 'ComputeThetaoSectors.py (per year)'),
+          'analysis_batch': (path_analysis, 'BatchThetaoSectors.py (all years, 2 workers)')}
+
+############################### Measurement (stage process) ###############################
+
+def bytes_read():
+    '''
+    Bytes read by this process (rchar of /proc/self/io: all read calls, including from page cache)
+    '''
+    try:
+        with open('/proc/self/io') as f:
+            return int(dict(line.split(': ') for line in f.read().splitlines())['rchar'])
+    except (OSError, KeyError): # not available on macOS
+        return 0
+
+def peak_rss():
+    '''
+    Peak resident set size [MB] of this process and its (finished) child processes
+    '''
+    scale = 1/1024 if sys.platform != 'darwin' else 1/1024**2 # kB on linux, bytes on macOS
+    return scale*max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                     resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+
+def run_script(path, script, args):
+    '''
+    Run script as from the command line (python script.py args), without its output
+    '''
+    sys.argv = [f'{path}/{script}'] + [str(arg) for arg in args]
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        runpy.run_path(sys.argv[0], run_name='__main__')
+
+def coupler_setup(root, year):
+    '''
+    Paths, static inputs and state of the coupler for the in-process stages
+    '''
+    import Coupler as CP
+    files = CP.coupler_files(year_min, year, exp_name, root, root)
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        static = CP.load_static(files)
+    return CP, files, static
+
+def stage_function(stage, root, year, n_years):
+    '''
+    Function running one stage; work that is not part of the stage is done here, before the measurement
+    '''
+    leg = year - year_min + 1
+    year_max = year_min + n_years - 1
+    file_thetao = f'{root}/output/nemo/{str(leg).zfill(3)}/{exp_name}_1m_{year}0101_{year}1231_opa_grid_T_3D.nc'
+
+    if stage == 'grid':
+        return lambda: run_script(path_scripts, 'fwf.py', ['grid', file_thetao, root])
+    if stage == 'initialise':
+        return lambda: run_script(path_scripts, 'InitialiseFreshwaterForcing.py', [year_min, exp_name, root])
+    if stage == 'interactive':
+        return lambda: run_script(path_scripts, 'ThetaoDrivenFreshwaterForcing.py', [year_min, year_max, year, leg, exp_name, root, root])
+    if stage == 'prescribed':
+        return lambda: run_script(path_scripts, 'PrescribedFreshwaterForcing.py', [year_min, year_max, year, leg, exp_name, root, root])
+    if stage == 'analysis_year':
+        return lambda: run_script(path_analysis, 'ComputeThetaoSectors.py', [year_min, year_max, leg, exp_name, root, root])
+    if stage == 'analysis_batch':
+        return lambda: run_script(path_analysis, 'BatchThetaoSectors.py', [year_min, year_max, exp_name, root, root, 1, n_years, 2])
+
+    import NemoOutput as NO
+    import SectorOperator as SO
+    import ForcingTemplate as FT
+    if stage == 'load_static':
+        import Coupler as CP
+        files = CP.coupler_files(year_min, year_max, exp_name, root, root)
+        return lambda: CP.load_static(files)
+
+    CP, files, static = coupler_setup(root, year_max)
+    if stage == 'read_thetao':
+        return lambda: NO.read_annual_mean(file_thetao, static['sector_index'], CP.sectors, 'thetao')
+    if stage == 'sector_mean':
+        thetao, lev_bnds, index = NO.read_annual_mean(file_thetao, static['sector_index'], CP.sectors, 'thetao')
+        def sector_mean():
+            operator = SO.build_volume_operator(index, lev_bnds, CP.sectors, thetao.shape)
+            return SO.apply_volume_operator(operator, thetao)
+        return sector_mean
+    if stage == 'couple_year':
+        state = CP.open_coupler_state(files, static, year)
+        return lambda: CP.couple_year(files, static, state, year, file_thetao)
+    if stage == 'write_forcing':
+        import numpy as np
+        time_months = np.arange(f'{year+1}-01', f'{year+2}-01', dtype='datetime64[M]').astype('datetime64[ns]')
+        return lambda: FT.write_forcing(static['forcing_template'], files['file_forcing_template'],
+                                        f"{files['path_output']}/FWF_LRF_bench.nc",
+                                        {var: 1.e-5 for var in FT.forcing_masks}, time_months)
+    raise ValueError(f'Unknown stage {stage}')
+
+def measure_stage(stage, root, year, n_years):
+    '''
+    Run one stage in this process and print the measurements as json
+    '''
+    path = stages[stage][0]
+    os.chdir(path)
+    sys.path.insert(0, path)
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        func = stage_function(stage, root, year, n_years)
+
+    read_start, cpu_start, wall_start = bytes_read(), time.process_time(), time.perf_counter()
+    func()
+    wall = time.perf_counter() - wall_start
+    cpu = time.process_time() - cpu_start
+    read = bytes_read() - read_start
+    print(json.dumps({'wall_s': wall, 'cpu_s': cpu, 'peak_rss_mb': peak_rss(), 'read_mb': read/1e6}))
+
+############################### Benchmark run ###############################
+
+def git_commit():
+    '''
+    Commit of the repository, with '+' appended when there are uncommitted changes
+    '''
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=path_repo, capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=path_repo, capture_output=True, text=True).stdout.strip()
+        return commit + ('+' if dirty else '')
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+def run_stage(stage, root, year, n_years):
+    '''
+    Run one stage in a new python process
+
+    Returns:
+        Dictionary with wall time [s], CPU time [s], peak RSS [MB] and bytes read [MB]
+    '''
+    result = subprocess.run([sys.executable, os.path.abspath(__file__), 'stage', stage, root, str(year), str(n_years)],
+                            capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f'Stage {stage} ({year}) failed:\n{result.stderr}')
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def run(grid='ORCA1', n_years=3, file_results=f'{path_benchmarks}/results.jsonl', path_tmp=None):
+    '''
+    Generate synthetic inputs and benchmark all stages, appending the results to file_results
+    '''
+    import SyntheticInputs as SYN
+
+    n_years = int(n_years)
+    root = tempfile.mkdtemp(prefix=f'fwf_{grid}_', dir=path_tmp)
+    commit = git_commit()
+    meta = {'commit': commit, 'grid': grid, 'n_years': n_years, 'host': platform.node(),
+            'python': platform.python_version(), 'date': time.strftime('%Y-%m-%dT%H:%M:%S')}
+    try:
+        print(f'Generating synthetic {grid} inputs for {n_years} years in {root}')
+        start = time.perf_counter()
+        SYN.generate_experiment(root, grid, n_years, year_min, exp_name)
+        print(f'  done in {time.perf_counter()-start:.1f} s')
+
+        ## Pipeline order: grid descriptor and first forcing file, then the years of the experiment
+        todo = [('grid', year_min), ('initialise', year_min)]
+        todo += [('interactive', year) for year in range(year_min, year_min+n_years)]
+        todo += [(stage, year_min) for stage in ['load_static', 'read_thetao', 'sector_mean', 'write_forcing', 'couple_year']]
+        todo += [('prescribed', year) for year in range(year_min, year_min+n_years)]
+        # Batch first: it skips the years already in the output file of ComputeThetaoSectors.py
+        todo += [('analysis_batch', year_min), ('analysis_year', year_min)]
+
+        print(f"{'stage':15s} {'year':>5s} {'wall [s]':>9s} {'cpu [s]':>8s} {'rss [MB]':>9s} {'read [MB]':>10s}")
+        with open(file_results, 'a') as f:
+            for stage, year in todo:
+                result = run_stage(stage, root, year, n_years)
+                print(f"{stage:15s} {year:5d} {result['wall_s']:9.3f} {result['cpu_s']:8.3f} {result['peak_rss_mb']:9.1f} {result['read_mb']:10.1f}")
+                f.write(json.dumps(dict(meta, stage=stage, year=year, **result)) + '\n')
+    finally:
+        shutil.rmtree(root)
+    print(f'Results of commit {commit} appended to {file_results}')
+
+def compare(file_results=f'{path_benchmarks}/results.jsonl', commit_old=None, commit_new=None):
+    '''
+    Compare the mean results per stage of two commits (default: the last two commits in file_results)
+    '''
+    import pandas as pd
+
+    df = pd.read_json(file_results, lines=True)
+    commits = list(dict.fromkeys(df['commit']))
+    if commit_new is None:
+        commit_new = commits[-1]
+    if commit_old is None:
+        commits_old = [commit for commit in commits if commit != commit_new]
+        if not commits_old:
+            raise ValueError(f'Only results of commit {commit_new} in {file_results}, nothing to compare')
+        commit_old = commits_old[-1]
+
+    columns = ['wall_s', 'peak_rss_mb', 'read_mb']
+    means = {commit: df[df['commit']==commit].groupby(['grid','stage'], sort=False)[columns].mean() for commit in [commit_old, commit_new]}
+    table = pd.concat(means, axis=1).dropna()
+    for column in columns:
+        table[('ratio', column)] = table[(commit_new, column)]/table[(commit_old, column)]
+    print(table.round(3).to_string())
+
+if __name__ == '__main__':
+    command, args = (sys.argv[1], sys.argv[2:]) if len(sys.argv) > 1 else ('run', [])
+    if command == 'stage':
+        measure_stage(args[0], args[1], int(args[2]), int(args[3]))
+    elif command == 'run':
+        run(*args)
+    elif command == 'compare':
+        compare(*args)
+    else:
+        raise ValueError(f'Unknown command {command}, use run or compare')
@@ -0,0 +1,192 @@
+import os
+
+import netCDF4
+import numpy as np
+
+###############################################################################
+# Synthetic but realistically shaped inputs for the freshwater forcing scripts:
+# NEMO grid_T_3D output, areacello, distribution masks, piControl baseline and
+# linear response functions, in the directory layout of the runtime.
+#
+# NEMO output is written with netCDF4 chunks of one layer and record; only the
+# chunks of the Antarctic rows (south of lat_max) and the layers down to
+# depth_max are written, all other chunks stay unallocated (read as missing).
+# This keeps the eORCA12 files at about 1 GB per year.
+###############################################################################
+
+## Grid sizes (y, x) and southern most latitude of the NEMO configurations
+grids = {'ORCA1': (292, 362, -78.),
+         'ORCA025': (1050, 1442, -78.),
+         'eORCA12': (3605, 4322, -85.)}
+n_lev = 75
+
+sectors = ['eais','wedd','amun','ross','apen']
+regions = ['R1','R4','R3','R2','R5'] # response function regions of the sectors (see FreshWaterForcing.LRF_sector)
+
+def grid_coordinates(grid):
+    '''
+    Latitude and longitude [0, 360) of the grid cells, slightly distorted as in the tripolar grid
+    '''
+    ny, nx, lat_min = grids[grid]
+    j = np.arange(ny)[:,None]
+    i = np.arange(nx)[None,:]
+    lat = lat_min + (90.-lat_min)*j/(ny-1) + 0*i
+    lon = (360.*i/nx + 0.3*j/ny) % 360
+    return lat, lon
+
+def level_bounds():
+    '''
+    Depth bounds of 75 layers, thickness increasing from 1 m at the surface to about 200 m at depth
+    '''
+    thickness = 1. + 200.*(np.arange(n_lev)/(n_lev-1))**2
+    edges = np.concatenate([[0.], np.cumsum(thickness)])
+    return np.stack([edges[:-1], edges[1:]], axis=1)
+
+def land_mask(lat, lon):
+    '''
+    Land cells: Antarctic continent with an irregular coast line and the Ross and Weddell embayments
+    (ice shelf fronts near 78S), and some land elsewhere
+    '''
+    coast = -72. + 1.5*np.sin(np.deg2rad(3*lon)) + 0.5*np.cos(np.deg2rad(7*lon))
+    coast = np.where(((lon > 160) & (lon < 200)) | ((lon > 300) & (lon < 330)), -77.5, coast)
+    return (lat < coast) | ((lat > 0) & (np.sin(np.deg2rad(2*lon)) > 0.6))
+
+def write_area(file_area, lat, lon):
+    '''
+    Write areacello file (CMOR names: dimensions j, i and coordinates latitude, longitude)
+    '''
+    ny, nx = lat.shape
+    area = 1.e10*np.cos(np.deg2rad(lat))*(360./nx)**2
+    area[land_mask(lat, lon)] = np.nan
+    with netCDF4.Dataset(file_area, 'w') as nc:
+        nc.createDimension('j', ny)
+        nc.createDimension('i', nx)
+        for name, values in [('latitude', lat), ('longitude', lon)]:
+            nc.createVariable(name, 'f8', ('j','i'))[:] = values
+        nc_area = nc.createVariable('areacello', 'f8', ('j','i'), fill_value=1.e20)
+        nc_area.coordinates = 'latitude longitude'
+        nc_area[:] = np.ma.masked_invalid(area)
+
+def write_masks(path_input, lat, lon):
+    '''
+    Write basal melt and calving masks: ocean cells along the Antarctic coast
+    '''
+    ny, nx = lat.shape
+    land = land_mask(lat, lon)
+    # Ocean cells within about 1 degree from land, south of 60S
+    dlat = 180./ny
+    coastal = (~land) & (lat < -60.) & np.roll(land, 1, axis=0) | (~land) & (lat < -60.) & np.roll(land, max(1, int(1./dlat)), axis=0)
+    for name, offset in [('basal_melt_mask', 0), ('calving_mask', 1)]:
+        mask = np.where(coastal & ((np.arange(nx)[None,:] + offset) % 2 == 0), 1., 0.)
+        with netCDF4.Dataset(f'{path_input}/{name}_ORCA1_ocean.nc', 'w') as nc:
+            nc.createDimension('j', ny)
+            nc.createDimension('i', nx)
+            nc.createVariable(name, 'f8', ('j','i'))[:] = mask
+
+def write_baseline(file_baseline):
+    '''
+    Write piControl baseline of the sector mean ocean temperatures
+    '''
+    with open(file_baseline, 'w') as f:
+        f.write(','.join(['year'] + sectors) + '\n')
+        f.write(','.join(['1850'] + [f'{-1.0+0.3*k:.2f}' for k in range(len(sectors))]) + '\n')
+
+def write_response_functions(path_lrfs, ism, bm, length=200):
+    '''
+    Write linear response functions (one value per line per region), saturating with a 30 year time scale
+    '''
+    os.makedirs(f'{path_lrfs}/TotalFW', exist_ok=True)
+    for k, region in enumerate(regions):
+        with open(f'{path_lrfs}/TotalFW/RF_{ism}_BM{bm}_{region}.dat', 'w') as f:
+            for lag in range(length):
+                f.write(f'{(1.+0.1*k)*(1.-np.exp(-lag/30.)):.8f}\n')
+
+def write_thetao(file_thetao, year, lat, lon, lev_bnds, lat_max=-60., depth_max=1000., seed=0):
+    '''
+    Write NEMO monthly mean output file (*_opa_grid_T_3D.nc) with thetao, olevel_bounds, nav_lat and nav_lon
+
+    Args:
+        file_thetao: path of output file
+        year: year of the monthly records
+        lat, lon: coordinates of the grid cells
+        lev_bnds: depth bounds of the layers
+        lat_max: only rows with cells south of lat_max are written
+        depth_max: only layers above depth_max are written
+        seed: seed of the random temperature variability
+    '''
+    rng = np.random.default_rng(seed + year)
+    ny, nx = lat.shape
+    land = land_mask(lat, lon)
+    rows = int(np.nonzero((lat < lat_max).any(axis=1))[0].max()) + 1
+    levs = int(np.searchsorted(lev_bnds[:,0], depth_max))
+
+    # Monthly records: time at the middle of the month, bounds at the start and end of the month
+    months = np.arange(f'{year}-01', f'{year+1}-02', dtype='datetime64[M]').astype('datetime64[s]')
+    seconds = (months - np.datetime64('1850-01-01T00:00:00')).astype(float)
+    time_bnds = np.stack([seconds[:-1], seconds[1:]], axis=1)
+
+    with netCDF4.Dataset(file_thetao, 'w') as nc:
+        nc.createDimension('time_counter', None)
+        nc.createDimension('olevel', n_lev)
+        nc.createDimension('y', ny)
+        nc.createDimension('x', nx)
+        nc.createDimension('axis_nbounds', 2)
+        nc.createVariable('nav_lat', 'f4', ('y','x'))[:] = lat
+        nc.createVariable('nav_lon', 'f4', ('y','x'))[:] = np.where(lon > 180., lon-360., lon)
+        nc_lev = nc.createVariable('olevel', 'f4', ('olevel',))
+        nc_lev.bounds = 'olevel_bounds'
+        nc_lev[:] = lev_bnds.mean(axis=1)
+        nc.createVariable('olevel_bounds', 'f4', ('olevel','axis_nbounds'))[:] = lev_bnds
+        nc_time = nc.createVariable('time_counter', 'f8', ('time_counter',))
+        nc_time.units = 'seconds since 1850-01-01 00:00:00'
+        nc_time.calendar = 'gregorian'
+        nc_time.bounds = 'time_counter_bounds'
+        nc_time[:] = time_bnds.mean(axis=1)
+        nc.createVariable('time_counter_bounds', 'f8', ('time_counter','axis_nbounds'))[:] = time_bnds
+
+        nc_thetao = nc.createVariable('thetao', 'f4', ('time_counter','olevel','y','x'), fill_value=1.e20,
+                                      chunksizes=(1, 1, min(ny, 256), nx))
+        nc_thetao.units = 'degC'
+        # Mean profile warming with depth and towards the north, annual cycle and noise
+        profile = -1.5 + 2.*np.tanh(lev_bnds[:levs].mean(axis=1)/500.)
+        northward = 0.05*(lat[:rows] - lat[0,0])
+        for t in range(12):
+            for k in range(levs):
+                field = (profile[k] + northward + 0.2*np.sin(2*np.pi*t/12) + 0.01*(year-1850)
+                         + 0.3*rng.standard_normal((rows, nx)))
+                nc_thetao[t, k, :rows, :] = np.ma.masked_where(land[:rows], field.astype('float32'))
+
+def generate_experiment(root, grid, n_years, year_min=1850, exp_name='bench', ism='IMAU_VUB', bm='08'):
+    '''
+    Generate all inputs of an experiment in the runtime directory layout
+
+    Args:
+        root: directory used as start_dir and run_dir
+        grid: NEMO configuration (ORCA1, ORCA025 or eORCA12)
+        n_years: number of years (legs) of NEMO output
+        year_min: first year of experiment
+        exp_name: experiment name
+        ism, bm: ice sheet model and basal melt forcing of the response functions
+
+    Returns:
+        List of NEMO output files
+    '''
+    path_input = f'{root}/fwf/interactive/input'
+    os.makedirs(path_input, exist_ok=True)
+    os.makedirs(f'{root}/fwf/interactive/forcing_files/{exp_name}', exist_ok=True)
+
+    lat, lon = grid_coordinates(grid)
+    lev_bnds = level_bounds()
+    write_area(f'{path_input}/areacello_Ofx_EC-Earth3_historical_r1i1p1f1_gn.nc', lat, lon)
+    write_masks(path_input, lat, lon)
+    write_baseline(f'{path_input}/OceanSectorThetao_piControl.csv')
+    write_response_functions(f'{root}/fwf/interactive/RFunctions', ism, bm)
+
+    files = []
+    for leg in range(1, n_years+1):
+        year = year_min + leg - 1
+        path_nemo = f'{root}/output/nemo/{str(leg).zfill(3)}'
+        os.makedirs(path_nemo, exist_ok=True)
+        files.append(f'{path_nemo}/{exp_name}_1m_{year}0101_{year}1231_opa_grid_T_3D.nc')
+        write_thetao(files[-1], year, lat, lon, lev_bnds)
+    return files
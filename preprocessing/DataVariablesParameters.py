@@ -1,7 +1,6 @@
 from pathlib import Path
 
 import numpy as np
-import xarray as xr
 
 ### Specify sectors and depths #####
 
@@ -13,71 +12,67 @@ def sel_mask(ds, sector):
         lat='latitude'
         lon='longitude'
         mask = mask_sector(ds,sector,lat,lon)
-    except:
+    except KeyError: # no latitude/longitude coordinates
         lat='lat'
         lon='lon'
         mask = mask_sector(ds,sector,lat,lon) 
     return mask
 
+## Lat/lon boxes of the oceanic sectors: (lat_min, lat_max, lon_min, lon_max) 
+## Bounds are exclusive, None means the box is open on that side. A sector is the 
+## union of its boxes; 'anta' is the union of all sectors.
+sector_boxes = {
+    'eais': [(-76, -65, None, 173), (-76, -65, 350, None)],
+    'wedd': [(None, -72, 295, 350)],
+    'amun': [(None, -70, 210, 295)],
+    'ross': [(None, -76, 150, 210)],
+    'apen': [(-70, -65, 294, 310), (-75, -70, 285, 295)],
+}
+
+def mask_box(ds,box,lat,lon):
+    '''
+    Select mask of a single lat/lon box
+    '''
+    lat_min, lat_max, lon_min, lon_max = box
+    import xarray as xr # imported here, so that the depth bounds can be used without loading xarray
+    mask = xr.ones_like(ds.coords[lat], dtype=bool)
+    if lat_min is not None:
+        mask = mask & (ds.coords[lat] > lat_min)
+    if lat_max is not None:
+        mask = mask & (ds.coords[lat] < lat_max)
+    if lon_min is not None:
+        mask = mask & (ds.coords[lon] > lon_min)
+    if lon_max is not None:
+        mask = mask & (ds.coords[lon] < lon_max)
+    return mask
+
 def mask_sector(ds,sector,lat,lon):
     '''
     Select mask of sector
     '''
-    mask_eais = (
-        (ds.coords[lat] > -76)
-        & (ds.coords[lat] < -65)
-        & (ds.coords[lon] < 173)
-    ) + (
-        (ds.coords[lat] > -76)
-        & (ds.coords[lat] < -65)
-        & (ds.coords[lon] > 350) 
-    )
-    
-    mask_wedd = (
-        (ds.coords[lat] < -72)
-        & (ds.coords[lon] > 295)
-        & (ds.coords[lon] < 350)
-    )
-    
-    mask_amun = (
-        (ds.coords[lat] < -70)
-        & (ds.coords[lon] > 210)
-        & (ds.coords[lon] < 295)
-    )
-    
-    mask_ross = (
-        (ds.coords[lat] < -76)
-        & (ds.coords[lon] > 150)
-        & (ds.coords[lon] < 210)
-    ) 
-    
-    mask_apen = (
-        (ds.coords[lat] > -70)
-        & (ds.coords[lat] < -65)
-        & (ds.coords[lon] > 294)
-        & (ds.coords[lon] < 310)
-    ) + (
-        (ds.coords[lat] > -75)
-        & (ds.coords[lat] < -70)
-        & (ds.coords[lon] > 285)
-        & (ds.coords[lon] < 295)
-    )
-    
-    if sector == "eais":
-        mask = mask_eais
-    elif sector == "wedd":
-        mask = mask_wedd
-    elif sector == "amun":
-        mask = mask_amun
-    elif sector == "ross":
-        mask = mask_ross 
-    elif sector == 'apen':
-        mask = mask_apen
-    elif sector == "anta":
-        mask = mask_eais + mask_wedd + mask_amun + mask_ross + mask_apen
-    else: print("Sector does not exist in 'sel_mask'")
+    if sector == "anta":
+        boxes = [box for name in sector_boxes for box in sector_boxes[name]]
+    elif sector in sector_boxes:
+        boxes = sector_boxes[sector]
+    else:
+        raise ValueError(f'Unknown sector {sector}, sectors: {list(sector_boxes)}')
+
+    mask = mask_box(ds,boxes[0],lat,lon)
+    for box in boxes[1:]:
+        mask = mask | mask_box(ds,box,lat,lon)
     return mask
 
+## Sector-specific depths (based on shelf base depth) [m] and thickness of the depth window around it
+## (other windows can be evaluated at once with DepthIntegral.window_mean)
+shelf_depths = {
+    'eais': 369,
+    'wedd': 420,
+    'amun': 305,
+    'ross': 312,
+    'apen': 420
+}
+window_thickness = 100
+
 def sel_depth_bnds(sector):
     '''
     Select oceanic layers based on shelf depth
@@ -86,17 +81,9 @@ def sel_depth_bnds(sector):
     
     # Sector-specific depths (based on shelf base depth)
     if type(sector) == str:
-        find_shelf_depth = {
-        'eais': 369,
-        'wedd': 420,
-        'amun': 305,
-        'ross': 312,
-        'apen': 420
-        }
-
-        shelf_depth = find_shelf_depth[sector]
+        shelf_depth = shelf_depths[sector]
         # Take slice of 100m thickness centered around shelf_depth
-        ocean_slice = np.array([shelf_depth-50,shelf_depth+50])
+        ocean_slice = np.array([shelf_depth-window_thickness//2,shelf_depth+window_thickness//2])
     
     # If number is specified, depth is the same for each sector
     if type(sector) == int:
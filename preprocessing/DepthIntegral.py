@@ -0,0 +1,125 @@
+import numpy as np
+
+###############################################################################
+# Depth window engine: the cumulative thickness weighted integral of a profile
+# (e.g. the area weighted mean per layer of a sector) over depth is computed
+# once; the mean over any depth window [top, bottom], including partial layers,
+# then follows from two interpolated lookups. Windows are given as arrays, so a
+# sensitivity study over shelf depth and window thickness evaluates all windows
+# at once from the same profiles. Missing values (layers below the sea floor)
+# are left out, as in a weighted mean of the layers.
+###############################################################################
+
+def layer_edges(lev_bnds):
+    '''
+    Depth of the layer interfaces from the level bounds (contiguous layers)
+    '''
+    lev_bnds = np.asarray(lev_bnds, dtype='float64')
+    return np.concatenate([lev_bnds[:1,0], lev_bnds[:,1]])
+
+def depth_integral(profile, lev_bnds):
+    '''
+    Cumulative thickness weighted integral of profiles over depth, at the layer interfaces
+
+    Args:
+        profile: array with values per layer, layers along the last axis (e.g. sector, lev)
+        lev_bnds: level bounds of the layers (lev, 2)
+
+    Returns:
+        Dictionary with the layer interfaces, the cumulative integral of the values and the
+        cumulative thickness of the layers with valid values (..., lev+1)
+    '''
+    profile = np.asarray(profile, dtype='float64')
+    edges = layer_edges(lev_bnds)
+    valid = np.isfinite(profile)
+    thickness = np.where(valid, np.diff(edges), 0.)
+    zeros = np.zeros(profile.shape[:-1] + (1,))
+    return {'edges': edges,
+            'values': np.concatenate([zeros, np.cumsum(thickness*np.where(valid, profile, 0.), axis=-1)], axis=-1),
+            'thickness': np.concatenate([zeros, np.cumsum(thickness, axis=-1)], axis=-1)}
+
+def cumulative_at(integral, cumulative, depth, per_profile=False):
+    '''
+    Cumulative integral at arbitrary depths, linear within a layer (exact for constant values per layer)
+
+    Args:
+        integral: depth integral (see depth_integral)
+        cumulative: cumulative array of the integral ('values' or 'thickness')
+        depth: array with depths, clipped to the depth range of the layers
+        per_profile: if True, the leading axes of depth are the profile axes and each profile is
+                     only evaluated at its own depths
+
+    Returns:
+        Array with shape cumulative.shape[:-1] + depth.shape, or depth.shape if per_profile
+    '''
+    edges = integral['edges']
+    depth = np.clip(np.asarray(depth, dtype='float64'), edges[0], edges[-1])
+    lev = np.clip(np.searchsorted(edges, depth, side='right') - 1, 0, edges.size-2)
+    fraction = (depth - edges[lev])/(edges[lev+1] - edges[lev])
+    if per_profile:
+        # Depths per profile flattened along the layer axis, so that each profile is indexed with its own layers
+        levs = lev.reshape(cumulative.shape[:-1] + (-1,))
+        lower = np.take_along_axis(cumulative, levs, axis=-1).reshape(depth.shape)
+        upper = np.take_along_axis(cumulative, levs+1, axis=-1).reshape(depth.shape)
+        return lower + fraction*(upper - lower)
+    return cumulative[...,lev] + fraction*(cumulative[...,lev+1] - cumulative[...,lev])
+
+def window_mean(integral, depth_top, depth_bottom, per_profile=False):
+    '''
+    Thickness weighted mean of the profiles over depth windows
+
+    Args:
+        integral: depth integral (see depth_integral)
+        depth_top, depth_bottom: arrays (or scalars) with upper and lower depth of the windows, broadcast together
+        per_profile: if True, the windows differ per profile: their leading axes are the profile axes
+                     (e.g. sector, offset, thickness for profiles per sector)
+
+    Returns:
+        Array with the mean per profile and window: profile shape without layers + window shape, or the
+        window shape if per_profile (nan where a window has no valid layers)
+    '''
+    depth_top, depth_bottom = np.broadcast_arrays(depth_top, depth_bottom)
+    values = (cumulative_at(integral, integral['values'], depth_bottom, per_profile)
+              - cumulative_at(integral, integral['values'], depth_top, per_profile))
+    thickness = (cumulative_at(integral, integral['thickness'], depth_bottom, per_profile)
+                 - cumulative_at(integral, integral['thickness'], depth_top, per_profile))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(thickness > 0, values/np.where(thickness > 0, thickness, 1.), np.nan)
+
+def centred_windows(shelf_depths, thicknesses):
+    '''
+    Depth windows centred around shelf depths, for all combinations of shelf depth and window thickness
+
+    Args:
+        shelf_depths: array with shelf depths [m]
+        thicknesses: array with window thicknesses [m]
+
+    Returns:
+        Arrays with upper and lower depth of the windows (shelf depth, thickness)
+    '''
+    shelf_depths = np.asarray(shelf_depths, dtype='float64')[:,None]
+    thicknesses = np.asarray(thicknesses, dtype='float64')[None,:]
+    return shelf_depths - thicknesses/2, shelf_depths + thicknesses/2
+
+def sector_profiles(field, index, sectors):
+    '''
+    Area weighted mean per layer of each sector, missing values (land, below sea floor) left out
+
+    Args:
+        field: array with field (lev, j, i), rows consistent with the sector index
+        index: sector index (see SectorIndex.py)
+        sectors: list of ocean sector names
+
+    Returns:
+        Array with profiles (sector, lev)
+    '''
+    field = np.asarray(field)
+    profiles = np.full((len(sectors), field.shape[0]), np.nan)
+    for s, sector in enumerate(sectors):
+        cells = field[:, index[sector]['j'], index[sector]['i']]
+        valid = np.isfinite(cells)
+        weights = np.where(valid, index[sector]['weights'][None,:], 0.)
+        total_weights = weights.sum(axis=1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            profiles[s] = np.where(total_weights > 0, (weights*np.where(valid, cells, 0.)).sum(axis=1)/total_weights, np.nan)
+    return profiles
@@ -0,0 +1,268 @@
+# Distribution masks of the freshwater forcing: basal melt and calving masks (and any variants in mask_specs)
+# on the ORCA1 grid, derived from runoff_maps.nc of the EC-Earth runoff-mapper in one pass, plus the basal
+# melt depth (zshelf) files. Replaces the steps of create_distribution_masks.ipynb and create_zshelf_nc.ipynb.
+#
+# Usage: python DistributionMasks.py file_runoff file_area path_output [depths] [masks] [file_grid]
+#   file_runoff: runoff_maps.nc (regular lat-lon grid with drainage_basin_id, arrival_point_id, calving_point_id)
+#   file_area: areacello file of ORCA1 (ocean mask and grid of the output files)
+#   path_output: directory of the output files ({mask}_ORCA1_ocean.nc, zshelf_{depth}m.nc) and the cache
+#   depths: depths of the zshelf files [m], comma separated (default 200,700)
+#   masks: masks to build, comma separated (default: all masks in mask_specs)
+#   file_grid: ORCA1 grid file for the regridding (default: file_area)
+#
+# Intermediate results (masks on the runoff-mapper grid, remapping weights, regridded masks) are cached in {path_output}/cache,
+# keyed by the input files and settings: only the steps whose inputs changed are computed again.
+
+## Import modules
+import hashlib
+import json
+import os
+import sys
+
+import netCDF4
+import numpy as np
+
+import Remapping as RM
+
+## Distribution masks: variable of runoff_maps.nc, lowest id (Antarctic drainage basins have ids from 66),
+## long name; add variants (e.g. wider or narrower masks) here
+mask_specs = {'basal_melt_mask': {'variable': 'arrival_point_id', 'id_min': 66, 'long_name': 'basal melt mask'},
+              'calving_mask': {'variable': 'calving_point_id', 'id_min': 66, 'long_name': 'calving mask'}}
+## Masks the zshelf files are derived from
+zshelf_mask = 'basal_melt_mask'
+## Regridding of the masks from the runoff-mapper grid to ORCA1 (see Remapping.py): 'bilinear' (as cdo remapbil)
+## or 'conservative' (area weighted, conserves the integral of flux fields)
+regrid_method = 'bilinear'
+cache_version = 1
+
+def cache_key(files, settings):
+    '''
+    Key identifying input files (size and modification time) and settings of a step
+
+    Args:
+        files: list of paths of input files
+        settings: json serialisable settings of the step
+
+    Returns:
+        Hexadecimal key (16 characters), changes when one of the input files or the settings change
+    '''
+    definition = {'version': cache_version,
+                  'files': [[os.path.abspath(f), os.stat(f).st_size, os.stat(f).st_mtime_ns] for f in files],
+                  'settings': settings}
+    return hashlib.sha1(json.dumps(definition, sort_keys=True).encode()).hexdigest()[:16]
+
+def source_masks(file_runoff, specs):
+    '''
+    Masks on the runoff-mapper grid: 1 where the id is at least id_min, 0 elsewhere.
+    Every variable of runoff_maps.nc is read once for all masks that use it.
+
+    Args:
+        file_runoff: path of runoff_maps.nc
+        specs: dictionary with mask name and specification (see mask_specs)
+
+    Returns:
+        Dictionary with mask name and array (lat, lon), latitude and longitude
+    '''
+    with netCDF4.Dataset(file_runoff) as nc:
+        ids = {var: np.ma.filled(nc[var][:], -1) for var in {spec['variable'] for spec in specs.values()}}
+        lat, lon = np.asarray(nc['lat'][:]), np.asarray(nc['lon'][:])
+    return {name: (ids[spec['variable']] >= spec['id_min']).astype('float64') for name, spec in specs.items()}, lat, lon
+
+def write_source_masks(file, masks, lat, lon, specs):
+    '''
+    Write masks on the runoff-mapper grid to one file (input of the regridding)
+    '''
+    file_tmp = f'{file}.{os.getpid()}.tmp'
+    with netCDF4.Dataset(file_tmp, 'w') as nc:
+        nc.createDimension('time_counter', None)
+        nc.createDimension('lat', lat.size)
+        nc.createDimension('lon', lon.size)
+        nc.createVariable('time_counter', 'f8', ('time_counter',))[:] = [0.]
+        nc['time_counter'].units = 'days since 1850-01-01 00:00:00'
+        nc.createVariable('lat', 'f8', ('lat',))[:] = lat
+        nc['lat'].setncatts({'units': 'degrees_north', 'standard_name': 'latitude'})
+        nc.createVariable('lon', 'f8', ('lon',))[:] = lon
+        nc['lon'].setncatts({'units': 'degrees_east', 'standard_name': 'longitude'})
+        for name, values in masks.items():
+            nc.createVariable(name, 'f8', ('time_counter','lat','lon'))[0] = values
+            nc[name].setncatts({'long_name': specs[name]['long_name'], 'units': ''})
+    os.replace(file_tmp, file)
+
+def grid_coordinates(file_grid):
+    '''
+    Latitude and longitude of the cells of the ORCA1 grid file (latitude/longitude or nav_lat/nav_lon),
+    and the corners of the cells if present (vertices_latitude/vertices_longitude), otherwise None
+    '''
+    with netCDF4.Dataset(file_grid) as nc:
+        lat, lon = ('latitude', 'longitude') if 'latitude' in nc.variables else ('nav_lat', 'nav_lon')
+        corners = None
+        if 'vertices_latitude' in nc.variables and 'vertices_longitude' in nc.variables:
+            corners = (np.asarray(nc['vertices_latitude'][:]), np.asarray(nc['vertices_longitude'][:]))
+        return np.asarray(nc[lat][:]), np.asarray(nc[lon][:]), corners
+
+def regrid(file_in, file_out, file_grid, path_cache, method=regrid_method):
+    '''
+    Regrid all masks of a file to the ORCA1 grid at once (one sparse matrix product with cached weights,
+    see Remapping.py)
+
+    Args:
+        file_in: path of masks on the runoff-mapper grid
+        file_out: path of regridded masks
+        file_grid: path of file with the ORCA1 grid (latitude, longitude)
+        path_cache: directory of the remapping weights
+        method: 'bilinear' or 'conservative'
+    '''
+    with netCDF4.Dataset(file_in) as nc:
+        names = [var for var in nc.variables if nc[var].dimensions == ('time_counter','lat','lon')]
+        attrs = {name: {attr: nc[name].getncattr(attr) for attr in nc[name].ncattrs()} for name in names}
+        fields = np.stack([np.ma.filled(np.ma.asarray(nc[name][:]).astype('float64'), np.nan) for name in names])
+        src_lat, src_lon = np.asarray(nc['lat'][:]), np.asarray(nc['lon'][:])
+    if src_lat[0] > src_lat[-1]:
+        src_lat, fields = src_lat[::-1], fields[...,::-1,:]
+
+    lat, lon, corners = grid_coordinates(file_grid)
+    weights = RM.load_weights(method, src_lat, src_lon, lat, lon, path_cache, corners)
+    remapped = RM.remap(weights, fields)
+
+    file_tmp = f'{file_out}.{os.getpid()}.tmp'
+    with netCDF4.Dataset(file_tmp, 'w') as nc:
+        nc.createDimension('time_counter', None)
+        nc.createDimension('j', lat.shape[0])
+        nc.createDimension('i', lat.shape[1])
+        for name, values in zip(names, remapped):
+            nc.createVariable(name, 'f8', ('time_counter','j','i'))[:] = values
+            nc[name].setncatts(attrs[name])
+    os.replace(file_tmp, file_out)
+
+def read_mask(file, name):
+    '''
+    Read mask from a (regridded) file, averaged over time, missing values as nan
+    '''
+    with netCDF4.Dataset(file) as nc:
+        values = np.ma.filled(np.ma.asarray(nc[name][:]).astype('float64'), np.nan)
+    return values.reshape((-1,) + values.shape[-2:]).mean(axis=0)
+
+def ocean_mask(values, area):
+    '''
+    Mask on the ORCA1 ocean: 1 where the regridded mask is positive and the cell is ocean (area > 0),
+    0 elsewhere (cells on land or outside the regridded mask)
+    '''
+    with np.errstate(invalid='ignore'):
+        return ((values > 0) & (area > 0)).astype('float64')
+
+def write_field(file, name, values, file_area, attrs, time=False):
+    '''
+    Write field on the ORCA1 grid, with the dimensions and coordinates (latitude, longitude) of the areacello file
+
+    Args:
+        file: path of output file
+        name: name of variable
+        values: array with field (j, i)
+        file_area: path of areacello file
+        attrs: attributes of the variable
+        time: add a time_counter dimension (unlimited, one record)
+    '''
+    file_tmp = f'{file}.{os.getpid()}.tmp'
+    with netCDF4.Dataset(file_area) as nc_area, netCDF4.Dataset(file_tmp, 'w') as nc:
+        dims = nc_area['areacello'].dimensions
+        if time:
+            nc.createDimension('time_counter', None)
+        for dim in dims:
+            nc.createDimension(dim, nc_area.dimensions[dim].size)
+        coordinates = [var for var in ['latitude', 'longitude'] if var in nc_area.variables]
+        for var in coordinates:
+            nc.createVariable(var, nc_area[var].dtype, nc_area[var].dimensions)[:] = nc_area[var][:]
+            nc[var].setncatts({attr: nc_area[var].getncattr(attr) for attr in ['standard_name', 'long_name', 'units']
+                               if attr in nc_area[var].ncattrs()})
+        nc_var = nc.createVariable(name, 'f8', (('time_counter',) if time else ()) + dims)
+        nc_var.setncatts(attrs)
+        if coordinates:
+            nc_var.coordinates = ' '.join(coordinates)
+        nc_var[:] = values[None] if time else values
+    os.replace(file_tmp, file)
+
+def build_distribution_masks(file_runoff, file_area, path_output, depths=(200, 700), names=None, file_grid=None):
+    '''
+    Build the distribution masks on the ORCA1 ocean and the zshelf files, computing only the steps whose
+    inputs changed (cached in {path_output}/cache)
+
+    Args:
+        file_runoff: path of runoff_maps.nc
+        file_area: path of areacello file of ORCA1
+        path_output: directory of the output files
+        depths: depths of the zshelf files [m]
+        names: list of masks to build (default: all masks in mask_specs)
+        file_grid: path of ORCA1 grid file for the regridding (default: file_area)
+
+    Returns:
+        List of the output files that were written (unchanged outputs are not written again)
+    '''
+    specs = {name: mask_specs[name] for name in (names or mask_specs)}
+    file_grid = file_grid or file_area
+    path_cache = f'{path_output}/cache'
+    os.makedirs(path_cache, exist_ok=True)
+
+    ## Masks on the runoff-mapper grid, all masks in one file
+    key_source = cache_key([file_runoff], specs)
+    file_source = f'{path_cache}/masks_source_{key_source}.nc'
+    if not os.path.isfile(file_source):
+        print(f'Thresholding {", ".join(specs)} from {file_runoff}')
+        write_source_masks(file_source, *source_masks(file_runoff, specs), specs)
+
+    ## Regridded masks (one regridding for all masks)
+    key_regrid = cache_key([file_source, file_grid], {'method': regrid_method, 'weights': RM.weights_version})
+    file_regrid = f'{path_cache}/masks_ORCA1_{key_regrid}.nc'
+    if not os.path.isfile(file_regrid):
+        print(f'Regridding {file_source} to the grid of {file_grid} ({regrid_method})')
+        regrid(file_source, file_regrid, file_grid, path_cache)
+
+    ## Remove cache files of earlier inputs
+    for file in os.listdir(path_cache):
+        if file.startswith(('masks_source_', 'masks_ORCA1_')) and f'{path_cache}/{file}' not in [file_source, file_regrid]:
+            os.remove(f'{path_cache}/{file}')
+
+    ## Final masks on the ORCA1 ocean and zshelf files, written when their inputs changed
+    file_manifest = f'{path_cache}/outputs.json'
+    manifest = {}
+    if os.path.isfile(file_manifest):
+        with open(file_manifest) as f:
+            manifest = json.load(f)
+    key_output = cache_key([file_regrid, file_area], {})
+    outputs = {f'{path_output}/{name}_ORCA1_ocean.nc': (name, None) for name in specs}
+    if zshelf_mask in specs:
+        outputs.update({f'{path_output}/zshelf_{depth:g}m.nc': (zshelf_mask, depth) for depth in depths})
+
+    area = None
+    masks = {}
+    written = []
+    for file, (name, depth) in outputs.items():
+        if manifest.get(file) == key_output and os.path.isfile(file):
+            continue
+        if area is None:
+            with netCDF4.Dataset(file_area) as nc:
+                area = np.ma.filled(np.ma.asarray(nc['areacello'][:]).astype('float64'), np.nan)
+        if name not in masks:
+            masks[name] = ocean_mask(read_mask(file_regrid, name), area)
+        if depth is None:
+            write_field(file, name, masks[name], file_area, {'long_name': specs[name]['long_name'], 'units': ''})
+        else:
+            write_field(file, 'zshelf', np.where(masks[name] > 0, float(depth), 0.), file_area,
+                        {'long_name': 'basal melt depth', 'units': 'm'}, time=True)
+        manifest[file] = key_output
+        written.append(file)
+        print(f'Written {file}')
+
+    if written:
+        with open(file_manifest, 'w') as f:
+            json.dump(manifest, f, indent=1)
+    return written
+
+if __name__ == '__main__':
+    if len(sys.argv) < 4:
+        print('Usage: python DistributionMasks.py file_runoff file_area path_output [depths] [masks] [file_grid]')
+        sys.exit(1)
+    depths = [float(depth) for depth in sys.argv[4].split(',')] if len(sys.argv) > 4 else [200, 700]
+    names = sys.argv[5].split(',') if len(sys.argv) > 5 else None
+    file_grid = sys.argv[6] if len(sys.argv) > 6 else None
+    written = build_distribution_masks(sys.argv[1], sys.argv[2], sys.argv[3], depths, names, file_grid)
+    print(f'{len(written)} files written, other outputs up to date')
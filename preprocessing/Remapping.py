@@ -0,0 +1,286 @@
+import hashlib
+import os
+
+import numpy as np
+
+###############################################################################
+# Remapping from a regular lat-lon grid (e.g. runoff-mapper, 512x256) to a
+# curvilinear grid (ORCA1) without external tools. The interpolation weights
+# (bilinear, or first-order conservative for fluxes) are computed once and
+# cached as a sparse matrix (coordinate format, .npz) keyed on both grids;
+# remapping any number of fields is then one sparse matrix product.
+###############################################################################
+
+## Version of the computation of the weights, part of the key of the cached weights
+## (2: bilinear, destination points beyond the source latitudes are missing)
+weights_version = 2
+
+def grid_key(method, src_lat, src_lon, dst_lat, dst_lon, dst_corners=None):
+    '''
+    Key identifying the remapping method, the version of the weights and the coordinates of the
+    source and destination grids
+    '''
+    sha = hashlib.sha1(f'{method} {weights_version}'.encode())
+    for array in [src_lat, src_lon, dst_lat, dst_lon] + ([] if dst_corners is None else list(dst_corners)):
+        array = np.ascontiguousarray(array, dtype='float64')
+        sha.update(str(array.shape).encode())
+        sha.update(array.tobytes())
+    return sha.hexdigest()[:16]
+
+def periodic_lon(lon, lon_start):
+    '''
+    Longitudes shifted to the range [lon_start, lon_start+360)
+    '''
+    return (np.asarray(lon, dtype='float64') - lon_start) % 360. + lon_start
+
+def bilinear_weights(src_lat, src_lon, dst_lat, dst_lon):
+    '''
+    Bilinear interpolation weights from a regular lat-lon grid (periodic in longitude) to the points
+    of a destination grid. Destination points beyond the first or last source latitude (e.g. near the
+    poles of a Gaussian grid) have no weights, so that they are missing after remapping, as with cdo remapbil.
+
+    Args:
+        src_lat: array with latitudes of the source grid (lat), ascending
+        src_lon: array with longitudes of the source grid (lon), ascending, covering 360 degrees
+        dst_lat, dst_lon: arrays with latitude and longitude of the destination points (any shape)
+
+    Returns:
+        Dictionary with the weights in coordinate format (rows: destination points, cols: source points
+        (lat*n_lon + lon)) and the shapes of the source and destination grids
+    '''
+    src_lat, src_lon = np.asarray(src_lat, dtype='float64'), np.asarray(src_lon, dtype='float64')
+    lat, lon = np.asarray(dst_lat, dtype='float64').reshape(-1), periodic_lon(dst_lon, src_lon[0]).reshape(-1)
+    n_lat, n_lon = src_lat.size, src_lon.size
+
+    lon_edges = np.append(src_lon, src_lon[0] + 360.)
+    i0 = np.clip(np.searchsorted(lon_edges, lon, side='right') - 1, 0, n_lon-1)
+    fx = (lon - lon_edges[i0])/(lon_edges[i0+1] - lon_edges[i0])
+    j0 = np.clip(np.searchsorted(src_lat, lat, side='right') - 1, 0, n_lat-2)
+    fy = (lat - src_lat[j0])/(src_lat[j0+1] - src_lat[j0])
+    inside = (lat >= src_lat[0]) & (lat <= src_lat[-1])
+
+    i1 = (i0 + 1) % n_lon
+    rows = np.tile(np.arange(lat.size), 4)
+    cols = np.concatenate([j0*n_lon + i0, j0*n_lon + i1, (j0+1)*n_lon + i0, (j0+1)*n_lon + i1])
+    vals = np.concatenate([(1-fy)*(1-fx), (1-fy)*fx, fy*(1-fx), fy*fx])
+    # Zero weights are left out, so that missing values at those points do not propagate
+    keep = (vals > 0) & np.tile(inside, 4)
+    return {'rows': rows[keep], 'cols': cols[keep], 'vals': vals[keep],
+            'src_shape': np.array([n_lat, n_lon]), 'dst_shape': np.array(np.shape(dst_lat))}
+
+def lonlat_to_xyz(lat, lon):
+    '''
+    Unit vectors of points on the sphere
+    '''
+    lat, lon = np.radians(lat), np.radians(lon)
+    return np.stack([np.cos(lat)*np.cos(lon), np.cos(lat)*np.sin(lon), np.sin(lat)], axis=-1)
+
+def cell_corners(lat, lon):
+    '''
+    Corners of the cells of a curvilinear grid estimated from the cell centres: mean of the 4 surrounding
+    centres on the sphere (centres extrapolated linearly beyond the edges of the grid)
+
+    Args:
+        lat, lon: arrays with latitude and longitude of the cell centres (j, i)
+
+    Returns:
+        Arrays with latitude and longitude of the 4 corners of each cell (j, i, 4), counterclockwise
+    '''
+    xyz = lonlat_to_xyz(lat, lon)
+    xyz = np.concatenate([2*xyz[:1] - xyz[1:2], xyz, 2*xyz[-1:] - xyz[-2:-1]], axis=0)
+    xyz = np.concatenate([2*xyz[:,:1] - xyz[:,1:2], xyz, 2*xyz[:,-1:] - xyz[:,-2:-1]], axis=1)
+    corners = (xyz[:-1,:-1] + xyz[1:,:-1] + xyz[:-1,1:] + xyz[1:,1:])/4 # corner between (j,i) and (j+1,i+1) of the padded grid
+    corners = np.stack([corners[:-1,:-1], corners[:-1,1:], corners[1:,1:], corners[1:,:-1]], axis=2)
+    corners /= np.linalg.norm(corners, axis=-1, keepdims=True)
+    return np.degrees(np.arcsin(np.clip(corners[...,2], -1., 1.))), np.degrees(np.arctan2(corners[...,1], corners[...,0]))
+
+def clip_polygons(x, y, n, bound, axis, upper):
+    '''
+    Clip polygons against a half-plane (Sutherland-Hodgman), vectorised over the polygons
+
+    Args:
+        x, y: arrays with vertices of the polygons (polygon, vertex), valid vertices first, with room for one more vertex
+        n: array with number of valid vertices per polygon
+        bound: array with position of the clipping line per polygon
+        axis: 0 to clip in x, 1 to clip in y
+        upper: keep the part below the bound (True) or above it (False)
+
+    Returns:
+        Clipped vertices (same shape as the input, unused vertices zero) and number of vertices
+        (at most one more than the input)
+    '''
+    m = x.shape[1]
+    k = np.arange(m)[None,:]
+    k_next = np.where(k + 1 < n[:,None], k + 1, 0)
+    x_next, y_next = np.take_along_axis(x, k_next, 1), np.take_along_axis(y, k_next, 1)
+    coord, coord_next = (x, x_next) if axis == 0 else (y, y_next)
+    sign = -1. if upper else 1.
+    inside = sign*(coord - bound[:,None]) >= 0
+    inside_next = sign*(coord_next - bound[:,None]) >= 0
+    valid = k < n[:,None]
+
+    # Crossings of edges parallel to the line are never used
+    with np.errstate(invalid='ignore', divide='ignore'):
+        t = (bound[:,None] - coord)/(coord_next - coord)
+        x_cross, y_cross = x + t*(x_next - x), y + t*(y_next - y)
+    if axis == 0:
+        x_cross = np.broadcast_to(bound[:,None], x.shape)
+    else:
+        y_cross = np.broadcast_to(bound[:,None], y.shape)
+
+    # Every edge gives its start vertex (if inside) and the crossing (if the edge crosses the line)
+    x_out = np.stack([x, x_cross], axis=2).reshape(len(x), 2*m)
+    y_out = np.stack([y, y_cross], axis=2).reshape(len(x), 2*m)
+    keep = np.stack([valid & inside, valid & (inside != inside_next)], axis=2).reshape(len(x), 2*m)
+    order = np.argsort(~keep, axis=1, kind='stable')[:,:m]
+    n_out = keep.sum(axis=1)
+    # Unused vertices set to zero, crossings of edges that do not cross the line may be nan or inf
+    used = k < n_out[:,None]
+    return (np.where(used, np.take_along_axis(x_out, order, 1), 0.),
+            np.where(used, np.take_along_axis(y_out, order, 1), 0.), n_out)
+
+def polygon_area(x, y, n):
+    '''
+    Area of polygons (shoelace formula), vertices as in clip_polygons
+    '''
+    k = np.arange(x.shape[1])[None,:]
+    k_next = np.where(k + 1 < n[:,None], k + 1, 0)
+    cross = x*np.take_along_axis(y, k_next, 1) - np.take_along_axis(x, k_next, 1)*y
+    return np.abs(0.5*np.where(k < n[:,None], cross, 0.).sum(axis=1))
+
+def conservative_weights(src_lat, src_lon, dst_corner_lat, dst_corner_lon, chunk=200000):
+    '''
+    First-order conservative remapping weights from a regular lat-lon grid to the cells of a destination grid:
+    overlap area of the source and destination cells divided by the covered area of the destination cell.
+    Areas are computed in the (longitude, sin(latitude)) plane, in which the area of a lat-lon cell is exact;
+    the edges of the destination cells are straight lines in this plane.
+
+    Args:
+        src_lat: array with latitudes of the source grid (lat), ascending
+        src_lon: array with longitudes of the source grid (lon), ascending, covering 360 degrees
+        dst_corner_lat, dst_corner_lon: arrays with corners of the destination cells (..., 4)
+        chunk: number of candidate (destination, source) cell pairs clipped at once
+
+    Returns:
+        Dictionary with the weights in coordinate format (see bilinear_weights)
+    '''
+    src_lat, src_lon = np.asarray(src_lat, dtype='float64'), np.asarray(src_lon, dtype='float64')
+    n_lat, n_lon = src_lat.size, src_lon.size
+    dst_shape = np.shape(dst_corner_lat)[:-1]
+
+    ## Source cell edges: halfway between the centres (poles at the first and last latitude)
+    lat_edges = np.concatenate([[-90.], (src_lat[1:] + src_lat[:-1])/2, [90.]])
+    y_edges = np.sin(np.radians(lat_edges))
+    lon_ext = np.concatenate([src_lon[-1:] - 360., src_lon, src_lon[:1] + 360.])
+    x_edges = (lon_ext[1:] + lon_ext[:-1])/2 # n_lon+1 edges, x_edges[-1] = x_edges[0] + 360
+
+    ## Destination polygons: longitudes unwrapped around the first corner, shifted to start after x_edges[0]
+    x = np.asarray(dst_corner_lon, dtype='float64').reshape(-1, 4)
+    x = x[:,:1] + (x - x[:,:1] + 180.) % 360. - 180.
+    x += periodic_lon(x.min(axis=1), x_edges[0])[:,None] - x.min(axis=1)[:,None]
+    y = np.sin(np.radians(np.asarray(dst_corner_lat, dtype='float64').reshape(-1, 4)))
+
+    ## Candidate source cells: all cells overlapping the bounding box of a destination cell
+    # Longitude indices continue beyond n_lon for cells crossing x_edges[-1] (cell i is cell i % n_lon, shifted by 360)
+    width = x_edges[-1] - x_edges[0]
+    i_first = np.searchsorted(x_edges, x.min(axis=1), side='right') - 1
+    turns = np.floor((x.max(axis=1) - x_edges[0])/width)
+    i_last = (turns*n_lon).astype(int) + np.searchsorted(x_edges, x.max(axis=1) - turns*width, side='left') - 1
+    j_first = np.clip(np.searchsorted(y_edges, y.min(axis=1), side='right') - 1, 0, n_lat-1)
+    j_last = np.clip(np.searchsorted(y_edges, y.max(axis=1), side='left') - 1, 0, n_lat-1)
+    n_i, n_j = i_last - i_first + 1, j_last - j_first + 1
+    counts = n_i*n_j
+
+    rows, cols, vals = [], [], []
+    dst_all = np.repeat(np.arange(len(x)), counts)
+    offset = np.arange(dst_all.size) - np.repeat(np.cumsum(counts) - counts, counts)
+    for start in range(0, dst_all.size, chunk):
+        dst = dst_all[start:start+chunk]
+        i = i_first[dst] + offset[start:start+chunk] % n_i[dst]
+        j = j_first[dst] + offset[start:start+chunk] // n_i[dst]
+        x0 = x_edges[i % n_lon] + width*(i // n_lon)
+        x1 = x0 + (x_edges[i % n_lon + 1] - x_edges[i % n_lon])
+
+        ## Clip the destination polygon with the source cell (4 clips add at most 4 vertices to the quadrilateral)
+        px = np.zeros((dst.size, 8))
+        py = np.zeros((dst.size, 8))
+        px[:,:4], py[:,:4] = x[dst], y[dst]
+        n = np.full(dst.size, 4)
+        for bound, axis, upper in [(x0, 0, False), (x1, 0, True), (y_edges[j], 1, False), (y_edges[j+1], 1, True)]:
+            px, py, n = clip_polygons(px, py, n, bound, axis, upper)
+        area = polygon_area(px, py, n)
+        keep = (n >= 3) & (area > 0)
+        rows.append(dst[keep])
+        cols.append(j[keep]*n_lon + i[keep] % n_lon)
+        vals.append(area[keep])
+
+    rows, cols, vals = np.concatenate(rows), np.concatenate(cols), np.concatenate(vals)
+    # Normalise by the covered area of each destination cell
+    vals /= np.bincount(rows, weights=vals, minlength=len(x))[rows]
+    return {'rows': rows, 'cols': cols, 'vals': vals,
+            'src_shape': np.array([n_lat, n_lon]), 'dst_shape': np.array(dst_shape)}
+
+def load_weights(method, src_lat, src_lon, dst_lat, dst_lon, path_cache, dst_corners=None):
+    '''
+    Load remapping weights from the cache, computed when the method or one of the grids changed
+
+    Args:
+        method: 'bilinear' or 'conservative'
+        src_lat, src_lon: arrays with latitudes and longitudes of the regular source grid
+        dst_lat, dst_lon: arrays with latitude and longitude of the destination cells (j, i)
+        path_cache: directory of the weight files
+        dst_corners: latitude and longitude of the corners of the destination cells (j, i, 4), optional
+                     for conservative remapping (default: estimated from the cell centres, see cell_corners)
+
+    Returns:
+        Dictionary with the weights (see bilinear_weights)
+    '''
+    if method not in ['bilinear', 'conservative']:
+        raise ValueError(f"Unknown remapping method {method}, use 'bilinear' or 'conservative'")
+    if method == 'conservative' and dst_corners is None:
+        dst_corners = cell_corners(dst_lat, dst_lon)
+    key = grid_key(method, src_lat, src_lon, dst_lat, dst_lon, dst_corners if method == 'conservative' else None)
+    file_weights = f'{path_cache}/RemapWeights_{method}_{key}.npz'
+    if os.path.isfile(file_weights):
+        with np.load(file_weights) as f:
+            return {var: f[var] for var in f.files}
+
+    print(f'Computing {method} remapping weights: {file_weights}')
+    if method == 'bilinear':
+        weights = bilinear_weights(src_lat, src_lon, dst_lat, dst_lon)
+    else:
+        weights = conservative_weights(src_lat, src_lon, *dst_corners)
+
+    # Sorted by destination point, so that remap sums contiguous entries
+    order = np.argsort(weights['rows'], kind='stable')
+    weights.update({var: weights[var][order] for var in ['rows', 'cols', 'vals']})
+    os.makedirs(path_cache, exist_ok=True)
+    file_tmp = f'{file_weights}.{os.getpid()}.tmp'
+    with open(file_tmp, 'wb') as f:
+        np.savez(f, **weights)
+    os.replace(file_tmp, file_weights)
+    return weights
+
+def remap(weights, fields):
+    '''
+    Remap fields with a sparse matrix product. Destination points with a missing source value
+    among their (non-zero weight) source points, or without source points, are missing (nan).
+
+    Args:
+        weights: remapping weights (see load_weights)
+        fields: array with fields on the source grid (..., lat, lon)
+
+    Returns:
+        Array with fields on the destination grid (..., j, i)
+    '''
+    fields = np.asarray(fields, dtype='float64')
+    lead = fields.shape[:-2]
+    fields = fields.reshape((-1, int(np.prod(weights['src_shape']))))
+    n_dst = int(np.prod(weights['dst_shape']))
+
+    rows_used, starts = np.unique(weights['rows'], return_index=True)
+    remapped = np.full((fields.shape[0], n_dst), np.nan)
+    if rows_used.size:
+        products = fields[:, weights['cols']]*weights['vals'][None,:]
+        remapped[:, rows_used] = np.add.reduceat(products, starts, axis=1)
+    return remapped.reshape(lead + tuple(weights['dst_shape']))
@@ -22,49 +22,56 @@ def basal_melt_sensitivity(gamma):
 
     return ms
 
-def quadratic_basal_melt(thetao, gamma):
+def quadratic_basal_melt(thetao, gamma, T_f=T_f):
     '''
     Compute basal melt based on quadratic parameterization with 
     chosen gamma, ocean temperatures and freezing point temperatures
     
     Args:
         thetao: ocean temperatures
-        gamma: calibration parameter
+        gamma: calibration parameter (array or single value)
+        T_f: freezing point temperature (array or single value, default from constants)
 
     Returns:   
         Basal melt
     '''
     melt_sensitivity = basal_melt_sensitivity(gamma)
-    print(f'Using basal melt sensitivity: {melt_sensitivity} m yr-1 K-2')
+    if np.ndim(melt_sensitivity) == 0:
+        print(f'Using basal melt sensitivity: {melt_sensitivity} m yr-1 K-2')
 
     # Compute basal melt timeseries
     BasalMelt = (thetao - T_f) * (abs(thetao - T_f)) * melt_sensitivity  
 
     return BasalMelt
 
-def basal_melt_anomalies(thetao_ref,thetao, gamma):
+def basal_melt_anomalies(thetao_ref,thetao, gamma, T_f=T_f):
     ''' 
     Compute basal melt anomalies for ocean temperature thetao compared to baseline period
     
     Args:
         thetao_ref: ocean temperature used as baseline for anomaly computation
-        thetao: ocean temperature
-        gamma: calibration parameter
+        thetao: ocean temperature (series per sector or array)
+        gamma: calibration parameter (array or single value)
+        T_f: freezing point temperature (array or single value, default from constants)
 
     
     Returns:
-        Basal melt anomalies compared to baseline period
+        Basal melt anomalies compared to baseline period 
+        (dataframe with one row if thetao is a series, otherwise array)
     '''
 
     # Quadratic melt baseline (negative if To < Tf)
-    BasalMelt_base = quadratic_basal_melt(thetao_ref, gamma)
+    BasalMelt_base = quadratic_basal_melt(thetao_ref, gamma, T_f)
 
     # Compute basal melt for thetao
-    BasalMelt = quadratic_basal_melt(thetao, gamma)
+    BasalMelt = quadratic_basal_melt(thetao, gamma, T_f)
     
     # Compute basal melt anomalies
     deltaBasalMelt = BasalMelt - BasalMelt_base
     
+    if not isinstance(deltaBasalMelt, pd.Series):
+        return deltaBasalMelt
+
     # Convert to dataframe
     df_deltaBasalMelt = deltaBasalMelt.to_frame().transpose()
 
@@ -0,0 +1,347 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+import SectorIndex as SI
+import NemoOutput as NO
+import SectorOperator as SO
+import BasalMelt as BM
+import FreshWaterForcing as FWF
+import CouplerState as CS
+import ForcingTemplate as FT
+import Instrumentation as IN
+import SouthernOceanArchive as SOA
+from config import gamma, ism, bm, shadow_lrfs, running_mean_period, running_mean_periods_monitor, FWF_total_yearmin, forcing_layout, memory_budget, southern_ocean_archive, monitoring_interval
+from constants import spy, kg_per_Gt
+
+###############################################################################
+# Coupling step of the interactive freshwater forcing, split in the work that
+# only depends on static inputs (done once per process) and the work that
+# depends on the NEMO output of the new year. Used by ThetaoDrivenFreshwaterForcing.py
+# (one process per leg) and CouplerDaemon.py (one process for the whole experiment).
+###############################################################################
+
+## Sector names, consistent with linear response functions
+sectors = ['eais','wedd','amun','ross','apen']
+
+def coupler_files(year_min, year_max, exp_name, start_dir, run_dir):
+    '''
+    Paths of the input and output files of an interactive freshwater forcing experiment
+
+    Args:
+        year_min: first year of experiment
+        year_max: last year of experiment
+        exp_name: experiment name
+        start_dir: runtime directory (containing fwf/interactive)
+        run_dir: run directory of EC-Earth (containing output/nemo)
+
+    Returns:
+        Dictionary with paths and experiment settings
+    '''
+    path_input = f'{start_dir}/fwf/interactive/input/'
+    path_output = f'{start_dir}/fwf/interactive/forcing_files/{exp_name}/'
+    # Note 1: EC-Earth reads the forcing files from path_output, should be consistent with path in ece-esm.sh.tmpl
+    # Note 2: This path needs to be created before running and should include the first year of the forcing file
+    return {'year_min': year_min,
+            'year_max': year_max,
+            'exp_name': exp_name,
+            'run_dir': run_dir,
+            'path_output': path_output,
+            'path_lrfs': f'{start_dir}/fwf/interactive/RFunctions/',
+            'file_area': f'{path_input}/areacello_Ofx_EC-Earth3_historical_r1i1p1f1_gn.nc',
+            'file_sector_index': f'{path_input}/SectorIndex_ORCA1.npz', # cached, rebuilt when area file or sectors change
+            'file_baseline_thetao': f'{path_input}/OceanSectorThetao_piControl.csv',
+            'file_basal_melt_mask': f'{path_input}/basal_melt_mask_ORCA1_ocean.nc',
+            'file_calving_mask': f'{path_input}/calving_mask_ORCA1_ocean.nc',
+            'file_forcing_template': f'{path_output}/FWF_LRF_template.nc', # zero fluxes, filled in every year
+            'file_archive': f'{path_output}/SouthernOcean_{exp_name}.nc', # annual mean thetao south of lat_max (optional)
+            # Coupler state store: sector temperatures, basal melt and freshwater forcing for all years of the experiment
+            # (the monitoring csv files are exported from it at the end of the experiment or with ExportMonitoring.py)
+            'path_state': f'{path_output}/CouplerState_{exp_name}_{year_min}_{year_max}'}
+
+def thetao_file(files, year, leg):
+    '''
+    Path of NEMO output file of a year (input for the freshwater forcing)
+    '''
+    leg_number = str(leg).zfill(3) # add leading zeros
+    run_dir, exp_name = files['run_dir'], files['exp_name']
+    #return f'{run_dir}/output/nemo/{leg_number}/{exp_name}_1m_{year}0101_{year}1231_grid_T.nc'
+    return f'{run_dir}/output/nemo/{leg_number}/{exp_name}_1m_{year}0101_{year}1231_opa_grid_T_3D.nc' #other output format
+
+def forcing_file(files, year):
+    '''
+    Path of forcing file for EC-Earth (freshwater forcing computed from year yyyy is applied in year yyyy+1)
+    '''
+    return f"{files['path_output']}/FWF_LRF_y{year+1}.nc"
+
+def load_static(files):
+    '''
+    Load all inputs that do not change during the experiment
+
+    Args:
+        files: paths of experiment (see coupler_files)
+
+    Returns:
+        Dictionary with sector index, baseline thetao, response functions and forcing template
+    '''
+    static = {}
+
+    ## Load sector index (cells and area weights per sector)
+    static['sector_index'] = SI.load_sector_index(files['file_area'], files['file_sector_index'], sectors)
+
+    ## Read baseline thetao
+    static['df_thetao_baseline'] = pd.read_csv(files['file_baseline_thetao'],index_col=0)
+
+    ## Running mean periods: first period is used for the forcing, others for monitoring only
+    static['running_mean_periods'] = [running_mean_period] + [p for p in running_mean_periods_monitor if p != running_mean_period]
+
+    ## Read linear response functions (sector, lag)
+    static['RF'] = FWF.load_response_functions(files['path_lrfs'], ism, bm, sectors)
+    static['RF_shadow'] = {}
+
+    ## Load forcing template (distribution masks in sparse form, mask areas, zero-filled forcing file)
+    # Note: built once per experiment, rebuilt when the mask or area files change
+    static['forcing_template'] = FT.load_forcing_template({'sorunoff_f': files['file_basal_melt_mask'],
+                                                           'socalving_f': files['file_calving_mask']},
+                                                          files['file_area'], files['file_forcing_template'], forcing_layout)
+
+    # Volume operator, built from the first thetao file (level bounds do not change)
+    static['volume_operator'] = None
+    return static
+
+def open_coupler_state(files, static, year):
+    '''
+    Open coupler state store, created for the first year of the experiment. When it is missing for a later year
+    (experiment started with the csv files), it is created from the sector mean temperatures of the earlier years
+    (see seed_coupler_state).
+    '''
+    path_state = files['path_state']
+    if year==files['year_min']:
+        state = create_coupler_state(files, static)
+    elif not os.path.isdir(path_state):
+        print(f"##### Coupler state {path_state} is missing: creating it from the monitoring files of years {files['year_min']}-{year-1}")
+        state = seed_coupler_state(files, static, year)
+    else:
+        state = CS.open_state(path_state)
+    return state
+
+def create_coupler_state(files, static):
+    '''
+    Create state store and running mean buffer (filled with baseline values) for the first year
+    '''
+    state = CS.create_state(files['path_state'], files['year_min'], files['year_max'], sectors, static['running_mean_periods'], shadow_lrfs)
+    CS.init_running_mean(state, static['df_thetao_baseline'][sectors].mean().values)
+    return state
+
+def seed_coupler_state(files, static, year):
+    '''
+    Create coupler state store with the years before year from the sector mean temperatures in
+    OceanSectorThetao_{exp}_{year_min}_{year_max}.csv (written by the csv version of the coupler, or exported from
+    a coupler state). The running means, basal melt and forcing anomalies are computed again from the temperatures,
+    so rows that resubmitted legs appended twice to the csv files are counted once.
+
+    Args:
+        files: paths of experiment (see coupler_files)
+        static: static inputs (see load_static)
+        year: first year that is not filled in
+
+    Returns:
+        Coupler state store
+    '''
+    year_min = files['year_min']
+    thetao = CS.read_thetao_history(files['path_state'], files['path_output'], files['exp_name'], year_min, files['year_max'], year, sectors)
+
+    state = create_coupler_state(files, static)
+    for t, y in enumerate(range(year_min, year)):
+        store_year(files, static, state, y, thetao[t])
+    return state
+
+def shadow_response_functions(files, static, state):
+    '''
+    Response functions of the additional (ism, bm) sets of the state store (loaded once)
+    '''
+    key = tuple(tuple(lrf) for lrf in state['meta']['shadow_lrfs'])
+    if key not in static['RF_shadow']:
+        static['RF_shadow'][key] = np.stack([FWF.load_response_functions(files['path_lrfs'], ism_shadow, bm_shadow, sectors)
+                                             for ism_shadow, bm_shadow in key])
+    return static['RF_shadow'][key]
+
+def rewind_coupler_state(files, static, state, year):
+    '''
+    Rewind coupler state to the end of a year: the contributions of the later years to the cumulative forcing
+    anomalies are subtracted and their rows removed, in time proportional to the number of years removed
+
+    Args:
+        files: paths of experiment (see coupler_files)
+        static: static inputs (see load_static, only the response functions are used)
+        state: coupler state store (see open_coupler_state)
+        year: last year to keep (year_min-1 to remove all years)
+
+    Returns:
+        List of removed years
+    '''
+    n = year + 1 - files['year_min']
+    removed = list(range(CS.next_step(state)-1, n-1, -1))
+    for t in removed:
+        if np.isnan(state['dBM'][t]).all():
+            continue # temperatures only (prescribed forcing, or stopped before the basal melt)
+        FWF.remove_flux_anomaly(t, state['future_fwf'], state['dBM'][t], static['RF'])
+        if 'future_fwf_shadow' in state:
+            FWF.remove_flux_anomaly(t, state['future_fwf_shadow'], state['dBM'][t], shadow_response_functions(files, static, state))
+    CS.rewind_state(state, n)
+    return [files['year_min'] + t for t in removed]
+
+def couple_year(files, static, state, year, file_thetao, log=None):
+    '''
+    Compute freshwater forcing from the NEMO output of one year and write the forcing file of the next year
+
+    Args:
+        files: paths of experiment (see coupler_files)
+        static: static inputs (see load_static)
+        state: coupler state store (see open_coupler_state)
+        year: year of NEMO output
+        file_thetao: path of NEMO output file
+        log: stage log of the year (see Instrumentation.py), None: not instrumented
+
+    Returns:
+        Total freshwater forcing [Gt/yr] for the next year
+    '''
+    year_min, year_max = files['year_min'], files['year_max']
+    t = year - year_min # time step (counting in years from the start of the experiment)
+
+    ## A year that was computed before (resubmitted leg, restart from an older restart) replaces the results
+    ## of this and later years; years are computed in order
+    if t < CS.next_step(state):
+        with IN.stage(log, 'rewind_state'):
+            removed = rewind_coupler_state(files, static, state, year-1)
+        print(f'##### Year {year} was computed before: removed years {removed[-1]}-{removed[0]} from the coupler state')
+    elif t > CS.next_step(state):
+        raise ValueError(f'Year {year_min + CS.next_step(state)} has not been computed yet, cannot compute year {year}')
+
+    ##################### Sector mean thetao computation ############################
+
+    if southern_ocean_archive is not None:
+        ## Annual mean of the Southern Ocean appended to the archive, volume weighted means from the same blocks
+        print(f"Computing volume weighted mean of thetao for all sectors and archiving to {files['file_archive']}")
+        with IN.stage(log, 'sector_mean_archive'):
+            thetao_volume_weighted_mean, static['volume_operator'] = SOA.archive_year(
+                files['file_archive'], file_thetao, year, static['sector_index'], sectors, memory_budget=memory_budget,
+                operator=static['volume_operator'], **southern_ocean_archive)
+        time = NO.read_time(file_thetao)
+    elif memory_budget is None:
+        ## Open thetao dataset, only the rows and layers covering the sectors (renamed consistent with areacello file)
+        with IN.stage(log, 'open_thetao'):
+            ds, sector_index_subset = NO.open_thetao_subset(file_thetao, static['sector_index'], sectors)
+
+        ## Compute month length weighted time mean value over annual file (one month at a time)
+        with IN.stage(log, 'annual_mean'):
+            ds_thetao_year = NO.annual_mean(ds, 'thetao')
+
+        ## Compute volume weighted mean temperature of all sectors in one pass
+        print('Computing volume weighted mean of thetao for all sectors')
+        with IN.stage(log, 'sector_mean'):
+            if static['volume_operator'] is None or static['volume_operator']['shape'] != ds_thetao_year.shape:
+                static['volume_operator'] = SO.build_volume_operator(sector_index_subset, ds['olevel_bounds'], sectors, ds_thetao_year.shape)
+            thetao_volume_weighted_mean = SO.apply_volume_operator(static['volume_operator'], ds_thetao_year)
+        time = ds.time_counter.values
+        ds.close()
+    else:
+        ## Same annual mean and volume weighted means, computed in blocks that fit in the memory budget
+        print(f'Computing volume weighted mean of thetao for all sectors (memory budget {memory_budget} MB)')
+        with IN.stage(log, 'sector_mean_blocked'):
+            thetao_volume_weighted_mean, static['volume_operator'] = NO.sector_means_blocked(
+                file_thetao, static['sector_index'], sectors, memory_budget, static['volume_operator'])
+        time = NO.read_time(file_thetao)
+
+    ## Store data of year in coupler state: running means, basal melt and freshwater forcing anomalies
+    FWF_total_Gt = store_year(files, static, state, year, [thetao_volume_weighted_mean[sector] for sector in sectors], log)
+
+    # Export monitoring files at the end of the experiment (and every monitoring_interval years when set)
+    if year==year_max or (monitoring_interval is not None and (t+1) % monitoring_interval == 0):
+        with IN.stage(log, 'export_csv'):
+            CS.export_csv(state, files['path_output'], files['exp_name'], running_mean_period)
+
+    ##################### Distribution over ocean grid ######################
+
+    forcing_template = static['forcing_template']
+    basal_melt_area = FT.mask_area(forcing_template, 'sorunoff_f')
+    calving_area = FT.mask_area(forcing_template, 'socalving_f')
+    print('Basal melt area: ', basal_melt_area, 'm^2')
+    print('Calving area: ', calving_area, 'm^2')
+
+    #The distribution of this total meltwater flux between basal melt and calving is fixed using the observed mass loss by Rignot et al. 2013
+    FWF_calving_Gt = 0.45 * FWF_total_Gt
+    FWF_basal_melt_Gt = 0.55 * FWF_total_Gt
+
+    # Convert Gt yr-1 to kg m-2 s-1
+    basal_melt_flux = FWF_basal_melt_Gt*kg_per_Gt/spy/basal_melt_area
+    calving_flux = FWF_calving_Gt*kg_per_Gt/spy/calving_area
+
+    ##################### Create forcing file for NEMO ######################
+
+    # create new time coordinate for next simulation year (+ 1 yr)
+    t_new = time + np.timedelta64(365,'D')
+
+    # Copy template and apply flux to masked region (12 months for the next year); flux is equal throughout the year
+    # Write to file  (to be read in by EC-Earth in the next year)
+    with IN.stage(log, 'write_forcing'):
+        FT.write_forcing(forcing_template, files['file_forcing_template'], forcing_file(files, year),
+                         {'sorunoff_f': basal_melt_flux, 'socalving_f': calving_flux}, t_new)
+    return FWF_total_Gt
+
+def store_year(files, static, state, year, thetao, log=None):
+    '''
+    Store the sector mean temperatures of a year in the coupler state and compute the running means,
+    the basal melt anomalies and the freshwater forcing anomalies
+
+    Args:
+        files: paths of experiment (see coupler_files)
+        static: static inputs (see load_static)
+        state: coupler state store (see open_coupler_state)
+        year: year of NEMO output
+        thetao: volume weighted mean temperature per sector
+        log: stage log of the year (see Instrumentation.py), None: not instrumented
+
+    Returns:
+        Total freshwater forcing [Gt/yr] for the next year
+    '''
+    t = year - files['year_min'] # time step (counting in years from the start of the experiment)
+    print(f"##### Storing data of year {year} in {files['path_state']} ##############")
+    with IN.stage(log, 'running_mean'):
+        # Compute thetao running means (O(1) update of the running mean buffer)
+        CS.update_running_mean(state, t, thetao)
+        df_thetao_running_mean = pd.DataFrame([state['thetao_rm'][t]], columns=sectors, index=[year])
+
+    #################### Basal Melt Computation ############################
+
+    print('Computing basal melt anomalies')
+    ## Compute basal melt anomalies from thetao and gamma
+    with IN.stage(log, 'basal_melt'):
+        df_dBM = BM.basal_melt_anomalies(static['df_thetao_baseline'].loc[1850],df_thetao_running_mean.loc[year], gamma)
+        state['dBM'][t] = df_dBM.values[0]
+
+    ###################### Anomalous Freshwater Forcing Computation ####################
+
+    ## Compute total freshwater forcing for the next year (5 values in Gt)
+    # Note: state['future_fwf'] stores the cumulative freshwater forcing for up to 200 years in the future
+    with IN.stage(log, 'lrf_update'):
+        state['dFWF'][t] = FWF.freshwater_flux_anomaly(t, state['future_fwf'], state['dBM'][t], static['RF'])
+
+        ## Monitoring only: same basal melt anomaly with additional response functions (all sets at once)
+        if 'future_fwf_shadow' in state:
+            RF_shadow = shadow_response_functions(files, static, state)
+            dFWF_shadow = FWF.freshwater_flux_anomaly(t, state['future_fwf_shadow'], state['dBM'][t], RF_shadow)
+            state['dFWF_spread'][t], state['FWF_total_spread'][t] = FWF.forcing_spread(
+                np.vstack([state['dFWF'][t][None], dFWF_shadow]), FWF_total_yearmin)
+
+    ######################### Total freshwater forcing ##########################
+
+    # Total change in freshwater forcing: sum over 5 regions + baseline FWF
+    FWF_total_Gt = np.nansum(state['dFWF'][t]) + FWF_total_yearmin
+    state['FWF_total'][t] = FWF_total_Gt
+    print('Total freshwater forcing: ', FWF_total_Gt)
+
+    with IN.stage(log, 'flush_state'):
+        CS.flush_state(state)
+    return FWF_total_Gt
@@ -0,0 +1,132 @@
+# Interactive freshwater forcing for a whole experiment in one long-lived process
+# Static inputs (sector index, baseline, response functions, forcing template) are loaded once and the
+# coupler state stays open; every year only the new NEMO output is read and the next forcing file written.
+#
+# Usage: python CouplerDaemon.py year_min year_max exp_name start_dir run_dir [mode]
+#   mode 'fifo' (default): process the years requested on {path_output}/CouplerDaemon.request ("year leg" per line,
+#                "stop" to exit); the result is written to {path_output}/CouplerDaemon.reply once
+#                FWF_LRF_y{year+1}.nc is written (see fwfrequest.sh)
+#   mode 'watch': process the years in order, as soon as the *_opa_grid_T_3D.nc file of a leg is complete
+#                 (a {file}.done marker written by the run script, or all records of the year in the file)
+
+## Import modules
+import os
+import sys
+import time
+import traceback
+
+import netCDF4
+
+import Coupler as CP
+import CouplerState as CS
+import Instrumentation as IN
+
+print('Argument List:', str(sys.argv))
+
+## Total experiment
+year_min = int(sys.argv[1])
+year_max = int(sys.argv[2])
+exp_name = str(sys.argv[3])
+start_dir = str(sys.argv[4])
+run_dir = str(sys.argv[5])
+mode = str(sys.argv[6]) if len(sys.argv) > 6 else 'fifo'
+
+poll_interval = 2 # [s] interval between checks for new NEMO output
+n_records = 12 # records (months) of a complete NEMO output file
+
+########################## File definition #########################
+files = CP.coupler_files(year_min, year_max, exp_name, start_dir, run_dir)
+file_request = f"{files['path_output']}/CouplerDaemon.request"
+file_reply = f"{files['path_output']}/CouplerDaemon.reply"
+
+########################## Static inputs ###########################
+# Stage log: static inputs once (as CouplerDaemon_static), then per year (see stage_log and profile in config.py)
+with IN.year_log(files['path_output'], exp_name, 'CouplerDaemon_static', year_min) as log:
+    with IN.stage(log, 'load_static'):
+        static = CP.load_static(files)
+state = None
+
+def process_year(year, leg):
+    '''
+    Process one year, (re)opening the state store when needed (first year or first request)
+    '''
+    global state
+    start = time.perf_counter()
+    with IN.year_log(files['path_output'], exp_name, 'CouplerDaemon', year) as log:
+        if state is None or year == year_min:
+            with IN.stage(log, 'open_state'):
+                state = CP.open_coupler_state(files, static, year)
+        FWF_total_Gt = CP.couple_year(files, static, state, year, CP.thetao_file(files, year, leg), log)
+    print(f'##### Year {year} done in {time.perf_counter()-start:.2f} s: {CP.forcing_file(files, year)}', flush=True)
+    return FWF_total_Gt
+
+def output_complete(file):
+    '''
+    Whether NEMO output file is complete: a done marker ({file}.done) written by the run script exists,
+    or the file has all records of the year (a file that is still written or copied can be unreadable)
+    '''
+    if os.path.isfile(f'{file}.done'):
+        return True
+    if not os.path.isfile(file):
+        return False
+    try:
+        with netCDF4.Dataset(file) as nc:
+            return len(nc.dimensions['time_counter']) >= n_records
+    except (OSError, KeyError):
+        return False
+
+def wait_for_file(file):
+    '''
+    Wait until NEMO output file is complete (see output_complete) and its size no longer changes
+    '''
+    size = -1
+    while not output_complete(file) or os.path.getsize(file) != size:
+        size = os.path.getsize(file) if os.path.isfile(file) else -1
+        time.sleep(poll_interval)
+
+if mode == 'watch':
+    ## Resume after the last year in the state store
+    year_first = year_min
+    if os.path.isdir(files['path_state']):
+        state = CS.open_state(files['path_state'])
+        year_first = year_min + CS.next_step(state)
+
+    for year in range(year_first, year_max+1):
+        leg = year - year_min + 1
+        file_thetao = CP.thetao_file(files, year, leg)
+        print(f'##### Waiting for {file_thetao}', flush=True)
+        wait_for_file(file_thetao)
+        process_year(year, leg)
+
+elif mode == 'fifo':
+    for file in [file_request, file_reply]:
+        if not os.path.exists(file):
+            os.mkfifo(file)
+
+    print(f'##### Waiting for requests on {file_request}', flush=True)
+    running = True
+    while running:
+        # Opening blocks until a client writes a request
+        with open(file_request) as f:
+            requests = f.read().split('\n')
+        for request in filter(None, requests):
+            if request.strip() == 'stop':
+                running = False
+                break
+            try:
+                year, leg = [int(arg) for arg in request.split()]
+                reply = f'{year} {process_year(year, leg)}'
+            except Exception:
+                traceback.print_exc()
+                reply = f'ERROR {request}'
+            # Opening blocks until the client reads the reply
+            with open(file_reply, 'w') as f:
+                f.write(reply + '\n')
+
+    for file in [file_request, file_reply]:
+        os.remove(file)
+
+else:
+    raise ValueError(f'Unknown mode {mode}, use watch or fifo')
+
+print("##### FINISHED FRESHWATER FORCING DAEMON")
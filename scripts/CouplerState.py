@@ -0,0 +1,285 @@
+import json
+import os
+import shutil
+
+import numpy as np
+
+import ThetaoSectors as TS
+
+###############################################################################
+# Coupler state store: one preallocated binary (memory-mapped .npy) array per 
+# variable for the whole experiment, indexed by year (row) and sector (column). 
+# Each coupling year updates its rows in place; the monitoring csv files are 
+# exported on demand. The store can be rewound to the end of any computed year
+# (see rewind_state), so that a year can be computed again.
+###############################################################################
+
+## Variables per sector, with the name of the exported monitoring file
+state_variables = {
+    'thetao': 'OceanSectorThetao',                 # sector mean ocean temperature
+    'thetao_rm': 'OceanSectorThetao_{period}yRM',  # running mean ocean temperature
+    'dBM': 'BasalMeltAnomaly',                     # basal melt anomaly
+    'dFWF': 'FreshwaterForcingAnomaly',            # freshwater forcing anomaly
+    'future_fwf': 'CumulativeFreshwaterForcingAnomaly', # cumulative forcing anomaly, updated for future years
+}
+## Variables for all sectors together
+state_totals = {
+    'FWF_total': 'TotalFreshwaterForcing',         # sum of anomalies + baseline
+}
+## Variables with one row per year (first dimension) that are missing until the year is computed
+## (the cumulative forcing anomalies also contain the contributions of earlier years to later years)
+year_variables = ['thetao', 'thetao_rm', 'dBM', 'dFWF', 'FWF_total', 'thetao_rm_periods', 'rm_sums_history',
+                  'dFWF_spread', 'FWF_total_spread']
+
+def create_state(path_state, year_min, year_max, sectors, periods, shadow_lrfs=[]):
+    '''
+    Create (or overwrite) state store for an experiment
+    
+    Args:
+        path_state: directory of state store
+        year_min: first year of experiment
+        year_max: last year of experiment
+        sectors: list of ocean sector names
+        periods: running mean periods, the first is used for the forcing, others for monitoring
+        shadow_lrfs: list of (ism, bm) of additional response functions, used to monitor the forcing spread
+
+    Returns:
+        Dictionary with meta data and memory-mapped arrays of state store
+    '''
+    if os.path.isdir(path_state):
+        shutil.rmtree(path_state)
+    os.makedirs(path_state)
+
+    length = year_max+1-year_min
+    for var in state_variables:
+        # Forcing anomalies accumulate and start at zero, other variables are missing until computed
+        array = np.lib.format.open_memmap(f'{path_state}/{var}.npy', mode='w+', dtype='float64', shape=(length, len(sectors)))
+        array[:] = 0. if var == 'future_fwf' else np.nan
+        array.flush()
+    for var in state_totals:
+        array = np.lib.format.open_memmap(f'{path_state}/{var}.npy', mode='w+', dtype='float64', shape=(length,))
+        array[:] = np.nan
+        array.flush()
+
+    # Running means for all periods and ring buffer (see ThetaoSectors.running_mean_update), with the baseline values
+    # and the sums of every year to restore the buffer when the state is rewound
+    shapes = {'thetao_rm_periods': (length, len(periods), len(sectors)),
+              'rm_buffer': (max(periods), len(sectors)),
+              'rm_sums': (len(periods), len(sectors)),
+              'rm_baseline': (len(sectors),),
+              'rm_sums_history': (length, len(periods), len(sectors))}
+    if shadow_lrfs:
+        # Cumulative forcing of the additional response functions, spread (min, median, max) over all
+        shapes['future_fwf_shadow'] = (len(shadow_lrfs), length, len(sectors))
+        shapes['dFWF_spread'] = (length, 3, len(sectors))
+        shapes['FWF_total_spread'] = (length, 3)
+    for var, shape in shapes.items():
+        array = np.lib.format.open_memmap(f'{path_state}/{var}.npy', mode='w+', dtype='float64', shape=shape)
+        array[:] = 0. if var == 'future_fwf_shadow' else np.nan
+        array.flush()
+
+    meta = {'year_min': year_min, 'year_max': year_max, 'sectors': list(sectors), 
+            'running_mean_periods': list(periods), 'shadow_lrfs': [list(lrf) for lrf in shadow_lrfs]}
+    with open(f'{path_state}/meta.json', 'w') as f:
+        json.dump(meta, f)
+    return open_state(path_state)
+
+def open_state(path_state):
+    '''
+    Open existing state store (memory-mapped, changes are written to the files)
+    
+    Args:
+        path_state: directory of state store
+
+    Returns:
+        Dictionary with meta data and memory-mapped arrays of state store
+    '''
+    with open(f'{path_state}/meta.json') as f:
+        state = {'meta': json.load(f)}
+    for file in sorted(os.listdir(path_state)):
+        if file.endswith('.npy'):
+            state[file[:-4]] = np.load(f'{path_state}/{file}', mmap_mode='r+')
+    return state
+
+def init_running_mean(state, thetao_baseline):
+    '''
+    Initialise running mean buffer of a new state store with the baseline values (see ThetaoSectors.running_mean_init)
+    '''
+    state['rm_baseline'][:] = thetao_baseline
+    TS.running_mean_init(state['rm_buffer'], state['rm_sums'], state['meta']['running_mean_periods'], thetao_baseline)
+
+def update_running_mean(state, t, thetao):
+    '''
+    Store sector mean temperatures of time step t and update the running means (O(1) update of the running mean buffer)
+    '''
+    state['thetao'][t] = thetao
+    state['thetao_rm_periods'][t] = TS.running_mean_update(state['rm_buffer'], state['rm_sums'], state['meta']['running_mean_periods'], t, state['thetao'][t])
+    state['thetao_rm'][t] = state['thetao_rm_periods'][t,0]
+    if 'rm_sums_history' in state: # not in state stores of older versions
+        state['rm_sums_history'][t] = state['rm_sums']
+
+def next_step(state):
+    '''
+    Time step after the last computed year (0 if no year has been computed)
+    '''
+    computed = np.nonzero(~np.isnan(state['thetao']).all(axis=1))[0]
+    return computed[-1]+1 if len(computed) else 0
+
+def rewind_state(state, n):
+    '''
+    Rewind state store to the end of time step n-1: the rows of the later years are set to missing and the running
+    mean buffer is restored from the stored temperatures and sums, in time proportional to max(periods).
+    The contributions of the later years to the cumulative forcing anomalies have to be removed before
+    (see Coupler.rewind_coupler_state).
+
+    Args:
+        state: state store
+        n: number of time steps to keep
+    '''
+    if 'rm_sums_history' not in state:
+        raise ValueError('State store was created by an older version and cannot be rewound, rerun from year_min')
+    for var in year_variables:
+        if var in state:
+            state[var][n:] = np.nan
+
+    ## Ring buffer: time step that last wrote each slot (before the start of the experiment: baseline)
+    periods = np.asarray(state['meta']['running_mean_periods'])
+    max_period = state['rm_buffer'].shape[0]
+    steps = n - 1 - (n - 1 - np.arange(max_period)) % max_period
+    state['rm_buffer'][:] = np.where((steps >= 0)[:,None], state['thetao'][np.maximum(steps, 0)], state['rm_baseline'])
+    state['rm_sums'][:] = state['rm_sums_history'][n-1] if n > 0 else periods[:,None] * state['rm_baseline']
+    flush_state(state)
+
+def flush_state(state):
+    '''
+    Write changes to the state store to disk
+    '''
+    for var in state:
+        if isinstance(state[var], np.memmap):
+            state[var].flush()
+
+def state_dataframe(state, var):
+    '''
+    Convert variable of state store to dataframe (only years that have been computed)
+    
+    Args:
+        state: state store
+        var: name of variable
+
+    Returns:
+        Dataframe with index 'year' (for 'future_fwf': time step) and a column per sector
+    '''
+    import pandas as pd # only needed to export, the state store itself is numpy only
+
+    meta = state['meta']
+    years = np.arange(meta['year_min'], meta['year_max']+1)
+    computed = ~np.isnan(state['thetao']).all(axis=1)
+
+    if var == 'future_fwf':
+        return pd.DataFrame(np.array(state[var]), columns=meta['sectors'])
+    if var == 'FWF_spread':
+        # Spread of the forcing anomaly per sector and of the total forcing
+        columns = [f'{sector}_{stat}' for sector in meta['sectors'] + ['total'] for stat in ['min','median','max']]
+        spread = np.concatenate([np.array(state['dFWF_spread']), np.array(state['FWF_total_spread'])[:,:,None]], axis=2)
+        df = pd.DataFrame(spread.transpose(0,2,1).reshape(len(years), -1)[computed], index=years[computed], columns=columns)
+        df.index.name = 'year'
+        return df
+    if var.startswith('thetao_rm_'):
+        # Running mean of one period, e.g. thetao_rm_10
+        p = meta['running_mean_periods'].index(int(var[len('thetao_rm_'):]))
+        df = pd.DataFrame(np.array(state['thetao_rm_periods'][:,p])[computed], index=years[computed], columns=meta['sectors'])
+        df.index.name = 'year'
+        return df
+    if var in state_totals:
+        df = pd.DataFrame(np.array(state[var])[computed], index=years[computed], columns=['0'])
+    else:
+        df = pd.DataFrame(np.array(state[var])[computed], index=years[computed], columns=meta['sectors'])
+    df.index.name = 'year'
+    return df
+
+def read_thetao_history(path_state, path_output, exp_name, year_min, year_max, year, sectors):
+    '''
+    Sector mean temperatures of the years before year from the monitoring file OceanSectorThetao_{exp}_{year_min}_{year_max}.csv
+    (written by the csv version of the coupler, or exported from a state store), to create a missing state store;
+    of a year that resubmitted legs appended twice the last row is used
+
+    Args:
+        path_state: directory of the missing state store (for the error messages)
+        path_output: directory of monitoring files
+        exp_name: experiment name
+        year_min, year_max: first and last year of experiment
+        year: first year that is not filled in
+        sectors: list of ocean sector names
+
+    Returns:
+        Array (year, sector) with the temperatures of years year_min to year-1
+    '''
+    import pandas as pd
+
+    file_csv = f"{path_output}/{state_variables['thetao']}_{exp_name}_{year_min}_{year_max}.csv"
+    if not os.path.isfile(file_csv):
+        raise FileNotFoundError(f'Coupler state {path_state} is missing and there is no {file_csv} to create it '
+                                f'from: rerun the experiment from {year_min} or restore the coupler state')
+    # Exact round trip of the exported temperatures, so that the state continues as if it had not been lost
+    df_thetao = pd.read_csv(file_csv, index_col=0, float_precision='round_trip')
+    df_thetao = df_thetao[~df_thetao.index.duplicated(keep='last')]
+    missing = [y for y in range(year_min, year) if y not in df_thetao.index]
+    if missing:
+        raise ValueError(f'Coupler state {path_state} is missing and years {missing} are not in {file_csv}')
+    return df_thetao.loc[range(year_min, year), sectors].values
+
+def write_csv(df, file_csv):
+    '''
+    Write dataframe to csv file, replacing the file at once (the file may be read during the experiment)
+    '''
+    file_tmp = f'{file_csv}.{os.getpid()}.tmp'
+    df.to_csv(file_tmp)
+    os.replace(file_tmp, file_csv)
+
+def monitoring_variables(state):
+    '''
+    Variables with monitoring files: all variables, or only the temperatures and running means when no basal melt
+    anomaly was computed (prescribed forcing), so that no files with only missing values are written
+    '''
+    if np.isnan(state['dBM']).all():
+        return ['thetao', 'thetao_rm']
+    return list(state_variables) + list(state_totals)
+
+def export_csv(state, path_output, exp_name, running_mean_period, variables=None):
+    '''
+    Export state store to the monitoring csv files
+    
+    Args:
+        state: state store
+        path_output: directory of monitoring files
+        exp_name: experiment name
+        running_mean_period: running mean period (used in file name)
+        variables: list of variables to export (optional, default: all)
+    '''
+    meta = state['meta']
+    for var, name in list(state_variables.items()) + list(state_totals.items()):
+        if variables is not None and var not in variables:
+            continue
+        name = name.format(period=running_mean_period)
+        if var == 'future_fwf':
+            file_csv = f'{path_output}/{name}_{exp_name}_Future.csv'
+        else:
+            file_csv = f"{path_output}/{name}_{exp_name}_{meta['year_min']}_{meta['year_max']}.csv"
+        write_csv(state_dataframe(state, var), file_csv)
+        print(f'Exported {file_csv}')
+
+    # Spread of the forcing over the response functions
+    if 'dFWF_spread' in state and (variables is None or 'dFWF' in variables):
+        file_csv = f"{path_output}/FreshwaterForcingSpread_{exp_name}_{meta['year_min']}_{meta['year_max']}.csv"
+        write_csv(state_dataframe(state, 'FWF_spread'), file_csv)
+        print(f'Exported {file_csv}')
+
+    # Running means of the monitoring periods
+    if variables is None or 'thetao_rm' in variables:
+        for period in meta['running_mean_periods']:
+            if period == running_mean_period:
+                continue
+            name = state_variables['thetao_rm'].format(period=period)
+            file_csv = f"{path_output}/{name}_{exp_name}_{meta['year_min']}_{meta['year_max']}.csv"
+            write_csv(state_dataframe(state, f'thetao_rm_{period}'), file_csv)
+            print(f'Exported {file_csv}')
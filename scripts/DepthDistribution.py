@@ -0,0 +1,212 @@
+# Write the basal melt depth files (zshelf) for a table of depth pairs in one pass over the basal melt mask
+# Usage: python DepthDistribution.py {file_table} {start_dir} {path_output}
+#   file_table: csv file with lines label,sector,depth_top,depth_bottom (sector: name of an ocean sector or 'default'),
+#               writes {path_output}/basal_melt_depth1_{label}.nc and basal_melt_depth2_{label}.nc for every label
+
+import csv
+import os
+import sys
+
+import netCDF4
+import numpy as np
+
+import DataVariablesParameters as dvp
+import ForcingTemplate as FT
+
+###############################################################################
+# Vertical distribution of basal melt: the shallowest (depth1) and deepest (depth2)
+# depth at the cells of the basal melt mask, snapped to the level bounds of NEMO.
+# A depth pair is the same for all cells, per ocean sector (cells in the lat/lon
+# boxes of DataVariablesParameters.sector_boxes) or per cell, so that the depth
+# files of many sensitivity experiments are written from one read of the mask.
+###############################################################################
+
+def snap_top(lev_bnds, depth):
+    '''
+    Upper bound of the shallowest layer that starts below depth (as ThetaoSectors.nearest_above on lev_bnds[:,0])
+
+    Args:
+        lev_bnds: level bounds (lev, 2) [m]
+        depth: depth or array of depths [m]
+
+    Returns:
+        Upper bound of the layer [m], same shape as depth
+    '''
+    lev = np.searchsorted(lev_bnds[:,0], depth, side='right')
+    if np.any(lev == len(lev_bnds)):
+        raise ValueError(f'No layer starts below {np.max(depth)} m (upper bound of the deepest layer: {lev_bnds[-1,0]} m)')
+    return lev_bnds[lev,0]
+
+def snap_bottom(lev_bnds, depth):
+    '''
+    Lower bound of the deepest layer that ends above depth (as ThetaoSectors.nearest_below on lev_bnds[:,1])
+
+    Args:
+        lev_bnds: level bounds (lev, 2) [m]
+        depth: depth or array of depths [m]
+
+    Returns:
+        Lower bound of the layer [m], same shape as depth
+    '''
+    lev = np.searchsorted(lev_bnds[:,1], depth, side='left') - 1
+    if np.any(lev < 0):
+        raise ValueError(f'No layer ends above {np.min(depth)} m (lower bound of the top layer: {lev_bnds[0,1]} m)')
+    return lev_bnds[lev,1]
+
+def cell_sectors(lat, lon, sectors):
+    '''
+    Ocean sector of grid cells (first sector whose boxes contain the cell, see DataVariablesParameters.sector_boxes)
+
+    Args:
+        lat, lon: latitude and longitude of the cells
+        sectors: list of ocean sector names
+
+    Returns:
+        Index in sectors of the sector of every cell, -1 outside all sectors
+    '''
+    sector_id = np.full(np.shape(lat), -1)
+    for s, sector in reversed(list(enumerate(sectors))):
+        in_sector = np.zeros(np.shape(lat), dtype=bool)
+        for lat_min, lat_max, lon_min, lon_max in dvp.sector_boxes[sector]:
+            in_box = np.ones(np.shape(lat), dtype=bool)
+            if lat_min is not None:
+                in_box &= lat > lat_min
+            if lat_max is not None:
+                in_box &= lat < lat_max
+            if lon_min is not None:
+                in_box &= lon > lon_min
+            if lon_max is not None:
+                in_box &= lon < lon_max
+            in_sector |= in_box
+        sector_id[in_sector] = s
+    return sector_id
+
+def mask_coordinates(file_basal_melt_mask, file_area=None):
+    '''
+    Latitude and longitude of the cells of the basal melt mask, from the mask file or else from the area file
+    (the masks are on the grid of areacello)
+    '''
+    for file in [file_basal_melt_mask, file_area]:
+        if file is None:
+            continue
+        with netCDF4.Dataset(file) as nc:
+            for lat, lon in [('latitude', 'longitude'), ('lat', 'lon'), ('nav_lat', 'nav_lon')]:
+                if lat in nc.variables and lon in nc.variables:
+                    lat, lon = np.asarray(nc[lat][:]), np.asarray(nc[lon][:])
+                    if lat.ndim == 1: # regular grid
+                        lat, lon = np.meshgrid(lat, lon, indexing='ij')
+                    return lat, lon
+    raise ValueError(f'No latitude/longitude in {file_basal_melt_mask} or {file_area}, needed for depths per sector')
+
+def pair_depths(pair, cells, sector_id, sectors):
+    '''
+    Depth pair at the cells of the mask
+
+    Args:
+        pair: (depth_top, depth_bottom), each a depth or a field (y, x) [m],
+              or dictionary with (depth_top, depth_bottom) per ocean sector and for the other cells ('default')
+        cells: (j, i) indices of the mask cells
+        sector_id: index of the sector of the mask cells (see cell_sectors), None if pair is not per sector
+
+    Returns:
+        Upper and lower depth at the mask cells [m]
+    '''
+    if isinstance(pair, dict):
+        unknown = set(pair) - set(sectors) - {'default'}
+        if unknown:
+            raise ValueError(f'Unknown sectors {sorted(unknown)} in depth table, sectors: {sectors}')
+        # Lookup table: depths of the sectors, default last (sector_id -1)
+        lookup = np.array([pair.get(sector, pair.get('default', (np.nan, np.nan))) for sector in sectors + ['default']],
+                          dtype='float64')[sector_id]
+        missing = np.isnan(lookup[:,0])
+        if np.any(missing):
+            raise ValueError(f'{np.count_nonzero(missing)} cells of the basal melt mask are in none of the sectors '
+                             f'{sorted(pair)}, give their depths with the sector default')
+        return lookup[:,0], lookup[:,1]
+    return tuple(np.asarray(depth, dtype='float64')[cells] if np.ndim(depth) == 2 else np.full(len(cells[0]), depth, dtype='float64')
+                 for depth in pair)
+
+def depth_files(path_output, label):
+    '''
+    Paths of the basal melt depth files of a depth pair: basal_melt_depth1.nc and basal_melt_depth2.nc for
+    label '' (files of the experiment), basal_melt_depth1_{label}.nc and basal_melt_depth2_{label}.nc otherwise
+    '''
+    suffix = f'_{label}' if label else ''
+    return f'{path_output}/basal_melt_depth1{suffix}.nc', f'{path_output}/basal_melt_depth2{suffix}.nc'
+
+def write_depth_files(file_basal_melt_mask, table, lev_bnds, path_output, file_area=None, sectors=None):
+    '''
+    Write the basal melt depth files of all depth pairs of a table: the mask is read once, and the depths of
+    all pairs and cells are snapped to the level bounds at once
+
+    Args:
+        file_basal_melt_mask: path of basal melt mask file
+        table: dictionary with label and depth pair (see pair_depths and depth_files)
+        lev_bnds: level bounds (lev, 2) [m], e.g. from the grid descriptor
+        path_output: directory of the depth files
+        file_area: path of areacello file (optional, coordinates for depths per sector when the mask file has none)
+        sectors: list of ocean sector names (default: all sectors of DataVariablesParameters.sector_boxes)
+
+    Returns:
+        Dictionary with label and snapped (depth_top, depth_bottom) at the mask cells [m]
+    '''
+    sectors = list(dvp.sector_boxes) if sectors is None else list(sectors)
+    values = FT.read_field(file_basal_melt_mask, FT.forcing_masks['sorunoff_f'])
+    cells = np.nonzero(values > 0)
+    sector_id = None
+    if any(isinstance(pair, dict) for pair in table.values()):
+        lat, lon = mask_coordinates(file_basal_melt_mask, file_area)
+        sector_id = cell_sectors(lat[cells], lon[cells], sectors)
+
+    ## Depths of all pairs at the mask cells (pair, cell), snapped in one search per bound
+    depths = [pair_depths(pair, cells, sector_id, sectors) for pair in table.values()]
+    tops = snap_top(lev_bnds, np.array([top for top, _ in depths]))
+    bottoms = snap_bottom(lev_bnds, np.array([bottom for _, bottom in depths]))
+    empty = [label for label, top, bottom in zip(table, tops, bottoms) if np.any(top >= bottom)]
+    if empty:
+        raise ValueError(f'No whole layer between the depths of {empty} at some cells of the basal melt mask')
+
+    fields = {}
+    for label, top, bottom in zip(table, tops, bottoms):
+        print(f'Depth pair {label or "(experiment)"}: upper bound {np.unique(top)} m, lower bound {np.unique(bottom)} m')
+        for file, depth in zip(depth_files(path_output, label), [top, bottom]):
+            # Constant depths as scalars, so that the default files are the same as with one depth per file
+            field = depth[0] if np.all(depth == depth[0]) else np.zeros(values.shape)
+            if np.ndim(field):
+                field[cells] = depth
+            fields[file] = field
+    FT.write_depth_fields(file_basal_melt_mask, fields, values)
+    return {label: (top, bottom) for label, top, bottom in zip(table, tops, bottoms)}
+
+def read_depth_table(file_table):
+    '''
+    Read a depth table from a csv file with lines label,sector,depth_top,depth_bottom (a header line is optional);
+    a label with the single sector 'default' has the same depths at all cells
+
+    Returns:
+        Dictionary with label and depth pair (see write_depth_files)
+    '''
+    table = {}
+    with open(file_table) as f:
+        for row in csv.reader(f):
+            if not row or row[0].startswith('#') or row[0] == 'label':
+                continue
+            label, sector, depth_top, depth_bottom = [value.strip() for value in row]
+            table.setdefault(label, {})[sector] = (float(depth_top), float(depth_bottom))
+    return {label: pair['default'] if list(pair) == ['default'] else pair for label, pair in table.items()}
+
+if __name__ == '__main__':
+    import GridDescriptor as GD
+
+    print('Argument List:', str(sys.argv))
+    file_table = str(sys.argv[1])
+    start_dir = str(sys.argv[2])
+    path_output = str(sys.argv[3])
+
+    path_input = f'{start_dir}/fwf/interactive/input/'
+    grid_descriptor = GD.load_grid_descriptor(f'{path_input}/GridDescriptor_ORCA1.npz')
+    table = read_depth_table(file_table)
+    os.makedirs(path_output, exist_ok=True)
+    write_depth_files(f'{path_input}/basal_melt_mask_ORCA1_ocean.nc', table, grid_descriptor['olevel_bounds'], path_output,
+                      f'{path_input}/areacello_Ofx_EC-Earth3_historical_r1i1p1f1_gn.nc')
+    print(f'Wrote basal melt depth files of {len(table)} depth pairs to {path_output}')
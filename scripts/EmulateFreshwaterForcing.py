@@ -0,0 +1,51 @@
+# Emulate Antarctic freshwater forcing of a whole experiment offline from its sector mean ocean temperatures
+# (OceanSectorThetao_*.csv), using the linear response functions specified in config.py
+
+## Import modules
+import os
+import sys
+
+import pandas as pd
+
+import FreshWaterForcing as FWF
+import LRFEmulator as LE
+from CouplerState import state_variables, state_totals
+from config import gamma, ism, bm, running_mean_period, FWF_total_yearmin
+
+print('Argument List:', str(sys.argv))
+
+file_thetao_csv = str(sys.argv[1])
+exp_name = str(sys.argv[2])
+start_dir = str(sys.argv[3])
+path_output = str(sys.argv[4]) if len(sys.argv) > 4 else f'{start_dir}/fwf/interactive/emulated/{exp_name}/'
+
+## Paths
+path_input = f'{start_dir}/fwf/interactive/input/'
+path_lrfs = f'{start_dir}/fwf/interactive/RFunctions/'
+file_baseline_thetao = f'{path_input}/OceanSectorThetao_piControl.csv'
+
+## Read sector temperatures and baseline; of a year that resubmitted legs appended twice the last row is used,
+## in order of the years (a missing year is an error, see LRFEmulator.emulate_experiment_df)
+df_thetao = pd.read_csv(file_thetao_csv, index_col=0)
+df_thetao = df_thetao[~df_thetao.index.duplicated(keep='last')].sort_index()
+df_thetao_baseline = pd.read_csv(file_baseline_thetao, index_col=0)
+sectors = list(df_thetao.columns)
+year_min, year_max = df_thetao.index.min(), df_thetao.index.max()
+
+## Read linear response functions (sector, lag)
+RF = FWF.load_response_functions(path_lrfs, ism, bm, sectors)
+
+## Emulate all years at once
+dfs = LE.emulate_experiment_df(df_thetao, df_thetao_baseline, RF, gamma, running_mean_period, FWF_total_yearmin)
+
+## Export with the names of the monitoring files
+os.makedirs(path_output, exist_ok=True)
+for var, df in dfs.items():
+    name = {**state_variables, **state_totals}[var].format(period=running_mean_period)
+    if var == 'future_fwf':
+        file_csv = f'{path_output}/{name}_{exp_name}_Future.csv'
+    else:
+        df.index.name = 'year'
+        file_csv = f'{path_output}/{name}_{exp_name}_{year_min}_{year_max}.csv'
+    df.to_csv(file_csv)
+    print(f'Exported {file_csv}')
@@ -0,0 +1,38 @@
+# Compute Antarctic freshwater forcing offline for all combinations of gamma, freezing point temperature and 
+# running mean period from the sector mean ocean temperatures of an experiment (OceanSectorThetao_*.csv)
+# Parameter values are comma separated lists, e.g. 0.04,0.052,0.08 -1.6,-1.8 10,30
+
+## Import modules
+import sys
+
+import pandas as pd
+
+import FreshWaterForcing as FWF
+import ParameterEnsemble as PE
+from config import ism, bm, FWF_total_yearmin
+
+print('Argument List:', str(sys.argv))
+
+file_thetao_csv = str(sys.argv[1])
+start_dir = str(sys.argv[2])
+file_ensemble = str(sys.argv[3])
+gamma = [float(value) for value in sys.argv[4].split(',')]
+T_f = [float(value) for value in sys.argv[5].split(',')]
+period = [int(value) for value in sys.argv[6].split(',')]
+
+## Paths
+path_input = f'{start_dir}/fwf/interactive/input/'
+path_lrfs = f'{start_dir}/fwf/interactive/RFunctions/'
+file_baseline_thetao = f'{path_input}/OceanSectorThetao_piControl.csv'
+
+## Read sector temperatures, baseline and linear response functions (sector, lag)
+df_thetao = pd.read_csv(file_thetao_csv, index_col=0)
+df_thetao_baseline = pd.read_csv(file_baseline_thetao, index_col=0)
+RF = FWF.load_response_functions(path_lrfs, ism, bm, list(df_thetao.columns))
+
+## Compute ensemble for all parameter combinations
+ds_ensemble = PE.ensemble_forcing_df(df_thetao, df_thetao_baseline, RF, *PE.parameter_grid(gamma, T_f, period), FWF_total_yearmin)
+print(f'Computed {ds_ensemble.sizes["param"]} parameter combinations')
+
+ds_ensemble.to_netcdf(file_ensemble)
+print(f'Saved ensemble to {file_ensemble}')
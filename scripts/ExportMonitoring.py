@@ -0,0 +1,23 @@
+# Export the coupler state store of an experiment to the monitoring csv files (can be run during the experiment)
+
+## Import modules
+import sys
+
+import CouplerState as CS
+from config import running_mean_period
+
+print('Argument List:', str(sys.argv))
+
+## Total experiment
+year_min = int(sys.argv[1])
+year_max = int(sys.argv[2])
+exp_name = str(sys.argv[3])
+start_dir = str(sys.argv[4])
+
+## Paths
+path_output = f'{start_dir}/fwf/interactive/forcing_files/{exp_name}/'
+path_state = f'{path_output}/CouplerState_{exp_name}_{year_min}_{year_max}'
+
+state = CS.open_state(path_state)
+# Prescribed forcing: only the temperatures and running means
+CS.export_csv(state, path_output, exp_name, running_mean_period, CS.monitoring_variables(state))
@@ -0,0 +1,284 @@
+import hashlib
+import json
+import os
+import shutil
+
+import netCDF4
+import numpy as np
+
+###############################################################################
+
+## Forcing variables for NEMO and the distribution mask they are spread over
+forcing_masks = {'sorunoff_f': 'basal_melt_mask',
+                 'socalving_f': 'calving_mask'}
+forcing_attrs = {'sorunoff_f': {'long_name':'runoff flux', 'units':'kg/m^2/s'},
+                 'socalving_f': {'long_name':'calving flux', 'units':'kg/m^2/s'}}
+# Attributes of the initial forcing file (InitialiseFreshwaterForcing.py), which differ from the coupler files
+initial_attrs = {'sorunoff_f': {'long_name':'basal melt flux', 'units':'kg/m^2/s'},
+                 'socalving_f': {'long_name':'calving flux', 'units':'kg/m^2/s'}}
+initial_global_attrs = {'long_name': 'freshwater fluxes', 'units':'kg/m^2/s'}
+# Global attributes of the coupler files (xr.merge of the original script keeps those of the first flux)
+forcing_global_attrs = {'long_name':'runoff flux', 'units':'kg/m^2/s'}
+
+# Units of the time axis as chosen by xarray (to_netcdf of the original script): the largest unit dividing all time steps
+time_steps = {'days': 86400*10**9, 'hours': 3600*10**9, 'minutes': 60*10**9, 'seconds': 10**9,
+              'milliseconds': 10**6, 'microseconds': 10**3, 'nanoseconds': 1}
+
+## On-disk layout of the forcing files (original layout: 12 monthly float64 records, netCDF4 without compression)
+default_layout = {'dtype': 'float64',     # 'float32' halves the file size
+                  'format': 'NETCDF4',    # 'NETCDF4' or 'NETCDF3_CLASSIC'
+                  'complevel': 0,         # netCDF4 deflate level (0: no compression)
+                  'chunksizes': None,     # netCDF4 chunk sizes (time_counter, j, i), None: library default
+                  'n_time': 12}           # records per file: 12 (monthly) or 1 (constant flux for the whole year)
+
+def forcing_encoding(layout):
+    '''
+    Netcdf storage options of the forcing variables for a forcing file layout
+
+    Args:
+        layout: dictionary with the on-disk layout (see default_layout)
+
+    Returns:
+        Dictionary with compression and chunking arguments of netCDF4 createVariable
+    '''
+    encoding = {}
+    if layout['format'].startswith('NETCDF4'):
+        if layout['complevel'] > 0:
+            encoding.update({'zlib': True, 'complevel': layout['complevel'], 'shuffle': True})
+        if layout['chunksizes'] is not None:
+            encoding['chunksizes'] = tuple(layout['chunksizes'])
+    return encoding
+
+def forcing_template_key(file_masks, file_area, layout):
+    '''
+    Compute key identifying the mask and area files and the layout used to build a forcing template
+
+    Args:
+        file_masks: dictionary with per forcing variable the path of its distribution mask file
+        file_area: path of areacello file
+        layout: dictionary with the on-disk layout of the forcing file (see default_layout)
+
+    Returns:
+        Hexadecimal key, changes when one of the input files or the layout changes
+    '''
+    files = dict(file_masks, areacello=file_area)
+    definition = {'version': 3, # format of the template files
+                  'files': {var: [os.stat(f).st_size, os.stat(f).st_mtime_ns] for var, f in files.items()},
+                  'layout': layout}
+    return hashlib.sha1(json.dumps(definition, sort_keys=True).encode()).hexdigest()
+
+def read_field(file, var):
+    '''
+    Read 2D field from netcdf file, missing values set to nan (as in xarray)
+    '''
+    with netCDF4.Dataset(file) as nc:
+        return np.ma.filled(np.ma.asarray(nc[var][:]).astype('float64'), np.nan)
+
+def build_forcing_template(file_masks, file_area, file_template, layout=default_layout):
+    '''
+    Build forcing file template with zero fluxes and the sparse distribution masks
+    (netCDF4 only, so that the template can be built without loading xarray)
+
+    Args:
+        file_masks: dictionary with per forcing variable the path of its distribution mask file
+        file_area: path of areacello file
+        file_template: path of template netcdf file, the sparse masks are written next to it (.npz)
+        layout: dictionary with the on-disk layout of the forcing file (see default_layout)
+
+    Returns:
+        Dictionary with per forcing variable the mask area and the (j,i) indices and values
+        of the non-zero mask cells
+    '''
+    area_values = read_field(file_area, 'areacello')
+    template = {}
+    for var, file_mask in file_masks.items():
+        values = read_field(file_mask, forcing_masks[var])
+
+        # Area as computed by the original script (areacello.where(mask).sum('j').sum('i')): 
+        # nan mask values count as inside the mask, missing areas are skipped
+        area_mask = np.where(values.astype(bool), area_values, np.nan)
+        area = np.sum(np.sum(np.where(np.isnan(area_mask), 0., area_mask), axis=0))
+
+        # Only cells with a non-zero (finite) mask value receive a flux, all others are zero after fillna
+        j, i = np.nonzero(np.isfinite(values) & (values != 0))
+        template[var] = {'area': area,
+                         'j': j,
+                         'i': i,
+                         'values': values[j,i]}
+
+    # Write to temporary files first, so that a partial template is never used
+    file_tmp = f'{file_template}.{os.getpid()}.tmp'
+    with netCDF4.Dataset(file_tmp, 'w', format=layout['format']) as nc:
+        nc.setncatts(forcing_global_attrs)
+        nc.createDimension('time_counter', None)
+        for var, file_mask in file_masks.items():
+            with netCDF4.Dataset(file_mask) as nc_mask:
+                dims = nc_mask[forcing_masks[var]].dimensions
+                copy_coordinates(nc_mask, nc, dims, forcing_masks[var])
+                nc_var = nc.createVariable(var, layout['dtype'], ('time_counter',) + dims, fill_value=np.nan,
+                                           **forcing_encoding(layout))
+                nc_var.setncatts(forcing_attrs[var])
+                if 'coordinates' in nc_mask[forcing_masks[var]].ncattrs():
+                    nc_var.coordinates = nc_mask[forcing_masks[var]].coordinates
+                nc_var[:] = np.zeros((layout['n_time'],) + nc_var.shape[1:])
+
+        # Integer time axis as written by xarray, units and calendar are set per forcing file
+        nc_time = nc.createVariable('time_counter', 'i4' if layout['format'].startswith('NETCDF3') else 'i8', ('time_counter',))
+        nc_time[:] = np.zeros(layout['n_time'], dtype=nc_time.dtype)
+    os.replace(file_tmp, file_template)
+    return template
+
+def copy_coordinates(nc_src, nc_dst, dims, var_skip):
+    '''
+    Copy dimensions and coordinate variables (e.g. latitude, longitude) of a grid between netcdf files
+    '''
+    for dim in dims:
+        if dim not in nc_dst.dimensions:
+            nc_dst.createDimension(dim, len(nc_src.dimensions[dim]))
+    for name, nc_var in nc_src.variables.items():
+        if name == var_skip or name in nc_dst.variables or not nc_var.dimensions or not set(nc_var.dimensions) <= set(dims):
+            continue
+        dtype = nc_var.dtype
+        if nc_dst.data_model.startswith('NETCDF3') and dtype == np.int64:
+            dtype = np.int32 # no 64 bit integers in netCDF3
+        attrs = {att: nc_var.getncattr(att) for att in nc_var.ncattrs()}
+        nc_copy = nc_dst.createVariable(name, dtype, nc_var.dimensions, fill_value=attrs.pop('_FillValue', None))
+        nc_copy.setncatts(attrs)
+        nc_copy[:] = nc_var[:]
+
+def load_forcing_template(file_masks, file_area, file_template, layout=default_layout):
+    '''
+    Load forcing template, (re)building it when the files are missing or out of date
+
+    Args:
+        file_masks: dictionary with per forcing variable the path of its distribution mask file
+        file_area: path of areacello file
+        file_template: path of template netcdf file, the sparse masks are stored next to it (.npz)
+        layout: dictionary with the on-disk layout of the forcing file (see default_layout)
+
+    Returns:
+        Dictionary with per forcing variable the mask area, (j,i) indices and values of the mask cells
+    '''
+    layout = dict(default_layout, **layout)
+    key = forcing_template_key(file_masks, file_area, layout)
+    file_cells = f'{os.path.splitext(file_template)[0]}.npz'
+
+    if os.path.isfile(file_template) and os.path.isfile(file_cells):
+        with np.load(file_cells) as f:
+            if str(f['key']) == key:
+                return {var: {field: f[f'{var}_{field}'] for field in ['area','j','i','values']}
+                        for var in file_masks}
+        print(f'Forcing template {file_template} is out of date')
+
+    print(f'Building forcing template {file_template}')
+    template = build_forcing_template(file_masks, file_area, file_template, layout)
+
+    arrays = {f'{var}_{field}': template[var][field] for var in template for field in template[var]}
+    file_tmp = f'{file_cells}.{os.getpid()}.tmp'
+    with open(file_tmp, 'wb') as f:
+        np.savez(f, key=key, **arrays)
+    os.replace(file_tmp, file_cells)
+    return template
+
+def mask_area(template, var):
+    '''
+    Area [m^2] of the distribution mask of forcing variable var
+    '''
+    return float(template[var]['area'])
+
+def encode_time(time):
+    '''
+    Encode time values as xarray does when writing a dataset: integer values in units of the largest time step
+    dividing all time differences, since the first time value
+
+    Args:
+        time: array of time values (datetime64 or cftime)
+
+    Returns:
+        Integer time values, units and calendar attributes
+    '''
+    if np.issubdtype(time.dtype, np.datetime64):
+        time = time.astype('datetime64[ns]')
+        delta = (time - time[0]).astype('int64')
+        unit = next(unit for unit, step in time_steps.items() if np.all(delta % step == 0))
+        reference = np.datetime_as_string(time[0], unit='s' if time[0] == time[0].astype('datetime64[s]') else 'us')
+        return delta//time_steps[unit], f"{unit} since {reference.replace('T', ' ')}", 'proleptic_gregorian'
+
+    calendar = time[0].calendar
+    delta = np.array([round((t - time[0]).total_seconds()*10**9) for t in time], dtype='int64')
+    unit = next(unit for unit, step in time_steps.items() if np.all(delta % step == 0))
+    reference = f"{time[0].strftime('%Y-%m-%d %H:%M:%S')}.{time[0].microsecond:06d}"
+    return delta//time_steps[unit], f'{unit} since {reference}', calendar
+
+def write_forcing(template, file_template, file_forcing, fluxes, time, attrs=None, global_attrs=None):
+    '''
+    Write forcing file by copying the template and writing the scaled mask cells in place
+
+    Args:
+        template: forcing template (see load_forcing_template)
+        file_template: path of template netcdf file
+        file_forcing: path of forcing file
+        fluxes: dictionary with per forcing variable the flux [kg m-2 s-1] over the mask
+        time: time values of the monthly records (datetime64 or cftime), 
+              replaced by the middle of the year for a single record template
+        attrs: dictionary with per forcing variable attributes replacing those of the template (optional)
+        global_attrs: dictionary with global attributes of the forcing file (optional)
+    '''
+    file_tmp = f'{file_forcing}.{os.getpid()}.tmp'
+    shutil.copyfile(file_template, file_tmp)
+
+    with netCDF4.Dataset(file_tmp, 'a') as nc:
+        time = np.asarray(time)
+        n_time = nc.dimensions['time_counter'].size
+        if n_time == 1 and len(time) > 1:
+            time = time[:1] + (time[-1] - time[0])/2
+        values, units, calendar = encode_time(time)
+        nc['time_counter'].setncatts({'units': units, 'calendar': calendar})
+        nc['time_counter'][:] = values
+        # Attributes are removed before being replaced, so that they keep the order of the original files
+        for var, var_attrs in (attrs or {}).items():
+            for att in var_attrs:
+                nc[var].delncattr(att)
+            nc[var].setncatts(var_attrs)
+        if global_attrs:
+            for att in nc.ncattrs():
+                nc.delncattr(att)
+            nc.setncatts(global_attrs)
+
+        for var, flux in fluxes.items():
+            cells = template[var]
+            if len(cells['j']) == 0:
+                continue
+            # Only the bounding box of the mask cells is written, the rest of the template is zero
+            j_min, j_max = cells['j'].min(), cells['j'].max()+1
+            i_min, i_max = cells['i'].min(), cells['i'].max()+1
+            block = np.zeros((j_max-j_min, i_max-i_min))
+            block[cells['j']-j_min, cells['i']-i_min] = flux*cells['values']
+            nc[var][:n_time, j_min:j_max, i_min:i_max] = np.broadcast_to(block, (n_time,) + block.shape)
+
+    # Replace forcing file at once, EC-Earth never reads a partial file
+    os.replace(file_tmp, file_forcing)
+
+def write_depth_fields(file_basal_melt_mask, fields, values=None):
+    '''
+    Write basal melt depth files (zshelf): depth at the cells of the basal melt mask, zero elsewhere
+
+    Args:
+        file_basal_melt_mask: path of basal melt mask file
+        fields: dictionary with per basal melt depth file the depth [m] of basal melt, a constant or a field (y, x)
+        values: basal melt mask (optional, read from file_basal_melt_mask when missing)
+    '''
+    if values is None:
+        values = read_field(file_basal_melt_mask, forcing_masks['sorunoff_f'])
+
+    with netCDF4.Dataset(file_basal_melt_mask) as nc_mask:
+        dims = nc_mask[forcing_masks['sorunoff_f']].dimensions
+        for file_zshelf, depth in fields.items():
+            file_tmp = f'{file_zshelf}.{os.getpid()}.tmp'
+            with netCDF4.Dataset(file_tmp, 'w') as nc:
+                nc.createDimension('time_counter', None)
+                copy_coordinates(nc_mask, nc, dims, forcing_masks['sorunoff_f'])
+                nc_var = nc.createVariable('bmdepth', 'f8', ('time_counter',) + dims, fill_value=np.nan)
+                nc_var.setncatts({'long_name':'basal melt depth', 'units':'m'})
+                nc_var[0] = np.where(values > 0, depth, 0.)
+            os.replace(file_tmp, file_zshelf)
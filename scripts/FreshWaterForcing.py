@@ -1,6 +1,17 @@
+import json
+import os
+import warnings
+
 import numpy as np
 import pandas as pd
 
+## Dictionary for finding response functions related to the ocean sectors
+LRF_sector = {'eais': 'R1',
+              'ross': 'R2',
+              'amun': 'R3',
+              'wedd': 'R4',
+              'apen': 'R5'}
+
 def freshwater_flux_anomaly_df(t, length, BM, RF, file_future_fwf):
     '''
     Compute freshwater flux from basal melt anomaly using linear response functions for the next 200 years.
@@ -39,4 +50,131 @@ def freshwater_flux_anomaly_df(t, length, BM, RF, file_future_fwf):
     print(f'Saved future forcing to {file_future_fwf}')
     # Compute differences: annual forcing
     dfFWF_diff = dfFWF.diff()
-    return (pd.DataFrame(dfFWF_diff.iloc[t]).T)
\ No newline at end of file
+    return (pd.DataFrame(dfFWF_diff.iloc[t]).T)
+
+def read_response_functions(path_lrfs, ism, bm, sectors):
+    '''
+    Read linear response functions of the total freshwater flux for each sector
+
+    Args:
+        path_lrfs: directory with linear response functions
+        ism: ice sheet model
+        bm: basal melt forcing used to create linear response functions
+        sectors: list of ocean sector names
+    Returns:
+        Array (sector, lag) with response functions: unit Gt/m [(Gt yr-1)/(m -yr-1)]
+    '''
+    RF = []
+    for RF_TotalFW_file in response_function_files(path_lrfs, ism, bm, sectors):
+        with open(RF_TotalFW_file) as f:
+            RF.append([float(row) for row in f])
+    return np.array(RF)
+
+def response_function_files(path_lrfs, ism, bm, sectors):
+    '''
+    Paths of the text files with the linear response functions for each sector
+    '''
+    return [f'{path_lrfs}/TotalFW/RF_{ism}_BM{bm}_{LRF_sector[sector]}.dat' for sector in sectors]
+
+def load_response_functions(path_lrfs, ism, bm, sectors):
+    '''
+    Load linear response functions from a binary cache (memory-mapped), compiling the text files 
+    into the cache (RFunctions/TotalFW/cache/RF_{ism}_BM{bm}.npy + .json with meta data) if it is 
+    missing or if the text files changed
+
+    Args:
+        path_lrfs: directory with linear response functions
+        ism: ice sheet model
+        bm: basal melt forcing used to create linear response functions
+        sectors: list of ocean sector names
+    Returns:
+        Array (sector, lag) with response functions: unit Gt/m [(Gt yr-1)/(m -yr-1)]
+    '''
+    path_cache = f'{path_lrfs}/TotalFW/cache'
+    file_cache = f'{path_cache}/RF_{ism}_BM{bm}.npy'
+    file_meta = f'{path_cache}/RF_{ism}_BM{bm}.json'
+
+    files = response_function_files(path_lrfs, ism, bm, sectors)
+    sources = {os.path.basename(file): [os.stat(file).st_size, os.stat(file).st_mtime_ns] for file in files}
+    meta = {'ism': ism, 'bm': bm, 'sectors': list(sectors), 
+            'regions': {sector: LRF_sector[sector] for sector in sectors}, 'sources': sources}
+
+    if os.path.isfile(file_cache) and os.path.isfile(file_meta):
+        with open(file_meta) as f:
+            meta_cache = json.load(f)
+        if {key: meta_cache.get(key) for key in meta} == meta:
+            return np.load(file_cache, mmap_mode='r')
+
+    print(f'Compiling response functions RF_{ism}_BM{bm} to {file_cache}')
+    RF = read_response_functions(path_lrfs, ism, bm, sectors)
+    meta['length'] = RF.shape[1]
+    try:
+        os.makedirs(path_cache, exist_ok=True)
+        # Write to temporary files first, so that concurrent readers never see a partial cache
+        with open(f'{file_cache}.{os.getpid()}.tmp', 'wb') as f:
+            np.save(f, RF)
+        os.replace(f'{file_cache}.{os.getpid()}.tmp', file_cache)
+        with open(f'{file_meta}.{os.getpid()}.tmp', 'w') as f:
+            json.dump(meta, f, indent=1)
+        os.replace(f'{file_meta}.{os.getpid()}.tmp', file_meta)
+    except OSError as error:
+        print(f'Could not write response function cache: {error}')
+    return RF
+
+def freshwater_flux_anomaly(t, future_fwf, BM, RF):
+    '''
+    Compute freshwater flux from basal melt anomaly using linear response functions, 
+    updating the cumulative freshwater flux of the future years in place.
+    Several sets of response functions can be applied at once (leading dimension of RF and future_fwf).
+
+    Args:
+        t: current timestep (relative to start) [in years]
+        future_fwf: array ([set,] year, sector) with cumulative freshwater flux anomaly for all years of the experiment
+        BM: basal melt anomaly for X regions
+        RF: array ([set,] sector, lag) with linear response functions for X regions
+    Returns:
+        Freshwater flux from basal melt anomaly for next time step (t+1) ([set,] sector; nan for t=0)
+    '''
+    length = future_fwf.shape[-2]
+    # Contribution of basal melt in year to freshwater flux in future years [year+1:year+lenRF+1], 
+    # only needed up to year_max
+    lenRF = min(RF.shape[-1], length - t)
+    future_fwf[...,t:t+lenRF,:] += np.swapaxes(RF[...,:lenRF] * np.asarray(BM)[:,None], -1, -2)
+    # Compute differences: annual forcing
+    if t == 0:
+        return np.full(future_fwf[...,t,:].shape, np.nan)
+    return future_fwf[...,t,:] - future_fwf[...,t-1,:]
+
+def remove_flux_anomaly(t, future_fwf, BM, RF):
+    '''
+    Remove the contribution of the basal melt anomaly of time step t from the cumulative freshwater flux of the
+    future years in place (inverse of freshwater_flux_anomaly, used to rewind the coupler state)
+
+    Args:
+        t: time step of the basal melt anomaly (relative to start) [in years]
+        future_fwf: array ([set,] year, sector) with cumulative freshwater flux anomaly for all years of the experiment
+        BM: basal melt anomaly of time step t for X regions
+        RF: array ([set,] sector, lag) with linear response functions for X regions
+    '''
+    length = future_fwf.shape[-2]
+    lenRF = min(RF.shape[-1], length - t)
+    future_fwf[...,t:t+lenRF,:] -= np.swapaxes(RF[...,:lenRF] * np.asarray(BM)[:,None], -1, -2)
+
+def forcing_spread(dFWF_sets, FWF_total_yearmin):
+    '''
+    Compute spread (min, median, max) of the freshwater forcing anomaly over several sets of response functions
+
+    Args:
+        dFWF_sets: array (set, sector) with freshwater forcing anomaly for each set of response functions
+        FWF_total_yearmin: baseline total freshwater forcing [Gt/yr]
+    Returns:
+        Array (3, sector) with min, median and max anomaly per sector, 
+        array (3) with min, median and max total freshwater forcing
+    '''
+    FWF_total_sets = np.nansum(dFWF_sets, axis=-1) + FWF_total_yearmin
+    with warnings.catch_warnings():
+        # First year: anomalies are nan
+        warnings.simplefilter('ignore', category=RuntimeWarning)
+        spread = np.stack([np.nanmin(dFWF_sets, axis=0), np.nanmedian(dFWF_sets, axis=0), np.nanmax(dFWF_sets, axis=0)])
+    spread_total = np.array([FWF_total_sets.min(), np.median(FWF_total_sets), FWF_total_sets.max()])
+    return spread, spread_total
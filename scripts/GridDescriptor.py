@@ -0,0 +1,101 @@
+import os
+
+import cftime
+import netCDF4
+import numpy as np
+
+import NemoOutput as NO
+
+###############################################################################
+# Grid descriptor: small cached file with the static grid metadata of the NEMO
+# output (level bounds, grid size and the time axis of a year), so that scripts
+# that only need this metadata do not have to open a full NEMO output file.
+###############################################################################
+
+def build_grid_descriptor(file_thetao, file_descriptor):
+    '''
+    Build grid descriptor from a NEMO output file
+
+    Args:
+        file_thetao: path of NEMO output file (*_opa_grid_T_3D.nc)
+        file_descriptor: path of grid descriptor file (.npz)
+
+    Returns:
+        Dictionary with level bounds, grid shape (y, x) and the time of the records of the source year
+        (raw values, units and calendar)
+    '''
+    with netCDF4.Dataset(file_thetao) as nc:
+        nc_time = nc['time_counter']
+        calendar = nc_time.calendar if 'calendar' in nc_time.ncattrs() else 'standard'
+        time_values = np.asarray(nc_time[:], dtype='float64')
+        descriptor = {'olevel_bounds': np.asarray(nc['olevel_bounds'][:], dtype='float64'),
+                      'grid_shape': np.array(nc['nav_lat'].shape),
+                      'calendar': calendar,
+                      'time_units': nc_time.units,
+                      'time_values': time_values,
+                      'source_year': netCDF4.num2date(time_values[0], nc_time.units, calendar).year,
+                      'source': os.path.basename(file_thetao)}
+
+    file_tmp = f'{file_descriptor}.{os.getpid()}.tmp'
+    with open(file_tmp, 'wb') as f:
+        np.savez(f, **descriptor)
+    os.replace(file_tmp, file_descriptor)
+    return descriptor
+
+def load_grid_descriptor(file_descriptor, file_thetao=None):
+    '''
+    Load grid descriptor, built from file_thetao when it does not exist yet
+
+    Args:
+        file_descriptor: path of grid descriptor file (.npz)
+        file_thetao: path of NEMO output file (optional, only used to build the descriptor)
+
+    Returns:
+        Dictionary with level bounds, grid shape and time of the records (see build_grid_descriptor)
+    '''
+    if os.path.isfile(file_descriptor):
+        with np.load(file_descriptor) as f:
+            descriptor = {var: f[var] if f[var].ndim else f[var].item() for var in f.files}
+        # Descriptor of an older version (time offsets from the start of the year only): built again when possible
+        if 'time_values' in descriptor or file_thetao is None:
+            return descriptor
+    elif file_thetao is None:
+        raise FileNotFoundError(f'Grid descriptor {file_descriptor} does not exist, create it with: fwf.py grid <NEMO output file> <start_dir>')
+    print(f'Building grid descriptor {file_descriptor} from {file_thetao}')
+    return build_grid_descriptor(file_thetao, file_descriptor)
+
+def month_bounds(year, month, units, calendar):
+    '''
+    Start of a month and of the next month in the time units and calendar of the NEMO output
+    '''
+    starts = [cftime.datetime(year, month, 1, calendar=calendar),
+              cftime.datetime(year + month//12, month%12 + 1, 1, calendar=calendar)]
+    return netCDF4.date2num(starts, units, calendar)
+
+def time_template(descriptor, year):
+    '''
+    Time of the records (months) of a year: the time values of the NEMO output file the descriptor was built from
+    for its own year; for another year every record keeps its position within its month (e.g. the middle of the
+    month), converted with the calendar of the file so that month lengths and leap years are respected
+
+    Args:
+        descriptor: grid descriptor
+        year: year
+
+    Returns:
+        Array with datetime64 values (cftime values for a non-standard calendar)
+    '''
+    if 'time_values' not in descriptor:
+        raise ValueError(f"Grid descriptor built from {descriptor['source']} by an older version has no time values, "
+                         'create it again with: fwf.py grid <NEMO output file> <start_dir>')
+    units, calendar = descriptor['time_units'], descriptor['calendar']
+    values = np.asarray(descriptor['time_values'], dtype='float64')
+    if year != descriptor['source_year']:
+        shifted = []
+        for value, date in zip(values, netCDF4.num2date(values, units, calendar)):
+            start, end = month_bounds(date.year, date.month, units, calendar)
+            start_new, end_new = month_bounds(year + date.year - descriptor['source_year'], date.month, units, calendar)
+            shifted.append(start_new + (value - start)/(end - start)*(end_new - start_new))
+        values = np.array(shifted)
+
+    return NO.decode_time(values, units, calendar)
@@ -0,0 +1,184 @@
+import contextlib
+import json
+import os
+import resource
+import sys
+import time
+
+###############################################################################
+# Per-stage instrumentation of the driver scripts: wall time, CPU time, resident
+# memory (RSS) and bytes read/written of every stage of a year are appended as
+# json lines to the stage log of the experiment (next to the monitoring files).
+# Optionally the whole year is profiled with cProfile. Switched on/off in config.py.
+###############################################################################
+
+def io_counters():
+    '''
+    Bytes read and written by this process (rchar, wchar of /proc/self/io: all read/write calls,
+    including from/to the page cache), zeros where not available (macOS)
+    '''
+    try:
+        with open('/proc/self/io') as f:
+            counters = dict(line.split(': ') for line in f.read().splitlines())
+        return int(counters['rchar']), int(counters['wchar'])
+    except (OSError, KeyError):
+        return 0, 0
+
+def current_rss():
+    '''
+    Resident set size [MB] of this process at this moment (resident pages of /proc/self/statm),
+    zero where not available (macOS)
+    '''
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1])*resource.getpagesize()/1024**2
+    except (OSError, IndexError, ValueError):
+        return 0.
+
+def max_rss():
+    '''
+    High-water mark of the resident set size [MB] of this process: the peak since the process started,
+    not of a stage (a long-lived process, e.g. CouplerDaemon.py, reports its peak over all earlier years)
+    '''
+    scale = 1/1024 if sys.platform != 'darwin' else 1/1024**2 # kB on linux, bytes on macOS
+    return scale*resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+def open_stage_log(file_log, script, year, profile=False, file_profile=None):
+    '''
+    Start collecting the stage records of one year
+
+    Args:
+        file_log: path of stage log (json lines), None to not write the records
+        script: name of the driver script
+        year: year of the records
+        profile: profile the year with cProfile (until close_stage_log)
+        file_profile: path of cProfile output file
+
+    Returns:
+        Stage log (dictionary) or None when switched off (no log file and no profile)
+    '''
+    if file_log is None and not profile:
+        return None
+    log = {'file': file_log, 'script': script, 'year': year, 'records': [], 'profiler': None,
+           'file_profile': file_profile, 'start': _counters()}
+    if profile:
+        import cProfile
+        log['profiler'] = cProfile.Profile()
+        log['profiler'].enable()
+    return log
+
+def _counters():
+    '''
+    Wall time, CPU time, bytes read/written and resident set size at this moment
+    '''
+    return (time.perf_counter(), time.process_time()) + io_counters() + (current_rss(),)
+
+def _record(log, name, start):
+    '''
+    Add record of a stage from the counters at the start of the stage: resident set size at the end of the
+    stage (rss_mb), its change during the stage (rss_delta_mb) and the high-water mark of the process (max_rss_mb)
+    '''
+    end = _counters()
+    wall, cpu, read, written, rss_delta = [stop - begin for stop, begin in zip(end, start)]
+    log['records'].append({'script': log['script'], 'year': log['year'], 'stage': name,
+                           'wall_s': round(wall, 6), 'cpu_s': round(cpu, 6),
+                           'rss_mb': round(end[-1], 1), 'rss_delta_mb': round(rss_delta, 1), 'max_rss_mb': round(max_rss(), 1),
+                           'read_mb': round(read/1e6, 3), 'written_mb': round(written/1e6, 3)})
+
+@contextlib.contextmanager
+def stage(log, name):
+    '''
+    Measure the code in a with block as stage name (does nothing if log is None)
+    '''
+    if log is None:
+        yield
+        return
+    start = _counters()
+    try:
+        yield
+    finally:
+        _record(log, name, start)
+
+def close_stage_log(log):
+    '''
+    Add the total of the year, append all records to the stage log and write the profile
+    '''
+    if log is None:
+        return
+    if log['profiler'] is not None:
+        log['profiler'].disable()
+        os.makedirs(os.path.dirname(log['file_profile']), exist_ok=True)
+        log['profiler'].dump_stats(log['file_profile'])
+        print(f"Profile of {log['script']} {log['year']}: {log['file_profile']}")
+    _record(log, 'total', log['start'])
+    if log['file'] is None:
+        return
+
+    # One write per year, so that records of concurrent processes are not interleaved
+    now = time.strftime('%Y-%m-%dT%H:%M:%S')
+    with open(log['file'], 'a') as f:
+        f.write(''.join(json.dumps(dict(record, date=now)) + '\n' for record in log['records']))
+
+def open_year_log(path_output, exp_name, script, year):
+    '''
+    Stage log of one year of a driver script, as set with stage_log and profile in config.py
+
+    Args:
+        path_output: directory of the monitoring files of the experiment
+        exp_name: experiment name
+        script: name of the driver script
+        year: year of the records
+
+    Returns:
+        Stage log (see open_stage_log)
+    '''
+    from config import stage_log, profile
+    return open_stage_log(f'{path_output}/StageLog_{exp_name}.jsonl' if stage_log else None, script, year,
+                          profile, f'{path_output}/profile/{script}_{year}.prof')
+
+@contextlib.contextmanager
+def year_log(path_output, exp_name, script, year):
+    '''
+    Stage log of one year of a driver script (see open_year_log) for a with block; it is closed also when
+    the year fails, so that the records and the profile are written and the profiler is stopped
+    '''
+    log = open_year_log(path_output, exp_name, script, year)
+    try:
+        yield log
+    finally:
+        close_stage_log(log)
+
+def summarise_stage_log(file_log):
+    '''
+    Aggregate the records of a stage log over all years, per script and stage
+
+    Args:
+        file_log: path of stage log
+
+    Returns:
+        Dataframe with number of years, mean/max wall time, total wall and CPU time, max RSS at the end of
+        the stage, max change of RSS during the stage, high-water mark of the process and mean bytes
+        read/written per script and stage
+    '''
+    import pandas as pd
+
+    df = pd.read_json(file_log, lines=True)
+    # Records written before rss_mb was added only have the high-water mark of the process (as peak_rss_mb)
+    if 'peak_rss_mb' in df:
+        df['max_rss_mb'] = df['max_rss_mb'].fillna(df['peak_rss_mb']) if 'max_rss_mb' in df else df['peak_rss_mb']
+    df = df.reindex(columns=df.columns.union(['rss_mb', 'rss_delta_mb'], sort=False))
+    grouped = df.groupby(['script','stage'], sort=False)
+    summary = pd.DataFrame({'years': grouped['year'].nunique(),
+                            'wall mean [s]': grouped['wall_s'].mean(),
+                            'wall max [s]': grouped['wall_s'].max(),
+                            'wall total [s]': grouped['wall_s'].sum(),
+                            'cpu total [s]': grouped['cpu_s'].sum(),
+                            'rss max [MB]': grouped['rss_mb'].max(),
+                            'rss delta max [MB]': grouped['rss_delta_mb'].max(),
+                            'rss high-water [MB]': grouped['max_rss_mb'].max(),
+                            'read mean [MB]': grouped['read_mb'].mean(),
+                            'written mean [MB]': grouped['written_mb'].mean()})
+    # Share of the total wall time of the script (every year has a 'total' record, see close_stage_log)
+    totals = summary.xs('total', level='stage')['wall total [s]']
+    summary['share [%]'] = 100*summary['wall total [s]']/summary.index.get_level_values('script').map(totals).values
+    return summary
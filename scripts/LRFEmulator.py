@@ -0,0 +1,114 @@
+import numpy as np
+import pandas as pd
+
+import BasalMelt as BM
+
+###############################################################################
+# Offline emulator of the interactive freshwater forcing: computes the running mean
+# temperatures, basal melt anomalies and freshwater forcing of a whole experiment at 
+# once from its sector temperatures, by convolving with the linear response functions.
+# Reproduces ThetaoDrivenFreshwaterForcing.py year by year (up to rounding).
+###############################################################################
+
+def running_mean_history(thetao, thetao_baseline, period):
+    '''
+    Compute backward running mean over period for all years at once, padding with
+    baseline values before the start of the experiment (as in running_mean_backward)
+    
+    Args:
+        thetao: array (year, sector) with mean temperatures for the ocean sectors
+        thetao_baseline: array (sector) with mean temperatures in the baseline climate
+        period: length of period (in years) over which running mean is computed
+
+    Returns:
+        Array (year, sector) with running mean values
+    '''
+    thetao = np.asarray(thetao, dtype=float)
+    length = thetao.shape[0]
+    padded = np.concatenate([np.broadcast_to(thetao_baseline, (period,) + thetao.shape[1:]), thetao])
+    cumsum = np.concatenate([np.zeros((1,) + thetao.shape[1:]), np.cumsum(padded, axis=0)])
+    return (cumsum[period+1:period+1+length] - cumsum[1:1+length]) / period
+
+def convolve_response(dBM, RF):
+    '''
+    Compute cumulative freshwater forcing anomaly of all years: contribution of the basal 
+    melt anomaly of each year to the following years (FFT convolution with response functions)
+    
+    Args:
+        dBM: array (..., year, sector) with basal melt anomalies
+        RF: array (..., sector, lag) with linear response functions
+
+    Returns:
+        Array (..., year, sector) with cumulative freshwater forcing anomaly (as 
+        CumulativeFreshwaterForcingAnomaly_*_Future.csv)
+    '''
+    length = dBM.shape[-2]
+    lag = RF.shape[-1]
+    n_fft = 2**int(np.ceil(np.log2(length + lag - 1)))
+    spectrum = np.fft.rfft(dBM, n_fft, axis=-2) * np.fft.rfft(np.swapaxes(RF, -1, -2), n_fft, axis=-2)
+    return np.fft.irfft(spectrum, n_fft, axis=-2)[..., :length, :]
+
+def annual_forcing(future_fwf):
+    '''
+    Compute annual freshwater forcing anomaly (difference of cumulative forcing, nan in first year)
+    '''
+    dFWF = np.full(future_fwf.shape, np.nan)
+    dFWF[..., 1:, :] = np.diff(future_fwf, axis=-2)
+    return dFWF
+
+def emulate_experiment(thetao, thetao_ref, thetao_pad, RF, gamma, period, FWF_total_yearmin):
+    '''
+    Emulate freshwater forcing of an experiment from its sector mean temperatures
+    
+    Args:
+        thetao: array (year, sector) with mean temperatures for the ocean sectors
+        thetao_ref: array (sector) with temperatures used as baseline for basal melt anomalies
+        thetao_pad: array (sector) with temperatures used before the start of the experiment in the running mean
+        RF: array (sector, lag) with linear response functions
+        gamma: basal melt calibration parameter
+        period: running mean period (in years)
+        FWF_total_yearmin: baseline total freshwater forcing [Gt/yr]
+
+    Returns:
+        Dictionary with arrays (year, sector) of running mean temperature, basal melt anomaly,
+        cumulative and annual freshwater forcing anomaly, and total freshwater forcing (year)
+    '''
+    thetao_rm = running_mean_history(thetao, thetao_pad, period)
+    dBM = BM.quadratic_basal_melt(thetao_rm, gamma) - BM.quadratic_basal_melt(np.asarray(thetao_ref), gamma)
+    future_fwf = convolve_response(dBM, RF)
+    dFWF = annual_forcing(future_fwf)
+    FWF_total = np.nansum(dFWF, axis=-1) + FWF_total_yearmin
+    return {'thetao_rm': thetao_rm, 'dBM': dBM, 'future_fwf': future_fwf, 'dFWF': dFWF, 'FWF_total': FWF_total}
+
+def emulate_experiment_df(df_thetao, df_thetao_baseline, RF, gamma, period, FWF_total_yearmin):
+    '''
+    Emulate freshwater forcing of an experiment from its OceanSectorThetao csv file
+    
+    Args:
+        df_thetao: dataframe (index: year) with mean temperatures for the ocean sectors 
+        df_thetao_baseline: dataframe with mean temperatures for the ocean sectors in the baseline climate
+        RF: array (sector, lag) with linear response functions, sectors ordered as in df_thetao
+        gamma: basal melt calibration parameter
+        period: running mean period (in years)
+        FWF_total_yearmin: baseline total freshwater forcing [Gt/yr]
+
+    Returns:
+        Dictionary with dataframes as in the monitoring csv files
+    '''
+    # Running means and the convolution with the response functions step one row per year
+    years = df_thetao.index.values
+    if (np.diff(years) <= 0).any():
+        raise ValueError('Years of the temperatures are not in increasing order (each year once), sort them with sort_index()')
+    missing = sorted(set(range(years[0], years[-1]+1)) - set(years)) if len(years) else []
+    if missing:
+        raise ValueError(f'Years {missing} are missing from the temperatures of years {years[0]}-{years[-1]}: '
+                         f'compute them first (e.g. with analysis/BatchThetaoSectors.py)')
+    sectors = list(df_thetao.columns)
+    emulated = emulate_experiment(df_thetao.values, df_thetao_baseline.loc[1850, sectors].values, 
+                                  df_thetao_baseline[sectors].mean().values, RF, gamma, period, FWF_total_yearmin)
+    dfs = {}
+    for var in ['thetao_rm', 'dBM', 'dFWF']:
+        dfs[var] = pd.DataFrame(emulated[var], index=df_thetao.index, columns=sectors)
+    dfs['FWF_total'] = pd.DataFrame(emulated['FWF_total'], index=df_thetao.index, columns=['0'])
+    dfs['future_fwf'] = pd.DataFrame(emulated['future_fwf'], columns=sectors)
+    return dfs
@@ -0,0 +1,327 @@
+import netCDF4
+import numpy as np
+
+import DataVariablesParameters as dvp
+import ThetaoSectors as TS
+import SectorOperator as SO
+
+###############################################################################
+# xarray is imported in the functions that use it; read_annual_mean reads the
+# sector rows and layers with netCDF4 only (fast start, see fwf.py)
+###############################################################################
+
+def sector_rows(index, sectors):
+    '''
+    Find range of grid rows (j) covering all ocean sectors
+    
+    Args:
+        index: sector index (see SectorIndex.py)
+        sectors: list of ocean sector names
+
+    Returns:
+        First row and last row + 1
+    '''
+    j_min = min(int(index[sector]['j'].min()) for sector in sectors)
+    j_max = max(int(index[sector]['j'].max()) for sector in sectors)
+    return j_min, j_max+1
+
+def sector_levels(ds_lev_bnds, sectors):
+    '''
+    Find range of oceanic layers (lev) covering the depth bounds of all ocean sectors
+    
+    Args:
+        ds_lev_bnds: dataarray with lev_bnds
+        sectors: list of ocean sector names
+
+    Returns:
+        First layer and last layer + 1
+    '''
+    lev_bnds = np.asarray(ds_lev_bnds)
+    levs = [TS.lev_indices(lev_bnds, *dvp.sel_depth_bnds(sector)) for sector in sectors]
+    lev_min = min(int(lev_top) for lev_top, lev_bottom in levs)
+    lev_max = max(int(lev_bottom) for lev_top, lev_bottom in levs)
+    return lev_min, lev_max+1
+
+def subset_sector_index(index, j_min):
+    '''
+    Shift sector index to a subset of the grid starting at row j_min
+    '''
+    return {sector: dict(index[sector], j=index[sector]['j']-j_min) for sector in index}
+
+def open_thetao_subset(file_thetao, index, sectors):
+    '''
+    Open NEMO grid_T_3D file, only selecting the rows and layers needed for the ocean sectors.
+    Data is read lazily, so only this hyperslab of thetao is read from disk.
+    
+    Args:
+        file_thetao: path of NEMO output file (*_opa_grid_T_3D.nc)
+        index: sector index (see SectorIndex.py)
+        sectors: list of ocean sector names
+
+    Returns:
+        Dataset with dimensions renamed to be consistent with areacello file, 
+        sector index shifted to the selected rows
+    '''
+    import xarray as xr
+
+    ## Open thetao dataset + rename dimensions (to be consistent with areacello file)
+    ds = xr.open_dataset(file_thetao)
+    ds = ds.rename({'y':'j','x':'i','nav_lon':'longitude','nav_lat':'latitude','olevel':'lev'})
+
+    j_min, j_max = sector_rows(index, sectors)
+    lev_min, lev_max = sector_levels(ds['olevel_bounds'], sectors)
+    print(f'Reading rows {j_min}:{j_max} and layers {lev_min}:{lev_max} of {file_thetao}')
+
+    ds = ds.isel(j=slice(j_min,j_max), lev=slice(lev_min,lev_max))
+    return ds, subset_sector_index(index, j_min)
+
+def record_lengths(ds, time='time_counter'):
+    '''
+    Compute length of each record (month) in days, from the time bounds if available,
+    otherwise from the month of each time stamp. Both respect the calendar of the file 
+    (e.g. no leap days for a noleap calendar).
+    
+    Args:
+        ds: dataset with time coordinate
+        time: name of time coordinate
+
+    Returns:
+        Array with record lengths [days]
+    '''
+    bnds = ds[time].attrs.get('bounds', f'{time}_bounds')
+    if bnds in ds.variables:
+        time_bnds = ds[bnds].values
+        lengths = np.asarray(time_bnds[:,1]-time_bnds[:,0], dtype='timedelta64[s]')
+        return lengths.astype(float)/(24*3600)
+    return ds[time].dt.days_in_month.values.astype(float)
+
+def annual_mean(ds, var='thetao', time='time_counter'):
+    '''
+    Compute month length weighted annual mean, reading one record at a time so that 
+    only a single record is held in memory next to the accumulated sums
+    
+    Args:
+        ds: dataset with monthly records of variable (opened lazily, optionally subsetted)
+        var: name of variable
+        time: name of time coordinate
+
+    Returns:
+        Dataarray with annual mean of variable
+    '''
+    da = ds[var]
+    weights = record_lengths(ds, time)
+
+    total = np.zeros(da.isel({time: 0}).shape)
+    total_weights = np.zeros(total.shape)
+    for t in range(da.sizes[time]):
+        record = da.isel({time: t}).values.astype('float64')
+        valid = np.isfinite(record)
+        record[~valid] = 0.
+        record *= weights[t]
+        total += record
+        np.add(total_weights, weights[t], out=total_weights, where=valid)
+
+    # Cells without any valid record (land) remain missing
+    with np.errstate(invalid='ignore', divide='ignore'):
+        total /= total_weights
+
+    import xarray as xr
+    template = da.isel({time: 0}, drop=True)
+    return xr.DataArray(total, dims=template.dims, coords=template.coords, name=var, attrs=da.attrs)
+
+## Length of the time units of netcdf files in days
+time_unit_days = {'days': 1., 'hours': 1/24, 'minutes': 1/(24*60), 'seconds': 1/(24*3600)}
+
+def record_lengths_netcdf(nc, time='time_counter'):
+    '''
+    Compute length of each record (month) in days for a file opened with netCDF4 (see record_lengths)
+    
+    Args:
+        nc: netCDF4 dataset with time variable
+        time: name of time variable
+
+    Returns:
+        Array with record lengths [days]
+    '''
+    nc_time = nc[time]
+    bnds = nc_time.bounds if 'bounds' in nc_time.ncattrs() else f'{time}_bounds'
+    if bnds in nc.variables:
+        time_bnds = np.asarray(nc[bnds][:], dtype='float64')
+        return (time_bnds[:,1]-time_bnds[:,0])*time_unit_days[nc_time.units.split()[0]]
+    calendar = nc_time.calendar if 'calendar' in nc_time.ncattrs() else 'standard'
+    dates = netCDF4.num2date(nc_time[:], nc_time.units, calendar)
+    return np.array([date.daysinmonth for date in dates], dtype=float)
+
+def decode_time(values, units, calendar):
+    '''
+    Decode time values of a netcdf file as xarray does: exact datetime64 values for a standard calendar
+    (cftime values for other calendars)
+
+    Args:
+        values: time values
+        units: units of the time values (e.g. 'seconds since 1850-01-01 00:00:00')
+        calendar: calendar of the time values
+
+    Returns:
+        Array with datetime64 (or cftime) values
+    '''
+    if calendar not in ['standard', 'gregorian', 'proleptic_gregorian']:
+        return netCDF4.num2date(values, units, calendar)
+    unit, reference = units.split(' since ')
+    step = round(time_unit_days[unit]*86400*10**9) # [ns]
+    return np.datetime64(reference.strip().replace(' ', 'T'), 'ns') + np.round(np.asarray(values, dtype='float64')*step).astype('timedelta64[ns]')
+
+def read_time(file_thetao, time='time_counter'):
+    '''
+    Time of the records of a NEMO output file, read with netCDF4 (same values as the time coordinate of xarray)
+    '''
+    with netCDF4.Dataset(file_thetao) as nc:
+        nc_time = nc[time]
+        calendar = nc_time.calendar if 'calendar' in nc_time.ncattrs() else 'standard'
+        return decode_time(nc_time[:], nc_time.units, calendar)
+
+def read_annual_mean(file_thetao, index, sectors, var='thetao', time='time_counter'):
+    '''
+    Read the rows and layers covering the ocean sectors with netCDF4 and compute the month length 
+    weighted annual mean, one record at a time. Gives the same result as open_thetao_subset followed
+    by annual_mean, without loading xarray.
+    
+    Args:
+        file_thetao: path of NEMO output file (*_opa_grid_T_3D.nc), variable with dimensions (time, lev, y, x)
+        index: sector index (see SectorIndex.py)
+        sectors: list of ocean sector names
+        var: name of variable
+        time: name of time variable
+
+    Returns:
+        Array with annual mean (lev, j, i), level bounds of the selected layers,
+        sector index shifted to the selected rows
+    '''
+    with netCDF4.Dataset(file_thetao) as nc:
+        lev_bnds = np.asarray(nc['olevel_bounds'][:])
+        j_min, j_max = sector_rows(index, sectors)
+        lev_min, lev_max = sector_levels(lev_bnds, sectors)
+        print(f'Reading rows {j_min}:{j_max} and layers {lev_min}:{lev_max} of {file_thetao}')
+
+        weights = record_lengths_netcdf(nc, time)
+        total = annual_mean_block(nc[var], weights, slice(lev_min, lev_max), slice(j_min, j_max))
+    return total, lev_bnds[lev_min:lev_max], subset_sector_index(index, j_min)
+
+def annual_mean_block(nc_var, weights, lev_slice, j_slice):
+    '''
+    Month length weighted annual mean of a block of layers and rows (all columns) of a variable
+    opened with netCDF4, reading one record at a time
+    
+    Args:
+        nc_var: netCDF4 variable with dimensions (time, lev, y, x)
+        weights: record lengths [days] (see record_lengths_netcdf)
+        lev_slice, j_slice: layers and rows of the block
+
+    Returns:
+        Array with annual mean of the block (lev, j, i), missing values (land) as nan
+    '''
+    total = None
+    for t in range(nc_var.shape[0]):
+        # Missing values (land) are masked by netCDF4, set to nan as in xarray
+        record = np.ma.filled(nc_var[t, lev_slice, j_slice, :].astype('float64'), np.nan)
+        if total is None:
+            total = np.zeros(record.shape)
+            total_weights = np.zeros(record.shape)
+        valid = np.isfinite(record)
+        record[~valid] = 0.
+        record *= weights[t]
+        total += record
+        np.add(total_weights, weights[t], out=total_weights, where=valid)
+
+    # Cells without any valid record (land) remain missing
+    with np.errstate(invalid='ignore', divide='ignore'):
+        total /= total_weights
+    return total
+
+## Memory per cell of a block [bytes]: sums, weights and record in float64, record as read (float32 + mask)
+bytes_per_cell = 40
+
+def block_slices(shape, memory_budget):
+    '''
+    Split a field in blocks that fit in the memory budget: blocks of whole layers, or blocks 
+    of rows of a single layer when one layer does not fit
+    
+    Args:
+        shape: shape of the field (lev, j, i)
+        memory_budget: memory budget [MB] for a block, None for the whole field in one block
+
+    Returns:
+        List of (layer slice, row slice) of the blocks
+    '''
+    n_lev, n_j, n_i = shape
+    if memory_budget is None:
+        return [(slice(0, n_lev), slice(0, n_j))]
+    cells = max(1, int(memory_budget*1.e6/bytes_per_cell))
+    if cells >= n_j*n_i:
+        levs = cells//(n_j*n_i)
+        return [(slice(lev, min(lev+levs, n_lev)), slice(0, n_j)) for lev in range(0, n_lev, levs)]
+    rows = max(1, cells//n_i)
+    return [(slice(lev, lev+1), slice(j, min(j+rows, n_j))) for lev in range(n_lev) for j in range(0, n_j, rows)]
+
+def sector_means_blocked(file_thetao, index, sectors, memory_budget, operator=None, var='thetao', time='time_counter'):
+    '''
+    Annual volume weighted mean per sector, computed block by block (see block_slices) so that 
+    only one block of the annual mean is in memory. The weighted sums of the blocks are added up,
+    which gives the same means as read_annual_mean followed by SectorOperator.apply_volume_operator
+    (identical for the sectors when the blocks are whole layers, up to rounding for 'anta').
+    
+    Args:
+        file_thetao: path of NEMO output file (*_opa_grid_T_3D.nc), variable with dimensions (time, lev, y, x)
+        index: sector index (see SectorIndex.py)
+        sectors: list of ocean sector names
+        memory_budget: memory budget [MB] for a block of the field, None for the whole field at once
+        operator: sector volume operator of the field (optional, built when missing or of another shape)
+        var: name of variable
+        time: name of time variable
+
+    Returns:
+        Dictionary with volume weighted mean per sector (and 'anta'), sector volume operator
+    '''
+    with netCDF4.Dataset(file_thetao) as nc:
+        lev_bnds = np.asarray(nc['olevel_bounds'][:])
+        j_min, j_max = sector_rows(index, sectors)
+        lev_min, lev_max = sector_levels(lev_bnds, sectors)
+        nc_var = nc[var]
+        shape = (lev_max-lev_min, j_max-j_min, nc_var.shape[-1])
+        if operator is None or operator['shape'] != shape:
+            operator = SO.build_volume_operator(subset_sector_index(index, j_min), lev_bnds[lev_min:lev_max], sectors, shape)
+
+        blocks = block_slices(shape, memory_budget)
+        print(f'Reading rows {j_min}:{j_max} and layers {lev_min}:{lev_max} of {file_thetao} in {len(blocks)} blocks')
+        weights = record_lengths_netcdf(nc, time)
+        row_sum = np.zeros(operator['row_weight'].size)
+        row_weights = np.zeros(row_sum.shape)
+        for lev_slice, j_slice in blocks:
+            block = annual_mean_block(nc_var, weights, slice(lev_min+lev_slice.start, lev_min+lev_slice.stop),
+                                      slice(j_min+j_slice.start, j_min+j_slice.stop))
+            block_sum, block_weights = SO.block_row_sums(operator, block, lev_slice, j_slice)
+            row_sum += block_sum
+            row_weights += block_weights
+    return SO.sector_means(operator, row_sum, row_weights), operator
+
+def sector_mean_thetao(file_thetao, index, sectors, memory_budget=None):
+    '''
+    Compute annual volume weighted mean ocean temperature per sector from a NEMO grid_T_3D file
+    
+    Args:
+        file_thetao: path of NEMO output file (*_opa_grid_T_3D.nc)
+        index: sector index (see SectorIndex.py)
+        sectors: list of ocean sector names
+        memory_budget: memory budget [MB], computed in blocks (see sector_means_blocked) if not None
+
+    Returns:
+        Dictionary with volume weighted mean temperature per sector (and 'anta')
+    '''
+    if memory_budget is not None:
+        return sector_means_blocked(file_thetao, index, sectors, memory_budget)[0]
+    ds, index_subset = open_thetao_subset(file_thetao, index, sectors)
+    ds_thetao_year = annual_mean(ds, 'thetao')
+    volume_operator = SO.build_volume_operator(index_subset, ds['olevel_bounds'], sectors, ds_thetao_year.shape)
+    thetao_sectors = SO.apply_volume_operator(volume_operator, ds_thetao_year)
+    ds.close()
+    return thetao_sectors
@@ -0,0 +1,83 @@
+import itertools
+
+import numpy as np
+import xarray as xr
+
+import BasalMelt as BM
+import LRFEmulator as LE
+
+###############################################################################
+# Parameter ensemble of the interactive freshwater forcing: basal melt anomalies and
+# LRF-driven forcing for many combinations of gamma, freezing point temperature and 
+# running mean period, computed from a stored sector temperature history as one 
+# broadcast computation (see LRFEmulator.py for a single parameter set).
+###############################################################################
+
+def parameter_grid(gamma, T_f, period):
+    '''
+    Create all combinations of parameter values
+    
+    Args:
+        gamma: values of basal melt calibration parameter
+        T_f: values of freezing point temperature
+        period: values of running mean period (in years)
+
+    Returns:
+        Arrays of gamma, T_f and period, one value per combination
+    '''
+    combinations = np.array(list(itertools.product(np.atleast_1d(gamma), np.atleast_1d(T_f), np.atleast_1d(period))))
+    return combinations[:,0], combinations[:,1], combinations[:,2].astype(int)
+
+def ensemble_forcing(thetao, thetao_ref, thetao_pad, RF, gamma, T_f, period, FWF_total_yearmin, years=None, sectors=None):
+    '''
+    Compute basal melt anomalies and freshwater forcing for an ensemble of parameter combinations
+    
+    Args:
+        thetao: array (year, sector) with mean temperatures for the ocean sectors
+        thetao_ref: array (sector) with temperatures used as baseline for basal melt anomalies
+        thetao_pad: array (sector) with temperatures used before the start of the experiment in the running mean
+        RF: array (sector, lag) with linear response functions
+        gamma: array (param) with basal melt calibration parameters
+        T_f: array (param) with freezing point temperatures
+        period: array (param) with running mean periods (in years)
+        FWF_total_yearmin: baseline total freshwater forcing [Gt/yr]
+        years: years of thetao (optional)
+        sectors: names of sectors (optional)
+
+    Returns:
+        Dataset with dimensions (param, year, sector) of running mean temperature, basal melt 
+        anomaly, annual freshwater forcing anomaly, and total freshwater forcing (param, year)
+    '''
+    gamma, T_f, period = np.broadcast_arrays(np.atleast_1d(gamma), np.atleast_1d(T_f), np.atleast_1d(period))
+    thetao = np.asarray(thetao, dtype=float)
+    length, n_sectors = thetao.shape
+
+    # Running mean only computed once for each distinct period
+    periods, inverse = np.unique(period, return_inverse=True)
+    thetao_rm = np.stack([LE.running_mean_history(thetao, thetao_pad, p) for p in periods])[inverse]
+
+    # Basal melt anomalies (param, year, sector)
+    gamma_b = gamma[:,None,None]
+    T_f_b = T_f[:,None,None]
+    dBM = BM.basal_melt_anomalies(np.asarray(thetao_ref)[None,None,:], thetao_rm, gamma_b, T_f_b)
+
+    # Freshwater forcing (convolution along years for all parameters at once)
+    dFWF = LE.annual_forcing(LE.convolve_response(dBM, RF))
+    FWF_total = np.nansum(dFWF, axis=-1) + FWF_total_yearmin
+
+    coords = {'gamma': ('param', gamma), 'T_f': ('param', T_f), 'period': ('param', period),
+              'year': np.arange(length) if years is None else np.asarray(years),
+              'sector': np.arange(n_sectors) if sectors is None else list(sectors)}
+    return xr.Dataset({'thetao_rm': (('param','year','sector'), thetao_rm),
+                       'dBM': (('param','year','sector'), dBM),
+                       'dFWF': (('param','year','sector'), dFWF),
+                       'FWF_total': (('param','year'), FWF_total)}, coords=coords)
+
+def ensemble_forcing_df(df_thetao, df_thetao_baseline, RF, gamma, T_f, period, FWF_total_yearmin):
+    '''
+    Compute parameter ensemble from an OceanSectorThetao csv file (see ensemble_forcing)
+    '''
+    sectors = list(df_thetao.columns)
+    return ensemble_forcing(df_thetao.values, df_thetao_baseline.loc[1850, sectors].values,
+                            df_thetao_baseline[sectors].mean().values, RF, gamma, T_f, period, 
+                            FWF_total_yearmin, years=df_thetao.index.values, sectors=sectors)
@@ -2,14 +2,16 @@
 # 2023-06: Eveline van der Linden (KNMI) linden@knmi.nl
 
 ## Import modules
+# Note: no xarray/pandas at module level, so that the script starts fast (pandas is only loaded in the first year)
 import os
-import xarray as xr
-import pandas as pd
-import numpy as np
 import sys
 
-import ThetaoSectors as TS
-from config import running_mean_period
+import SectorIndex as SI
+import NemoOutput as NO
+import SectorOperator as SO
+import CouplerState as CS
+import Instrumentation as IN
+from config import running_mean_period, running_mean_periods_monitor, memory_budget, monitoring_interval
 
 
 print('Number of arguments:', len(sys.argv), 'arguments.')
@@ -33,6 +35,7 @@ path_output = f'{start_dir}/fwf/interactive/forcing_files/{exp_name}/' #Create o
 
 ## Input data
 file_area = f'{path_input}/areacello_Ofx_EC-Earth3_historical_r1i1p1f1_gn.nc'
+file_sector_index = f'{path_input}/SectorIndex_ORCA1.npz' # cached, rebuilt when area file or sectors change
 file_basal_melt_mask = f'{path_input}/basal_melt_mask_ORCA1_ocean.nc'
 file_calving_mask = f'{path_input}/calving_mask_ORCA1_ocean.nc'
 
@@ -52,77 +55,80 @@ file_forcing = f'{path_output}/FWF_LRF_y{year_min}.nc'
 spy               = 3600*24*365   # [s yr^-1]
 kg_per_Gt         = 1e12         # [kg] to [Gt]
 
-## Intermediate output files
-output_thetao =f'{path_output}/OceanSectorThetao_{exp_name}_{year_min}_{year_max}.csv'
-output_thetao_RM = f'{path_output}/OceanSectorThetao_{running_mean_period}yRM_{exp_name}_{year_min}_{year_max}.csv'
-
-##################### Sector mean thetao computation (part of analysis) ############################
-
-## Open thetao dataset + rename dimensions (to be consistent with areacello file)
-ds = xr.open_dataset(file_thetao)
-ds = ds.rename({'y':'j','x':'i','nav_lon':'longitude','nav_lat':'latitude','olevel':'lev'})
-
-## Compute time mean value over annual file 
-ds_thetao_year = ds['thetao'].mean('time_counter')
-
-# Read lev bnds
-ds_lev_bnds = ds['olevel_bounds']
-
-## Open areacello dataset
-ds_area = xr.open_dataset(file_area)
-
-## Sector names, consistent with linear response functions
-sectors = ['eais','wedd','amun','ross','apen']
-
-## Create dataframe for mean ocean temperatures per sector
-df_thetao_year = pd.DataFrame(columns=sectors, index=[year])
-df_thetao_year.index.name = 'year'
-
-## Loop over oceanic sectors
-for sector in sectors:
-
-    # Compute area weighted mean temperature
-    print('Computing area weighted mean of thetao for ', sector, 'sector')           
-    thetao_area_weighted_mean = TS.area_weighted_mean(ds_thetao_year,ds_area,sector)
-
-    # Compute layer weighted mean of area weighted mean --> volume weighted mean
-    thetao_volume_weighted_mean = TS.lev_weighted_mean(thetao_area_weighted_mean,ds_lev_bnds,sector)
-
-    # Create dataframe from dataarray
-    print('Fill dataframe for sector ', sector)
-    df_thetao_year[sector] = [thetao_volume_weighted_mean.values]
-
-## Export data 
-print(f'##### Exporting data of year {year} to csv file ##############')
-print(output_thetao)
-
-if year==year_min:
-    # Create output file for the first year
-    if os.path.isfile(output_thetao):    
-        os.remove(output_thetao)    
-
-    df_thetao_year.to_csv(output_thetao)
-elif year>year_min:
-    # Append to existing file (if file exists)
-    df_thetao_year.to_csv(output_thetao, mode='a', header=not os.path.exists(output_thetao))
-
-ds_area.close()
-
-## Read data from csv file 
-df_thetao_all = pd.read_csv(output_thetao)
-## Read baseline thetao
-df_thetao_baseline = pd.read_csv(file_baseline_thetao,index_col=0)
-
-# Compute thetao running mean
-df_thetao_running_mean = TS.running_mean_backward(df_thetao_all, df_thetao_baseline, year, year_min, running_mean_period)
-
-# Write output to file
-if year==year_min:
-    # Create output file for the first year
-    if os.path.isfile(output_thetao_RM):    
-        os.remove(output_thetao_RM)    
-
-    df_thetao_running_mean.to_csv(output_thetao_RM)
-elif year>year_min:
-    df_thetao_running_mean.to_csv(output_thetao_RM, mode='a', header=not os.path.exists(output_thetao_RM))
+## Coupler state store (the monitoring csv files are exported from it at the end of the experiment
+## or with ExportMonitoring.py)
+path_state = f'{path_output}/CouplerState_{exp_name}_{year_min}_{year_max}'
+
+## Stage log: wall/CPU time, resident memory and bytes read/written per stage (see stage_log and profile in config.py)
+## (written also when the year fails)
+with IN.year_log(path_output, exp_name, 'PrescribedFreshwaterForcing', year) as log:
+
+    ##################### Sector mean thetao computation (part of analysis) ############################
+
+    ## Sector names, consistent with linear response functions
+    sectors = ['eais','wedd','amun','ross','apen']
+
+    ## Load sector index (cells and area weights per sector)
+    with IN.stage(log, 'load_static'):
+        sector_index = SI.load_sector_index(file_area, file_sector_index, sectors)
+
+    if memory_budget is None:
+        ## Read rows and layers covering the sectors from thetao file and compute month length weighted 
+        ## time mean value over annual file (one month at a time), together with the lev bnds of these layers
+        with IN.stage(log, 'read_thetao'):
+            ds_thetao_year, ds_lev_bnds, sector_index_subset = NO.read_annual_mean(file_thetao, sector_index, sectors, 'thetao')
+
+        ## Compute volume weighted mean temperature of all sectors in one pass 
+        print('Computing volume weighted mean of thetao for all sectors')
+        with IN.stage(log, 'sector_mean'):
+            volume_operator = SO.build_volume_operator(sector_index_subset, ds_lev_bnds, sectors, ds_thetao_year.shape)
+            thetao_volume_weighted_mean = SO.apply_volume_operator(volume_operator, ds_thetao_year)
+    else:
+        ## Same annual mean and volume weighted means, computed in blocks that fit in the memory budget
+        print(f'Computing volume weighted mean of thetao for all sectors (memory budget {memory_budget} MB)')
+        with IN.stage(log, 'sector_mean_blocked'):
+            thetao_volume_weighted_mean, volume_operator = NO.sector_means_blocked(file_thetao, sector_index, sectors, memory_budget)
+
+    ## Store data of year in coupler state
+    print(f'##### Storing data of year {year} in {path_state} ##############')
+
+    ## Running mean periods: first period is used for the forcing, others for monitoring only
+    running_mean_periods = [running_mean_period] + [p for p in running_mean_periods_monitor if p != running_mean_period]
+
+    with IN.stage(log, 'open_state'):
+        if year==year_min or not os.path.isdir(path_state):
+            if year > year_min:
+                # Experiment started with the csv version: temperatures of the earlier years from the monitoring file,
+                # read before the state store is created so that nothing is written when they are missing
+                print(f'##### Coupler state {path_state} is missing: creating it from the monitoring files of years {year_min}-{year-1}')
+                thetao_history = CS.read_thetao_history(path_state, path_output, exp_name, year_min, year_max, year, sectors)
+            # Create state store and running mean buffer (filled with baseline values)
+            import pandas as pd
+            df_thetao_baseline = pd.read_csv(file_baseline_thetao,index_col=0)
+            state = CS.create_state(path_state, year_min, year_max, sectors, running_mean_periods)
+            CS.init_running_mean(state, df_thetao_baseline[sectors].mean().values)
+            for t in range(year-year_min):
+                CS.update_running_mean(state, t, thetao_history[t])
+        else:
+            state = CS.open_state(path_state)
+
+    t = year - year_min # time step (counting in years from the start of the experiment)
+    ## A year that was computed before replaces the results of this and later years; years are computed in order
+    if t < CS.next_step(state):
+        print(f'##### Year {year} was computed before: removed years {year}-{year_min+CS.next_step(state)-1} from the coupler state')
+        CS.rewind_state(state, t)
+    elif t > CS.next_step(state):
+        raise ValueError(f'Year {year_min + CS.next_step(state)} has not been computed yet, cannot compute year {year}')
+
+    with IN.stage(log, 'running_mean'):
+        # Compute thetao running means (O(1) update of the running mean buffer)
+        CS.update_running_mean(state, t, [thetao_volume_weighted_mean[sector] for sector in sectors])
+
+    with IN.stage(log, 'flush_state'):
+        CS.flush_state(state)
+
+    # Export monitoring files at the end of the experiment (and every monitoring_interval years when set)
+    if year==year_max or (monitoring_interval is not None and (t+1) % monitoring_interval == 0):
+        with IN.stage(log, 'export_csv'):
+            CS.export_csv(state, path_output, exp_name, running_mean_period, variables=['thetao','thetao_rm'])
 
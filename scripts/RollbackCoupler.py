@@ -0,0 +1,53 @@
+# Rewind the coupler state and outputs of an experiment to the end of a year, e.g. before restarting EC-Earth
+# from an older restart: the contributions of the later years to the cumulative freshwater forcing are subtracted
+# (no year is computed again), the forcing files of the later years are removed and the monitoring csv files exported
+# Usage: python RollbackCoupler.py year_min year_max year exp_name start_dir
+#   year: last year to keep (year_min-1 removes all years); the next leg computes year+1
+
+## Import modules
+import os
+import sys
+
+import numpy as np
+
+import Coupler as CP
+import CouplerState as CS
+import FreshWaterForcing as FWF
+from config import ism, bm, running_mean_period
+
+print('Argument List:', str(sys.argv))
+
+## Total experiment and last year to keep
+year_min = int(sys.argv[1])
+year_max = int(sys.argv[2])
+year = int(sys.argv[3])
+exp_name = str(sys.argv[4])
+start_dir = str(sys.argv[5])
+
+files = CP.coupler_files(year_min, year_max, exp_name, start_dir, None)
+state = CS.open_state(files['path_state'])
+year_last = year_min + CS.next_step(state) - 1
+if not year_min-1 <= year < year_last:
+    sys.exit(f'Nothing to roll back: last year in {files["path_state"]} is {year_last}, keep a year from {year_min-1} to {year_last-1}')
+
+## Years with interactive forcing (basal melt anomaly and forcing file), the others only have temperatures
+forced = ~np.isnan(state['dBM']).all(axis=1)
+years_forced = [y for y in range(year+1, year_last+1) if forced[y-year_min]]
+
+# Monitoring files of the experiment before the rollback (forcing files only with interactive forcing)
+variables = CS.monitoring_variables(state)
+
+## Only the response functions are needed to remove the contributions to the cumulative forcing
+static = {'RF': FWF.load_response_functions(files['path_lrfs'], ism, bm, CP.sectors) if years_forced else None,
+          'RF_shadow': {}}
+removed = CP.rewind_coupler_state(files, static, state, year)
+print(f'Removed years {removed[-1]}-{removed[0]} from {files["path_state"]}')
+
+## Forcing files computed from the removed years (the forcing file of year+1 is kept)
+for year_forced in years_forced:
+    file_forcing = CP.forcing_file(files, year_forced)
+    if os.path.isfile(file_forcing):
+        os.remove(file_forcing)
+        print(f'Removed {file_forcing}')
+
+CS.export_csv(state, files['path_output'], exp_name, running_mean_period, variables)
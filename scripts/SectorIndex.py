@@ -0,0 +1,91 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+
+import DataVariablesParameters as dvp
+
+###############################################################################
+
+def sector_index_key(file_area, sectors):
+    '''
+    Compute key identifying the area file and the sector definitions used to build a sector index
+    
+    Args:
+        file_area: path of areacello file
+        sectors: list of ocean sector names
+
+    Returns:
+        Hexadecimal key, changes when the area file or the sector definitions change
+    '''
+    stat = os.stat(file_area)
+    definition = {'version': 2, # format of the index file
+                  'area_file': [stat.st_size, stat.st_mtime_ns],
+                  'sectors': list(sectors),
+                  'sector_boxes': dvp.sector_boxes}
+    return hashlib.sha1(json.dumps(definition, sort_keys=True).encode()).hexdigest()
+
+def build_sector_index(ds_area, sectors):
+    '''
+    Build index of the grid cells in each ocean sector with normalised area weights
+    
+    Args:
+        ds_area: dataset with areacello
+        sectors: list of ocean sector names
+
+    Returns:
+        Dictionary with per sector the (j,i) indices, areas, normalised area weights and 
+        latitudes of all cells with a non-zero area
+    '''
+    area = ds_area.areacello
+    area_values = area.values
+    latitudes = ds_area.coords['latitude'] if 'latitude' in ds_area.coords else ds_area.coords['lat']
+
+    index = {}
+    for sector in sectors:
+        mask_sector = dvp.sel_mask(ds_area,sector).transpose(*area.dims).values
+        # Cells without area (land, nan) do not contribute to the weighted mean
+        mask_sector = mask_sector & np.isfinite(area_values) & (np.nan_to_num(area_values) > 0)
+        j, i = np.nonzero(mask_sector)
+        weights = area_values[j,i]
+        index[sector] = {'j': j,
+                         'i': i,
+                         'area': weights,
+                         'weights': weights/weights.sum(),
+                         'lat': latitudes.transpose(*area.dims).values[j,i]}
+    return index
+
+def load_sector_index(file_area, file_index, sectors):
+    '''
+    Load sector index from file, (re)building it when the file is missing or out of date
+    
+    Args:
+        file_area: path of areacello file
+        file_index: path of (cached) sector index file (.npz)
+        sectors: list of ocean sector names
+
+    Returns:
+        Dictionary with per sector the (j,i) indices, areas, normalised area weights and latitudes
+    '''
+    key = sector_index_key(file_area, sectors)
+
+    if os.path.isfile(file_index):
+        with np.load(file_index) as f:
+            if str(f['key']) == key:
+                return {sector: {var: f[f'{sector}_{var}'] for var in ['j','i','area','weights','lat']} 
+                        for sector in sectors}
+        print(f'Sector index {file_index} is out of date')
+
+    print(f'Building sector index {file_index}')
+    import xarray as xr # only needed to build the index
+    with xr.open_dataset(file_area) as ds_area:
+        index = build_sector_index(ds_area, sectors)
+
+    # Write to temporary file first, so that concurrent readers never see a partial file
+    arrays = {f'{sector}_{var}': index[sector][var] for sector in sectors for var in index[sector]}
+    file_tmp = f'{file_index}.{os.getpid()}.tmp'
+    with open(file_tmp, 'wb') as f:
+        np.savez(f, key=key, **arrays)
+    os.replace(file_tmp, file_index)
+    return index
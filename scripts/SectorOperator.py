@@ -0,0 +1,196 @@
+import numpy as np
+
+import DataVariablesParameters as dvp
+import ThetaoSectors as TS
+
+###############################################################################
+# Sparse sector volume operator: computes the volume weighted mean of a 3D field 
+# (lev, j, i) for all sectors at once. Each row of the operator is one layer of one 
+# sector; row values are the area weights of the sector cells in that layer. 
+# Rows are combined per sector with the (partial) layer thickness as weights, 
+# which gives the same result as area_weighted_mean followed by lev_weighted_mean.
+###############################################################################
+
+def layer_weights(ds_lev_bnds, depth_top, depth_bottom):
+    '''
+    Compute thickness of each oceanic layer within a depth range
+    
+    Args:
+        ds_lev_bnds: dataarray with lev_bnds
+        depth_top: upper depth of range
+        depth_bottom: lower depth of range
+
+    Returns:
+        Index of top layer, layer thicknesses from the top layer down to the bottom layer
+
+    The bounds are not modified. The original lev_weighted_mean clipped them in place, so that every sector after 
+    the first one used the bounds clipped by the sectors before it.
+    '''
+    lev_ind_top, lev_ind_bottom = TS.lev_indices(ds_lev_bnds, depth_top, depth_bottom)
+    lev_bnds_sel = np.clip(np.asarray(ds_lev_bnds)[lev_ind_top:lev_ind_bottom+1], depth_top, depth_bottom)
+    return lev_ind_top, lev_bnds_sel[:,1]-lev_bnds_sel[:,0]
+
+def union_length(windows, top, bottom):
+    '''
+    Compute length of the union of depth windows within [top, bottom]
+    '''
+    clipped = sorted((max(w_top, top), min(w_bottom, bottom)) for w_top, w_bottom in windows)
+    length = 0.
+    end = top
+    for w_top, w_bottom in clipped:
+        w_top = max(w_top, end)
+        if w_bottom > w_top:
+            length += w_bottom - w_top
+            end = w_bottom
+    return length
+
+def build_volume_operator(index, ds_lev_bnds, sectors, shape):
+    '''
+    Build sparse operator for the volume weighted mean over all sectors and their union ('anta')
+    
+    Args:
+        index: sector index (see SectorIndex.py), rows relative to the field
+        ds_lev_bnds: dataarray with lev_bnds of the layers in the field
+        sectors: list of ocean sector names
+        shape: shape of the field (lev, j, i)
+
+    Returns:
+        Dictionary with the operator in coordinate format and the weights of the rows per sector
+    '''
+    lev_bnds = np.asarray(ds_lev_bnds)
+    n_lev, n_j, n_i = shape
+    rows, cols, vals = [], [], []
+    row_sector, row_weight = [], []
+
+    for s, sector in enumerate(sectors):
+        cells = index[sector]['j']*n_i + index[sector]['i']
+        lev_ind_top, thickness = layer_weights(lev_bnds, *dvp.sel_depth_bnds(sector))
+        for k, weight in enumerate(thickness):
+            rows.append(np.full(cells.size, len(row_sector)))
+            cols.append((lev_ind_top+k)*n_j*n_i + cells)
+            vals.append(index[sector]['weights'])
+            row_sector.append(s)
+            row_weight.append(weight)
+
+    # Union of all sectors: one row, each cell weighted with its area and the thickness
+    # of the union of the depth windows of the sectors it belongs to
+    cells_all = np.concatenate([index[sector]['j']*n_i + index[sector]['i'] for sector in sectors])
+    area_all = np.concatenate([index[sector]['area'] for sector in sectors])
+    cells_union, first = np.unique(cells_all, return_index=True)
+    area_union = area_all[first]
+    membership = np.zeros(cells_union.size, dtype=int)
+    for s, sector in enumerate(sectors):
+        cells = index[sector]['j']*n_i + index[sector]['i']
+        membership[np.isin(cells_union, cells)] += 2**s
+
+    for combination in np.unique(membership):
+        windows = [dvp.sel_depth_bnds(sector) for s, sector in enumerate(sectors) if combination & 2**s]
+        cells = cells_union[membership == combination]
+        area = area_union[membership == combination]
+        for lev in range(n_lev):
+            length = union_length(windows, *lev_bnds[lev])
+            if length > 0:
+                rows.append(np.full(cells.size, len(row_sector)))
+                cols.append(lev*n_j*n_i + cells)
+                vals.append(area*length)
+    row_sector.append(len(sectors))
+    row_weight.append(1.)
+
+    return {'sectors': list(sectors) + ['anta'],
+            'shape': tuple(shape),
+            'rows': np.concatenate(rows),
+            'cols': np.concatenate(cols),
+            'vals': np.concatenate(vals),
+            'row_sector': np.array(row_sector),
+            'row_weight': np.array(row_weight)}
+
+def row_sums(operator, values, cols=None, rows=None, vals=None):
+    '''
+    Weighted sums and weights of the operator rows (layers of sectors) over the valid cells of a field
+    
+    Args:
+        operator: sector volume operator (see build_volume_operator)
+        values: array with field, flattened or (lev, j, i)
+        cols, rows, vals: entries of the operator to use, with cols relative to values (default: all)
+
+    Returns:
+        Arrays with weighted sum and sum of weights per row
+    '''
+    cols = operator['cols'] if cols is None else cols
+    rows = operator['rows'] if rows is None else rows
+    vals = operator['vals'] if vals is None else vals
+
+    # Gather the cells used by the operator from the field
+    field = values.reshape(-1)[cols]
+    valid = np.isfinite(field)
+    vals = np.where(valid, vals, 0.)
+
+    n_rows = operator['row_weight'].size
+    row_sum = np.bincount(rows, weights=vals*np.where(valid, field, 0.), minlength=n_rows)
+    row_weights = np.bincount(rows, weights=vals, minlength=n_rows)
+    return row_sum, row_weights
+
+def block_row_sums(operator, block, lev_slice, j_slice):
+    '''
+    Weighted sums and weights of the operator rows over a block of the field (see row_sums). 
+    Sums of the blocks of a field add up to the sums of the whole field; when the blocks are 
+    whole layers, the sums of the layers of the sectors are identical.
+    
+    Args:
+        operator: sector volume operator (see build_volume_operator)
+        block: array with block of field (lev, j, i), all columns
+        lev_slice, j_slice: layers and rows of the block in the field of the operator
+
+    Returns:
+        Arrays with weighted sum and sum of weights per row
+    '''
+    n_lev, n_j, n_i = operator['shape']
+    lev = operator['cols']//(n_j*n_i)
+    j = operator['cols']//n_i % n_j
+    sel = np.nonzero((lev >= lev_slice.start) & (lev < lev_slice.stop) & (j >= j_slice.start) & (j < j_slice.stop))[0]
+    cols = ((lev[sel]-lev_slice.start)*(j_slice.stop-j_slice.start) + j[sel]-j_slice.start)*n_i + operator['cols'][sel] % n_i
+    return row_sums(operator, block, cols, operator['rows'][sel], operator['vals'][sel])
+
+def sector_means(operator, row_sum, row_weights):
+    '''
+    Volume weighted mean per sector from the sums of the operator rows: weighted mean per row
+    (layer of a sector), combined per sector with the thickness of the layers
+    
+    Args:
+        operator: sector volume operator (see build_volume_operator)
+        row_sum, row_weights: weighted sum and sum of weights per row (see row_sums)
+
+    Returns:
+        Dictionary with volume weighted mean per sector
+    '''
+    has_data = row_weights > 0
+    row_mean = row_sum[has_data]/row_weights[has_data]
+
+    # Thickness weighted mean of the rows per sector
+    n_sectors = len(operator['sectors'])
+    row_sector = operator['row_sector'][has_data]
+    row_weight = operator['row_weight'][has_data]
+    sector_sum = np.bincount(row_sector, weights=row_weight*row_mean, minlength=n_sectors)
+    sector_weights = np.bincount(row_sector, weights=row_weight, minlength=n_sectors)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        sector_mean = sector_sum/sector_weights
+
+    return dict(zip(operator['sectors'], sector_mean))
+
+def apply_volume_operator(operator, ds_var):
+    '''
+    Compute volume weighted mean of a field for all sectors in one pass.
+    Missing values (land, nan) are left out of the means. 
+    
+    Args:
+        operator: sector volume operator (see build_volume_operator)
+        ds_var: dataarray with variable (lev, j, i)
+
+    Returns:
+        Dictionary with volume weighted mean per sector
+    '''
+    values = np.asarray(ds_var.transpose('lev','j','i') if hasattr(ds_var, 'dims') else ds_var)
+    if values.shape != operator['shape']:
+        raise ValueError(f"Field shape {values.shape} does not match operator shape {operator['shape']}")
+
+    return sector_means(operator, *row_sums(operator, values))
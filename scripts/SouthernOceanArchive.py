@@ -0,0 +1,181 @@
+import os
+
+import netCDF4
+import numpy as np
+
+import DepthIntegral as DI
+import NemoOutput as NO
+import SectorOperator as SO
+
+###############################################################################
+# Southern Ocean archive: the annual mean ocean temperature of the rows south of
+# lat_max and the layers above depth_max, appended every year by the coupler to
+# one compressed float32 file per experiment (one chunk per year and layer), so
+# that the analysis notebooks plot maps and multi-year means without reading the
+# monthly NEMO output. The coupler reads the region once (in blocks that fit in
+# the memory budget) for both the archive and the sector mean temperatures.
+###############################################################################
+
+def archive_region(nc, index, sectors, lat_max, depth_max):
+    '''
+    Rows and layers of the archive: rows south of lat_max and layers above depth_max,
+    extended to cover the rows and layers of the ocean sectors
+
+    Args:
+        nc: netCDF4 dataset of NEMO output file (*_opa_grid_T_3D.nc)
+        index: sector index (see SectorIndex.py)
+        sectors: list of ocean sector names
+        lat_max: northern latitude of the archive [degrees north]
+        depth_max: depth of the archive [m]
+
+    Returns:
+        Number of rows and number of layers (from the first row and the top layer)
+    '''
+    lat = np.asarray(nc['nav_lat'][:])
+    lev_bnds = np.asarray(nc['olevel_bounds'][:])
+    n_j = int(np.nonzero(lat.min(axis=1) < lat_max)[0].max()) + 1
+    n_lev = int(np.count_nonzero(lev_bnds[:,0] < depth_max))
+    return max(n_j, NO.sector_rows(index, sectors)[1]), max(n_lev, NO.sector_levels(lev_bnds, sectors)[1])
+
+def create_archive(file_archive, nc, n_j, n_lev, lat_max, depth_max, var='thetao'):
+    '''
+    Create archive file: variable (year, lev, j, i) in float32, compressed, one chunk per year and layer
+    '''
+    with netCDF4.Dataset(file_archive, 'w') as archive:
+        n_i = nc[var].shape[-1]
+        archive.createDimension('year', None)
+        archive.createDimension('lev', n_lev)
+        archive.createDimension('j', n_j)
+        archive.createDimension('i', n_i)
+        archive.createDimension('bnds', 2)
+        archive.lat_max = lat_max
+        archive.depth_max = depth_max
+
+        archive.createVariable('year', 'i4', ('year',))
+        lev_bnds = np.asarray(nc['olevel_bounds'][:n_lev])
+        archive.createVariable('lev', 'f4', ('lev',))[:] = lev_bnds.mean(axis=1)
+        archive['lev'].setncatts({'units': 'm', 'positive': 'down', 'bounds': 'lev_bnds'})
+        archive.createVariable('lev_bnds', 'f4', ('lev','bnds'))[:] = lev_bnds
+        archive.createVariable('latitude', 'f4', ('j','i'))[:] = np.asarray(nc['nav_lat'][:n_j])
+        archive.createVariable('longitude', 'f4', ('j','i'))[:] = np.asarray(nc['nav_lon'][:n_j])
+
+        nc_var = archive.createVariable(var, 'f4', ('year','lev','j','i'), zlib=True, complevel=4, shuffle=True,
+                                        chunksizes=(1, 1, n_j, n_i), fill_value=np.float32(np.nan))
+        nc_var.setncatts({attr: nc[var].getncattr(attr) for attr in ['standard_name', 'long_name', 'units']
+                          if attr in nc[var].ncattrs()})
+        nc_var.coordinates = 'latitude longitude'
+        nc_var.cell_methods = 'year: mean (weighted by month length)'
+
+def year_record(archive, year):
+    '''
+    Record of a year in the archive: the existing record (rewritten when a year is computed again) or a new one
+    '''
+    years = np.asarray(archive['year'][:])
+    existing = np.nonzero(years == year)[0]
+    t = int(existing[0]) if existing.size else years.size
+    archive['year'][t] = year
+    return t
+
+def archive_year(file_archive, file_thetao, year, index, sectors, lat_max, depth_max, memory_budget=None,
+                 operator=None, var='thetao', time='time_counter'):
+    '''
+    Write the annual mean of the archive region of a year to the archive, block by block (see NemoOutput.block_slices),
+    and compute the volume weighted mean per sector from the same blocks. The sector means are the same as those of
+    NemoOutput.sector_means_blocked (the operator rows of the sectors do not depend on the extent of the field).
+
+    Args:
+        file_archive: path of archive (created for the first year)
+        file_thetao: path of NEMO output file (*_opa_grid_T_3D.nc), variable with dimensions (time, lev, y, x)
+        year: year of NEMO output
+        index: sector index (see SectorIndex.py)
+        sectors: list of ocean sector names
+        lat_max: northern latitude of the archive [degrees north]
+        depth_max: depth of the archive [m]
+        memory_budget: memory budget [MB] for a block of the field, None for the whole region at once
+        operator: sector volume operator of the archive region (optional, built when missing or of another shape)
+        var: name of variable
+        time: name of time variable
+
+    Returns:
+        Dictionary with volume weighted mean per sector (and 'anta'), sector volume operator
+    '''
+    with netCDF4.Dataset(file_thetao) as nc:
+        if not os.path.isfile(file_archive):
+            n_j, n_lev = archive_region(nc, index, sectors, lat_max, depth_max)
+            print(f'Creating Southern Ocean archive {file_archive} (rows 0:{n_j}, layers 0:{n_lev})')
+            create_archive(file_archive, nc, n_j, n_lev, lat_max, depth_max, var)
+
+        with netCDF4.Dataset(file_archive, 'a') as archive:
+            if (archive.lat_max, archive.depth_max) != (lat_max, depth_max):
+                raise ValueError(f'Southern Ocean archive {file_archive} has another region (lat_max {archive.lat_max}, '
+                                 f'depth_max {archive.depth_max}), move it or set the same region in config.py')
+            archive_var = archive[var]
+            shape = archive_var.shape[1:]
+            # Cache one chunk, so that row blocks of a layer are compressed once
+            archive_var.set_var_chunk_cache(size=2*4*shape[1]*shape[2])
+            if operator is None or operator['shape'] != shape:
+                operator = SO.build_volume_operator(index, nc['olevel_bounds'][:shape[0]], sectors, shape)
+
+            blocks = NO.block_slices(shape, memory_budget)
+            print(f'Reading rows 0:{shape[1]} and layers 0:{shape[0]} of {file_thetao} in {len(blocks)} blocks')
+            weights = NO.record_lengths_netcdf(nc, time)
+            t = year_record(archive, year)
+            row_sum = np.zeros(operator['row_weight'].size)
+            row_weights = np.zeros(row_sum.shape)
+            for lev_slice, j_slice in blocks:
+                block = NO.annual_mean_block(nc[var], weights, lev_slice, j_slice)
+                archive_var[t, lev_slice, j_slice, :] = block.astype('float32')
+                block_sum, block_weights = SO.block_row_sums(operator, block, lev_slice, j_slice)
+                row_sum += block_sum
+                row_weights += block_weights
+    return SO.sector_means(operator, row_sum, row_weights), operator
+
+def open_archive(file_archive):
+    '''
+    Open archive with xarray: variable (year, lev, j, i) with coordinates year, lev, latitude and longitude
+    '''
+    import xarray as xr
+    return xr.open_dataset(file_archive)
+
+def depth_mean(file_archive, depth_top, depth_bottom, years=None, var='thetao'):
+    '''
+    Maps of the thickness weighted mean over a depth window (including partial layers, see DepthIntegral.py),
+    reading only the layers of the window, one year at a time
+
+    Args:
+        file_archive: path of archive
+        depth_top, depth_bottom: upper and lower depth of the window [m]
+        years: list of years (optional, default: all years in the archive)
+        var: name of variable
+
+    Returns:
+        Dataarray with maps (year, j, i)
+    '''
+    import xarray as xr
+
+    with open_archive(file_archive) as ds:
+        lev_bnds = ds['lev_bnds'].values
+        if depth_bottom > lev_bnds[-1,1]:
+            raise ValueError(f'Depth window {depth_top}-{depth_bottom} m is deeper than the archive ({lev_bnds[-1,1]} m)')
+        levs = np.nonzero((lev_bnds[:,1] > depth_top) & (lev_bnds[:,0] < depth_bottom))[0]
+        da = ds[var].isel(lev=slice(levs[0], levs[-1]+1))
+        if years is not None:
+            da = da.sel(year=list(years))
+
+        maps = np.empty((da.sizes['year'], da.sizes['j'], da.sizes['i']), dtype='float32')
+        for t in range(maps.shape[0]):
+            profiles = np.moveaxis(da.isel(year=t).values, 0, -1) # (j, i, lev)
+            maps[t] = DI.window_mean(DI.depth_integral(profiles, lev_bnds[levs]), depth_top, depth_bottom)
+        return xr.DataArray(maps, dims=('year','j','i'), name=var,
+                            coords={'year': da['year'].values, 'latitude': ds['latitude'], 'longitude': ds['longitude']},
+                            attrs=dict(da.attrs, depth_window=f'{depth_top}-{depth_bottom} m'))
+
+def period_mean(file_archive, depth_top, depth_bottom, year_min, year_max, var='thetao'):
+    '''
+    Map of the mean over the years year_min to year_max (inclusive, years in the archive) of the depth window mean
+    (see depth_mean)
+    '''
+    with open_archive(file_archive) as ds:
+        years = ds['year'].values
+    years = years[(years >= year_min) & (years <= year_max)]
+    return depth_mean(file_archive, depth_top, depth_bottom, years, var).mean('year')
@@ -1,24 +1,48 @@
 import numpy as np
-import pandas as pd
-import xarray as xr
 
 import DataVariablesParameters as dvp
 
 ###############################################################################
+# xarray and pandas are imported in the functions that use them, so that the
+# layer index and running mean functions load fast (command line tools, see fwf.py)
+###############################################################################
+
+def gather_sector(ds_var,index_sector):
+    '''
+    Gather the grid cells of a sector from a dataarray
+    
+    Args:
+        ds_var: dataarray with variable on the (j,i) grid
+        index_sector: sector entry of the sector index (see SectorIndex.py)
+
+    Returns:
+        Dataarray with dimension 'cell' instead of j, i
+    '''
+    import xarray as xr
+    cells_j = xr.DataArray(index_sector['j'], dims=['cell'])
+    cells_i = xr.DataArray(index_sector['i'], dims=['cell'])
+    return ds_var.isel(j=cells_j, i=cells_i)
 
-def area_weighted_mean(ds_var,ds_area,sector):
+def area_weighted_mean(ds_var,ds_area,sector,index=None):
     '''
     Compute area weighted mean oceanic temperature over specific oceanic sector
     
     Args:
         ds_var: dataarray with variable
-        ds_area: dataarray with areacello
+        ds_area: dataarray with areacello (not used if index is given)
         sector: ocean sector name
+        index: sector index (optional), avoids recomputing the sector mask and weights
 
     Returns:
         Area weighted mean oceanic temperature over specific oceanic sector
     '''
 
+    if index is not None:
+        # Gather the sector cells and use the precomputed weights
+        import xarray as xr
+        weights = xr.DataArray(index[sector]['weights'], dims=['cell'])
+        return gather_sector(ds_var,index[sector]).weighted(weights).mean('cell')
+
     # Select mask for specific ocean sector
     mask_sector = dvp.sel_mask(ds_area,sector)
 
@@ -35,7 +59,7 @@ def area_weighted_mean(ds_var,ds_area,sector):
     area_weighted_mean = area_weighted.mean((lat,lon))
     return area_weighted_mean #2D field: time,levs
 
-def lat_weighted_mean(ds_var,ds_lev_bnds,sector):
+def lat_weighted_mean(ds_var,ds_lev_bnds,sector,index=None):
     '''
     Compute latitude weighted mean oceanic temperature over specific oceanic sector
     (For a rectangular grid the cosine of the latitude is proportional to the grid cell area.)
@@ -44,11 +68,17 @@ def lat_weighted_mean(ds_var,ds_lev_bnds,sector):
         ds_var: dataarray with variable (area-weighted mean)
         ds_lev_bnds: dataarray with lev_bnds
         sector: ocean sectorn name
+        index: sector index (optional), cells are weighted with the cosine of their latitude
     
     Returns: 
         Latitude weighted mean oceanic temperature over specific oceanic sector
     
     '''
+    if index is not None:
+        import xarray as xr
+        lat_weights = xr.DataArray(np.cos(np.deg2rad(index[sector]['lat'])), dims=['cell'])
+        return gather_sector(ds_var,index[sector]).weighted(lat_weights).mean('cell')
+
     # Select mask for specific ocean sector
     mask_sector = dvp.sel_mask(ds_var,sector)
  
@@ -116,6 +146,22 @@ def nearest_below(my_array, target):
     # Returns the index of the minimum value
     return masked_diff.argmin()
 
+def lev_indices(ds_lev_bnds,depth_top,depth_bottom):
+    '''
+    Find indices of the top and bottom oceanic layers covering a depth range
+    
+    Args:
+        ds_lev_bnds: dataarray with lev_bnds
+        depth_top: upper depth of range
+        depth_bottom: lower depth of range
+
+    Returns:
+        Index of top layer and index of bottom layer (inclusive)
+    '''
+    lev_ind_bottom = nearest_above(np.asarray(ds_lev_bnds)[:,1],depth_bottom)
+    lev_ind_top = nearest_below(np.asarray(ds_lev_bnds)[:,0],depth_top)
+    return lev_ind_top, lev_ind_bottom
+
 def lev_weighted_mean(ds_var,ds_lev_bnds,sector):
     '''
     Compute volume weighted mean oceanic temperature over specific oceanic
@@ -130,36 +176,26 @@ def lev_weighted_mean(ds_var,ds_lev_bnds,sector):
        Depth weighted mean oceanic temperature for specific sector
        If input is area-weighted, output is volume-weighted
 
+    ds_lev_bnds is not modified: before, the layer bounds were clipped in place, so that a loop over 
+    the sectors used the bounds clipped by the sectors before it for every sector after the first one
     '''
    
     # Select depth bounds of sector
     depth_bnds_sector = dvp.sel_depth_bnds(sector)     
     depth_top = depth_bnds_sector[0]
     depth_bottom = depth_bnds_sector[1]
-    #print(depth_bnds_sector)
-    
-    # Find oceanic layers covering the depth bounds and take a slice of these
-    # layers
-    lev_ind_bottom= nearest_above(ds_lev_bnds[:,1],depth_bottom)
-    lev_ind_top = nearest_below(ds_lev_bnds[:,0],depth_top)
-    levs_slice = ds_var.isel(lev=slice(lev_ind_top,lev_ind_bottom+1))
-    
-    # Create weights for each oceanic layer, correcting for layers that fall only partly within specified depth range 
-    lev_bnds_sel = ds_lev_bnds.values[lev_ind_top:lev_ind_bottom+1]
-    lev_bnds_sel[lev_bnds_sel > depth_bottom] = depth_bottom
-    lev_bnds_sel[lev_bnds_sel < depth_top] = depth_top
-    # Weight equals thickness of each layer
-    levs_weights = lev_bnds_sel[:,1]-lev_bnds_sel[:,0] 
-    # DataArray required to apply .weighted on DataArray
-    levs_weights_DA = xr.DataArray(levs_weights,coords={'lev': levs_slice.lev},
-             dims=['lev'])
-    
-    # Compute depth weighted mean of ocean slice
-    levs_slice_weighted = levs_slice.weighted(levs_weights_DA)
-    levs_weighted_mean = levs_slice_weighted.mean(("lev"))
+    
+    # Cumulative thickness weighted integral over depth (lev as last dimension), evaluated at the 
+    # depth bounds; layers that fall only partly within the depth range are weighted with the part inside it
+    import xarray as xr
+    import DepthIntegral as DI
+    dims = [dim for dim in ds_var.dims if dim != 'lev']
+    integral = DI.depth_integral(ds_var.transpose(*dims, 'lev').values, ds_lev_bnds)
+    levs_weighted_mean = DI.window_mean(integral, depth_top, depth_bottom)
     
     # Return layer-weighted ocean temperature
-    return levs_weighted_mean
+    coords = {name: coord for name, coord in ds_var.coords.items() if 'lev' not in coord.dims}
+    return xr.DataArray(levs_weighted_mean, dims=dims, coords=coords, name=ds_var.name)
 
 def running_mean_backward(df_thetao,df_thetao_baseline, year, year_min, period):
     '''
@@ -178,6 +214,8 @@ def running_mean_backward(df_thetao,df_thetao_baseline, year, year_min, period):
     Returns
         Mean value of variable averaged over period (backward averaging)
     '''
+    import pandas as pd
+
     # Compute number of years that experiment is running
     no_yrs = year+1-year_min
     if (no_yrs) >= period:
@@ -198,3 +236,41 @@ def running_mean_backward(df_thetao,df_thetao_baseline, year, year_min, period):
         # Add running mean to dataframe
         df_thetao_mean.loc[year]=df_thetao_combined.mean()   
     return df_thetao_mean
+
+def running_mean_init(buffer, sums, periods, thetao_baseline):
+    '''
+    Initialise ring buffer for running means over several periods, before the start of the 
+    experiment all values in the buffer are equal to the baseline values
+    
+    Args:
+        buffer: array (max(periods), sector) storing the last values
+        sums: array (period, sector) storing the sums over the last values for each period
+        periods: array with lengths of periods (in years) over which running means are computed
+        thetao_baseline: mean temperatures for the ocean sectors in the baseline climate
+    '''
+    buffer[:] = thetao_baseline
+    sums[:] = np.asarray(periods)[:,None] * np.asarray(thetao_baseline)
+
+def running_mean_update(buffer, sums, periods, n, thetao):
+    '''
+    Add value to ring buffer and compute running means (backward averaging) over several 
+    periods at once. If the length of the ongoing experiment is shorter than a period, 
+    baseline values are used for averaging (as in running_mean_backward).
+    
+    Args:
+        buffer: array (max(periods), sector) storing the last values, updated in place
+        sums: array (period, sector) storing the sums over the last values for each period, updated in place
+        periods: array with lengths of periods (in years) over which running means are computed
+        n: number of values added before (time step relative to start of experiment)
+        thetao: mean temperatures for the ocean sectors in the current model year
+
+    Returns:
+        Array (period, sector) with running mean values
+    '''
+    periods = np.asarray(periods)
+    max_period = buffer.shape[0]
+    # Values leaving the window of each period: added n-period steps ago, or baseline 
+    # values (not overwritten yet) if n < period
+    sums += np.asarray(thetao) - buffer[(n - periods) % max_period]
+    buffer[n % max_period] = thetao
+    return sums / periods[:,None]
@@ -9,11 +9,50 @@ gamma = 0.08 * 0.65      #Basal melt calibration parameter based on sea level re
 # Depths between which basal melt is distributed [in m] 
 bm_dep1 = 200            #shallowest depth, ice front draft (code searches closest depth level bound below this depth)
 bm_dep2 = 700            #deepest depth, grounding line or seabed below ice front (code searches closest depth level bound above this depth)
+## Depths per ocean sector (optional), e.g. {'amun': (300, 600), 'ross': (250, 800)}; the other cells of the basal melt
+## mask use bm_dep1 and bm_dep2. Depth files of many depth pairs at once: python fwf.py depths (see DepthDistribution.py)
+bm_depths_sector = {}
 
 ## --------- Linear response functions information ----------
 bm = '08'                #basal melt forcing to create linear response functions
 ism = 'IMAU_VUB'         #ice sheet model
+shadow_lrfs = []         #additional (ism, bm) response functions, e.g. [('PISM_DMI', '08'), ('IMAU_VUB', '04')],
+                         #only used to monitor the spread of the freshwater forcing (the forcing uses ism and bm)
 running_mean_period = 30 #interval over which running mean ocean temperatures are computed in years
+running_mean_periods_monitor = [10, 50] #additional running mean intervals, only computed for monitoring
+
+## --------- Forcing files for NEMO -----------------------
+## On-disk layout of FWF_LRF_y????.nc, {} keeps the original layout (12 monthly float64 records, netCDF4, no compression)
+## e.g. {'dtype': 'float32', 'format': 'NETCDF3_CLASSIC'} for small files that are fastest to read, 
+##      {'dtype': 'float32', 'complevel': 4} for compressed netCDF4 files,
+##      {'n_time': 1} for a single record per year (requires sbcfwf to read the forcing file with a yearly frequency,
+##      set in namelist.nemo-ORCA1L75-coupled.cfg.sh)
+forcing_layout = {}
+
+## --------- Memory ---------------------------------------
+## Memory budget [MB] for the sector mean ocean temperatures: the annual mean is computed and reduced in blocks
+## of layers (or rows of a layer) that fit in the budget, e.g. 500 for eORCA025/eORCA12 on a post-processing node;
+## None computes the annual mean of all rows and layers of the sectors at once (ORCA1)
+memory_budget = None
+
+## --------- Southern Ocean archive -----------------------
+## Annual mean thetao of the rows south of lat_max and the layers above depth_max, appended every year to
+## {path_output}/SouthernOcean_{exp}.nc (float32, compressed) for maps in the analysis notebooks (see SouthernOceanArchive.py);
+## the sector mean temperatures are then computed from the same read. None: no archive
+southern_ocean_archive = None # e.g. {'lat_max': -60., 'depth_max': 1000.}
+
+## --------- Monitoring -----------------------------------
+## The monitoring csv files are exported from the coupler state at the end of the experiment and, when set, every
+## monitoring_interval years (e.g. 10, so that the notebooks and analysis/MonitoringLoader.py follow a running
+## experiment; each export rewrites the files of all years). None: only at the end, or on demand with ExportMonitoring.py
+monitoring_interval = None
+
+## --------- Instrumentation ------------------------------
+## Wall time, CPU time, resident memory and bytes read/written of every stage of the driver scripts are appended to
+## {path_output}/StageLog_{exp}.jsonl (summary: python fwf.py stages {exp} {start_dir}), False to switch off
+stage_log = True
+## Profile every year with cProfile: {path_output}/profile/{script}_{year}.prof (e.g. python -m pstats <file>)
+profile = False
 
 ## --------- Initial conditions -----------------------------
 ## Total basal melt + calving (P-E) in piControl simulation
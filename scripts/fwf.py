@@ -0,0 +1,123 @@
+# Command line interface for the freshwater forcing scripts
+# Usage: python fwf.py <command> [arguments]   (python fwf.py lists the commands)
+# Only the modules of the requested command are imported: initialise, prescribed and grid do not
+# load xarray or pandas. 'python fwf.py startup' measures the import time of each command.
+
+## Import modules
+import ast
+import os
+import runpy
+import subprocess
+import sys
+import time
+
+path_scripts = os.path.dirname(os.path.abspath(__file__))
+
+## Commands: script (None: function in this file), arguments, description
+commands = {
+    'grid': (None, 'file_thetao start_dir',
+             'build grid descriptor (level bounds, time axis) from a NEMO output file'),
+    'initialise': ('InitialiseFreshwaterForcing.py', 'year_min exp start_dir [file_thetao]',
+                   'create the first forcing file and the basal melt depth files'),
+    'depths': ('DepthDistribution.py', 'file_table start_dir path_output',
+               'basal melt depth files of a table of depth pairs (per sector) for sensitivity experiments'),
+    'prescribed': ('PrescribedFreshwaterForcing.py', 'year_min year_max year leg exp start_dir run_dir',
+                   'sector mean ocean temperatures of one year for prescribed freshwater forcing'),
+    'interactive': ('ThetaoDrivenFreshwaterForcing.py', 'year_min year_max year leg exp start_dir run_dir',
+                    'interactive freshwater forcing of one year'),
+    'daemon': ('CouplerDaemon.py', 'year_min year_max exp start_dir run_dir [fifo|watch]',
+               'interactive freshwater forcing of a whole experiment in one process'),
+    'rollback': ('RollbackCoupler.py', 'year_min year_max year exp start_dir',
+                 'rewind the coupler state and outputs of an experiment to the end of a year'),
+    'export': ('ExportMonitoring.py', 'year_min year_max exp start_dir',
+               'export coupler state to the monitoring csv files'),
+    'emulate': ('EmulateFreshwaterForcing.py', 'file_thetao_csv exp start_dir [path_output]',
+                'emulate freshwater forcing offline from sector mean ocean temperatures'),
+    'ensemble': ('EnsembleFreshwaterForcing.py', 'file_thetao_csv start_dir file_output gammas T_fs periods',
+                 'freshwater forcing offline for an ensemble of parameters'),
+    'stages': (None, 'exp start_dir',
+               'summary of the stage log (time, memory and I/O per stage) of an experiment'),
+    'startup': (None, '[command ...]',
+                'measure import time of the commands'),
+}
+
+def usage():
+    print('Usage: python fwf.py <command> [arguments]\n\nCommands:')
+    for command, (script, args, description) in commands.items():
+        print(f'  {command:12s} {args}\n  {"":12s} {description}')
+
+def grid(file_thetao, start_dir):
+    '''
+    Build grid descriptor from a NEMO output file (see GridDescriptor.py)
+    '''
+    import GridDescriptor as GD
+    file_descriptor = f'{start_dir}/fwf/interactive/input/GridDescriptor_ORCA1.npz'
+    descriptor = GD.build_grid_descriptor(file_thetao, file_descriptor)
+    print(f"Grid descriptor {file_descriptor}: {len(descriptor['olevel_bounds'])} levels, "
+          f"grid {tuple(descriptor['grid_shape'])}, {len(descriptor['time_values'])} records of {descriptor['source_year']}, {descriptor['calendar']} calendar")
+
+def stages(exp_name, start_dir):
+    '''
+    Summary of the stage log of an experiment over all years (see Instrumentation.py)
+    '''
+    import Instrumentation as IN
+    file_log = f'{start_dir}/fwf/interactive/forcing_files/{exp_name}/StageLog_{exp_name}.jsonl'
+    summary = IN.summarise_stage_log(file_log)
+    print(f'Stage log {file_log}')
+    for script, df in summary.groupby(level='script', sort=False):
+        print(f'\n{script}')
+        print(df.droplevel('script').round(3).to_string())
+
+def script_imports(script):
+    '''
+    Names of the modules imported at the top level of a script
+    '''
+    with open(f'{path_scripts}/{script}') as f:
+        tree = ast.parse(f.read())
+    modules = []
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            modules += [alias.name for alias in node.names]
+        elif isinstance(node, ast.ImportFrom):
+            modules.append(node.module)
+    return modules
+
+def import_time(modules, repeat=3):
+    '''
+    Wall time [s] of a new python process importing modules (best of repeat), and whether xarray/pandas are loaded
+    '''
+    code = f"import {', '.join(['sys'] + modules)}; print('xarray' in sys.modules, 'pandas' in sys.modules)"
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        output = subprocess.run([sys.executable, '-c', code], cwd=path_scripts, capture_output=True, text=True, check=True).stdout
+        times.append(time.perf_counter() - start)
+    return min(times), output.split()
+
+def startup(*names):
+    '''
+    Measure the import time of commands, compared with an empty python process
+    '''
+    time_python, _ = import_time([])
+    print(f"{'command':12s} {'startup [s]':>12s} {'imports [s]':>12s}  xarray pandas")
+    print(f"{'python':12s} {time_python:12.3f}")
+    for command in names or commands:
+        script = commands[command][0]
+        if script is None:
+            continue
+        time_command, loaded = import_time(script_imports(script))
+        print(f'{command:12s} {time_command:12.3f} {time_command-time_python:12.3f}  {loaded[0]:6s} {loaded[1]}')
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2 or sys.argv[1] not in commands:
+        usage()
+        sys.exit(len(sys.argv) > 1 and sys.argv[1] not in ['-h', '--help'])
+
+    command, args = sys.argv[1], sys.argv[2:]
+    script = commands[command][0]
+    if script is None:
+        globals()[command](*args)
+    else:
+        # Run script as if called directly: python script.py args
+        sys.argv = [f'{path_scripts}/{script}'] + args
+        runpy.run_path(sys.argv[0], run_name='__main__')
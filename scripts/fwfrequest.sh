@@ -0,0 +1,19 @@
+#!/bin/bash
+# Request the freshwater forcing of one year from CouplerDaemon.py (fifo mode) and wait until
+# FWF_LRF_y{year+1}.nc is written; replaces calling ThetaoDrivenFreshwaterForcing.py from fwfwrapper.sh
+# usage: fwfrequest.sh year leg exp_name start_dir
+
+year=$1
+leg=$2
+exp_name=$3
+start_dir=$4
+
+path_output=${start_dir}/fwf/interactive/forcing_files/${exp_name}
+
+echo "${year} ${leg}" > ${path_output}/CouplerDaemon.request
+read reply < ${path_output}/CouplerDaemon.reply
+
+echo "Freshwater forcing daemon: ${reply}"
+case ${reply} in
+    ERROR*) exit 1 ;;
+esac
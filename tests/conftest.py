@@ -0,0 +1,65 @@
+# Fixtures shared by the tests: synthetic ORCA1 experiment of benchmarks/SyntheticInputs.py (generated once per
+# test session) and a coupler run of all its years
+#
+# Usage: python -m pytest tests
+
+## Import modules
+import os
+import sys
+
+import pytest
+import xarray as xr
+
+path_repo = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in ['preprocessing', 'benchmarks', 'scripts']:
+    sys.path.insert(0, f'{path_repo}/{path}')
+# Modules of the analysis directory only (its copies of the scripts modules come after those)
+sys.path.append(f'{path_repo}/analysis')
+
+import SyntheticInputs as SYN
+import Coupler as CP
+import SectorIndex as SI
+import reference
+from helpers import year_min, n_years, exp_name, coupler_run, couple_years
+
+@pytest.fixture(scope='session')
+def experiment(tmp_path_factory):
+    '''
+    Synthetic ORCA1 experiment: runtime directory with the inputs and the NEMO output of n_years years
+    '''
+    root = str(tmp_path_factory.mktemp('ORCA1'))
+    files_thetao = SYN.generate_experiment(root, 'ORCA1', n_years, year_min, exp_name)
+    return {'root': root,
+            'files_thetao': files_thetao,
+            'files': CP.coupler_files(year_min, year_min+n_years-1, exp_name, root, root)}
+
+@pytest.fixture(scope='session')
+def straight_run(experiment, tmp_path_factory):
+    '''
+    Coupler run of all years in order
+    '''
+    files, static = coupler_run(experiment, tmp_path_factory)
+    couple_years(files, static, range(year_min, year_min+n_years))
+    return files, static
+
+@pytest.fixture(scope='session')
+def sector_index(experiment, tmp_path_factory):
+    '''
+    Sector index of the synthetic experiment
+    '''
+    return SI.load_sector_index(experiment['files']['file_area'], f"{tmp_path_factory.mktemp('index')}/SectorIndex.npz", CP.sectors)
+
+@pytest.fixture(scope='session')
+def reference_means(experiment):
+    '''
+    Sector mean temperatures of every year of the synthetic experiment computed as in the original scripts
+    (month length weighted annual mean)
+    '''
+    means = []
+    with xr.open_dataset(experiment['files']['file_area']) as ds_area:
+        for file_thetao in experiment['files_thetao']:
+            with reference.open_thetao(file_thetao) as ds:
+                ds_thetao_year = reference.annual_mean(ds)
+                means.append({sector: reference.sector_mean(ds_thetao_year, ds['olevel_bounds'], ds_area, sector)
+                              for sector in CP.sectors})
+    return means
@@ -0,0 +1,69 @@
+# Coupler runs on the synthetic experiment (see conftest.py) and comparisons of their outputs, shared by the tests
+
+## Import modules
+import shutil
+
+import netCDF4
+import numpy as np
+
+import Coupler as CP
+import CouplerState as CS
+
+year_min = 1850
+n_years = 3
+exp_name = 'test'
+
+def coupler_run(experiment, tmp_path_factory):
+    '''
+    Paths, static inputs and a new runtime directory (own coupler state and forcing files) sharing the NEMO output
+    '''
+    start_dir = str(tmp_path_factory.mktemp('run'))
+    shutil.copytree(f"{experiment['root']}/fwf", f'{start_dir}/fwf')
+    files = CP.coupler_files(year_min, year_min+n_years-1, exp_name, start_dir, experiment['root'])
+    return files, CP.load_static(files)
+
+def couple_years(files, static, years):
+    '''
+    Run the coupler for a list of years (in the order given), as ThetaoDrivenFreshwaterForcing.py
+    '''
+    for year in years:
+        state = CP.open_coupler_state(files, static, year)
+        CP.couple_year(files, static, state, year, CP.thetao_file(files, year, year-year_min+1))
+    return CS.open_state(files['path_state'])
+
+def assert_same_run(files_a, files_b):
+    '''
+    Coupler states and forcing files of two runs are identical
+    '''
+    state_a, state_b = CS.open_state(files_a['path_state']), CS.open_state(files_b['path_state'])
+    for var in state_a:
+        if var != 'meta':
+            np.testing.assert_array_equal(state_a[var], state_b[var], err_msg=var)
+    for year in range(year_min, year_min+n_years):
+        with netCDF4.Dataset(CP.forcing_file(files_a, year)) as nc_a, netCDF4.Dataset(CP.forcing_file(files_b, year)) as nc_b:
+            for var in ['sorunoff_f', 'socalving_f', 'time_counter']:
+                np.testing.assert_array_equal(nc_a[var][:], nc_b[var][:], err_msg=f'{var} {year}')
+
+def netcdf_structure(file):
+    '''
+    Format, dimensions, global attributes and per variable dimensions, type and attributes (in file order)
+    '''
+    with netCDF4.Dataset(file) as nc:
+        return {'format': nc.data_model,
+                'dimensions': [(name, dim.size, dim.isunlimited()) for name, dim in nc.dimensions.items()],
+                'attrs': [(att, str(nc.getncattr(att))) for att in nc.ncattrs()],
+                'variables': [(name, var.dimensions, var.dtype, [(att, str(var.getncattr(att))) for att in var.ncattrs()])
+                              for name, var in nc.variables.items()]}
+
+def assert_same_forcing_file(file, file_original):
+    '''
+    Forcing file has the structure, raw time values and fluxes of the original file
+    '''
+    assert netcdf_structure(file) == netcdf_structure(file_original)
+    with netCDF4.Dataset(file) as nc, netCDF4.Dataset(file_original) as nc_original:
+        for var in nc.variables:
+            values, values_original = nc[var][:], nc_original[var][:]
+            if var == 'time_counter':
+                np.testing.assert_array_equal(values, values_original)
+            else:
+                np.testing.assert_allclose(values, values_original, rtol=1e-12, atol=0., err_msg=var)
@@ -0,0 +1,320 @@
+# Reference computations of the original scripts (ThetaoSectors.py, DataVariablesParameters.py and the driver
+# scripts before they were optimised), used by the tests as ground truth. The computations are copied unchanged,
+# only reading and writing files is left out.
+
+## Import modules
+import os
+import warnings
+
+import netCDF4
+import numpy as np
+import xarray as xr
+
+############################### Sector mean temperatures ###############################
+
+def mask_sector(ds,sector,lat='latitude',lon='longitude'):
+    '''
+    Select mask of sector (DataVariablesParameters.mask_sector)
+    '''
+    mask_eais = (
+        (ds.coords[lat] > -76)
+        & (ds.coords[lat] < -65)
+        & (ds.coords[lon] < 173)
+    ) + (
+        (ds.coords[lat] > -76)
+        & (ds.coords[lat] < -65)
+        & (ds.coords[lon] > 350)
+    )
+
+    mask_wedd = (
+        (ds.coords[lat] < -72)
+        & (ds.coords[lon] > 295)
+        & (ds.coords[lon] < 350)
+    )
+
+    mask_amun = (
+        (ds.coords[lat] < -70)
+        & (ds.coords[lon] > 210)
+        & (ds.coords[lon] < 295)
+    )
+
+    mask_ross = (
+        (ds.coords[lat] < -76)
+        & (ds.coords[lon] > 150)
+        & (ds.coords[lon] < 210)
+    )
+
+    mask_apen = (
+        (ds.coords[lat] > -70)
+        & (ds.coords[lat] < -65)
+        & (ds.coords[lon] > 294)
+        & (ds.coords[lon] < 310)
+    ) + (
+        (ds.coords[lat] > -75)
+        & (ds.coords[lat] < -70)
+        & (ds.coords[lon] > 285)
+        & (ds.coords[lon] < 295)
+    )
+
+    masks = {'eais': mask_eais, 'wedd': mask_wedd, 'amun': mask_amun, 'ross': mask_ross, 'apen': mask_apen}
+    if sector == 'anta':
+        return mask_eais + mask_wedd + mask_amun + mask_ross + mask_apen
+    return masks[sector]
+
+def area_weighted_mean(ds_var,ds_area,sector):
+    '''
+    Area weighted mean over an oceanic sector (ThetaoSectors.area_weighted_mean)
+    '''
+    area_weighted = ds_var.where(mask_sector(ds_area,sector)).weighted(ds_area.areacello.fillna(0))
+    return area_weighted.mean(('j','i'))
+
+## Sector-specific depths (based on shelf base depth) [m], a 100 m window is taken around them
+shelf_depths = {'eais': 369, 'wedd': 420, 'amun': 305, 'ross': 312, 'apen': 420}
+
+def sel_depth_bnds(sector):
+    '''
+    Select oceanic layers based on shelf depth (DataVariablesParameters.sel_depth_bnds)
+    '''
+    shelf_depth = shelf_depths[sector]
+    return np.array([shelf_depth-50,shelf_depth+50])
+
+def nearest_above(my_array, target):
+    '''
+    Index of the nearest value in array that is greater than target (ThetaoSectors.nearest_above)
+    '''
+    diff = my_array - target
+    mask = np.ma.less_equal(diff, 0)
+    if np.all(mask):
+        return None # returns None if target is greater than any value
+    masked_diff = np.ma.masked_array(diff, mask)
+    return masked_diff.argmin()
+
+def nearest_below(my_array, target):
+    '''
+    Index of the nearest value in array that is smaller than target (ThetaoSectors.nearest_below)
+    '''
+    diff = target - my_array
+    mask = np.ma.less_equal(diff, 0)
+    if np.all(mask):
+        return None # returns None if target is smaller than any value
+    masked_diff = np.ma.masked_array(diff, mask)
+    return masked_diff.argmin()
+
+def lev_weighted_mean(ds_var,ds_lev_bnds,sector,depth_bnds=None,in_place=False):
+    '''
+    Depth weighted mean over the layers of the depth window of a sector (ThetaoSectors.lev_weighted_mean),
+    optionally over another depth window
+
+    The original clipped the level bounds in place (in_place=True): ds_lev_bnds.values is the array of the
+    dataset, so the next sector of the loop over the sectors selected and weighted its layers with the bounds
+    clipped by the sectors before it (see original_sector_means). The optimised code clips a copy.
+    '''
+    depth_top, depth_bottom = sel_depth_bnds(sector) if depth_bnds is None else depth_bnds
+
+    # Find oceanic layers covering the depth bounds and take a slice of these layers
+    lev_ind_bottom= nearest_above(ds_lev_bnds[:,1],depth_bottom)
+    lev_ind_top = nearest_below(ds_lev_bnds[:,0],depth_top)
+    levs_slice = ds_var.isel(lev=slice(lev_ind_top,lev_ind_bottom+1))
+
+    # Create weights for each oceanic layer, correcting for layers that fall only partly within specified depth range
+    lev_bnds_sel = ds_lev_bnds.values[lev_ind_top:lev_ind_bottom+1]
+    if not in_place:
+        lev_bnds_sel = lev_bnds_sel.copy()
+    lev_bnds_sel[lev_bnds_sel > depth_bottom] = depth_bottom
+    lev_bnds_sel[lev_bnds_sel < depth_top] = depth_top
+    levs_weights = lev_bnds_sel[:,1]-lev_bnds_sel[:,0]
+    levs_weights_DA = xr.DataArray(levs_weights,coords={'lev': levs_slice.lev}, dims=['lev'])
+
+    # Compute depth weighted mean of ocean slice
+    return levs_slice.weighted(levs_weights_DA).mean(("lev"))
+
+def open_thetao(file_thetao):
+    '''
+    Open NEMO output file with the dimension names of the areacello file (as ThetaoDrivenFreshwaterForcing.py)
+    '''
+    ds = xr.open_dataset(file_thetao)
+    return ds.rename({'y':'j','x':'i','nav_lon':'longitude','nav_lat':'latitude','olevel':'lev'})
+
+def sector_mean(ds_thetao_year, ds_lev_bnds, ds_area, sector):
+    '''
+    Volume weighted mean temperature of a sector: area weighted mean followed by the depth weighted mean
+    '''
+    return float(lev_weighted_mean(area_weighted_mean(ds_thetao_year,ds_area,sector),ds_lev_bnds,sector))
+
+def original_sector_means(ds_thetao_year, ds_lev_bnds, ds_area, sectors):
+    '''
+    Volume weighted mean temperatures of the sectors in the order of the loop of ThetaoDrivenFreshwaterForcing.py,
+    with the level bounds clipped in place by every sector as in the original scripts (on a copy of ds_lev_bnds)
+    '''
+    ds_lev_bnds = ds_lev_bnds.copy(deep=True)
+    return {sector: float(lev_weighted_mean(area_weighted_mean(ds_thetao_year,ds_area,sector),ds_lev_bnds,sector,
+                                            in_place=True))
+            for sector in sectors}
+
+def annual_mean(ds, weighted=True):
+    '''
+    Annual mean of the monthly records of thetao, weighted with the month lengths of the time bounds as in the coupler
+    (weighted=False: unweighted mean of the original scripts)
+    '''
+    if not weighted:
+        return ds['thetao'].mean('time_counter')
+    time_bnds = ds[ds['time_counter'].attrs.get('bounds', 'time_counter_bounds')]
+    lengths = (time_bnds[:,1] - time_bnds[:,0]).dt.total_seconds().drop_vars(time_bnds.dims[1], errors='ignore')
+    return ds['thetao'].weighted(lengths).mean('time_counter')
+
+############################### Coupler ###############################
+
+## Response function regions of the ocean sectors
+LRF_sector = {'eais': 'R1',
+              'ross': 'R2',
+              'amun': 'R3',
+              'wedd': 'R4',
+              'apen': 'R5'}
+
+def response_functions(path_lrfs, ism, bm, sectors):
+    '''
+    Dataframe (lag, sector) with the linear response functions read from the text files
+    '''
+    import pandas as pd
+
+    # Create empty dataframe for storing linear response functions
+    dfRF=pd.DataFrame(columns=[sectors],index=np.arange(200))
+    for sector in sectors:
+        with open(f'{path_lrfs}/TotalFW/RF_{ism}_BM{bm}_{LRF_sector[sector]}.dat') as f:
+            dfRF[sector] = np.array([float(row) for row in f])
+    return dfRF
+
+def coupler_monitoring(df_thetao, df_thetao_baseline, path_lrfs, ism, bm, gamma, period, FWF_total_yearmin, year_max,
+                       file_future_forcing, T_f=None):
+    '''
+    Running mean temperatures, basal melt anomalies, freshwater forcing anomalies and total freshwater forcing of every
+    year as ThetaoDrivenFreshwaterForcing.py computed them year by year from its csv files (running_mean_backward,
+    basal_melt_anomalies and freshwater_flux_anomaly_df, which are unchanged)
+
+    Args:
+        df_thetao: dataframe with the sector mean temperatures of every year (index year)
+        df_thetao_baseline: dataframe with the baseline temperatures (OceanSectorThetao_piControl.csv)
+        path_lrfs, ism, bm: directory, ice sheet model and basal melt forcing of the response functions
+        gamma, period, FWF_total_yearmin: settings of config.py
+        year_max: last year of the experiment
+        file_future_forcing: path of the cumulative forcing csv file (written)
+        T_f: freezing point temperature (optional, default from constants.py as in the original scripts)
+
+    Returns:
+        Dictionary with dataframes thetao_rm, dBM, dFWF, FWF_total (index year) and future_fwf
+    '''
+    import pandas as pd
+    import BasalMelt as BM
+    import FreshWaterForcing as FWF
+    import ThetaoSectors as TS
+    from constants import T_f as T_f_constants
+
+    T_f = T_f_constants if T_f is None else T_f
+    sectors = list(df_thetao.columns)
+    year_min = int(df_thetao.index[0])
+    df_thetao_all = df_thetao.rename_axis('year').reset_index() # as read from the csv file
+
+    dfRF = response_functions(path_lrfs, ism, bm, sectors)
+    results = {'thetao_rm': [], 'dBM': [], 'dFWF': [], 'FWF_total': []}
+    for year in df_thetao.index:
+        df_thetao_running_mean = TS.running_mean_backward(df_thetao_all[df_thetao_all['year'] <= year], df_thetao_baseline,
+                                                          year, year_min, period)
+        df_dBM = BM.basal_melt_anomalies(df_thetao_baseline.loc[1850],df_thetao_running_mean.loc[year], gamma, T_f)
+        df_dBM.index=[year]
+
+        length = year_max+1-year_min
+        t = year - year_min
+        with warnings.catch_warnings():
+            # The cumulative forcing of the first year is an integer dataframe that is filled with floats
+            warnings.simplefilter('ignore', FutureWarning)
+            df_dFWF = FWF.freshwater_flux_anomaly_df(t,length,df_dBM,dfRF,file_future_forcing)
+        df_dFWF.index=[year]
+
+        df_total_FWF_Gt = df_dFWF.sum(axis=1) + FWF_total_yearmin
+        for var, df in zip(results, [df_thetao_running_mean, df_dBM, df_dFWF, df_total_FWF_Gt.to_frame('0')]):
+            results[var].append(df.astype(float))
+
+    results = {var: pd.concat(dfs).rename_axis('year') for var, dfs in results.items()}
+    results['future_fwf'] = pd.read_csv(file_future_forcing, index_col=0)
+    return results
+
+############################### Forcing files ###############################
+
+def forcing_dataset(FWF_total_Gt, file_basal_melt_mask, file_calving_mask, file_area, time, initial=False):
+    '''
+    Forcing dataset of ThetaoDrivenFreshwaterForcing.py (initial=True: InitialiseFreshwaterForcing.py), written by
+    the original scripts with to_netcdf(file_forcing, unlimited_dims=['time_counter'])
+
+    Args:
+        FWF_total_Gt: total freshwater forcing [Gt/yr]
+        file_basal_melt_mask, file_calving_mask, file_area: paths of the mask and areacello files
+        time: time values of the monthly records
+        initial: attributes of the initial forcing file
+    '''
+    from constants import spy, kg_per_Gt
+
+    basal_melt_mask = xr.open_dataset(file_basal_melt_mask)
+    calving_mask = xr.open_dataset(file_calving_mask)
+    ds_area = xr.open_dataset(file_area)
+    basal_melt_area = ds_area.areacello.where(basal_melt_mask.basal_melt_mask).sum('j').sum('i').values
+    calving_area = ds_area.areacello.where(calving_mask.calving_mask).sum('j').sum('i').values
+
+    #The distribution of this total meltwater flux between basal melt and calving is fixed using the observed mass loss by Rignot et al. 2013
+    basal_melt_flux = 0.55*FWF_total_Gt*kg_per_Gt/spy/float(basal_melt_area)
+    calving_flux = 0.45*FWF_total_Gt*kg_per_Gt/spy/float(calving_area)
+
+    FWF_basal_melt = (basal_melt_flux*basal_melt_mask).rename({'basal_melt_mask':'sorunoff_f'})
+    FWF_calving = (calving_flux*calving_mask).rename({'calving_mask':'socalving_f'})
+
+    FWF_basal_melt = FWF_basal_melt.sorunoff_f.expand_dims({'time_counter': time})
+    FWF_basal_melt.attrs = {'long_name':'basal melt flux' if initial else 'runoff flux', 'units':'kg/m^2/s'}
+    FWF_basal_melt = FWF_basal_melt.fillna(0) #set nans to zeros
+
+    FWF_calving = FWF_calving.socalving_f.expand_dims({'time_counter': time})
+    FWF_calving.attrs = {'long_name':'calving flux', 'units':'kg/m^2/s'}
+    FWF_calving = FWF_calving.fillna(0) #set nans to zeros
+
+    ds_FWF = xr.merge([FWF_basal_melt, FWF_calving])
+    ds_FWF = ds_FWF.assign_coords({'time_counter': time})
+    if initial:
+        ds_FWF.attrs = {'long_name': 'freshwater fluxes', 'units':'kg/m^2/s'}
+    return ds_FWF
+
+def zshelf_dataset(file_basal_melt_mask, depth_nemo):
+    '''
+    Basal melt depth (zshelf) dataset of InitialiseFreshwaterForcing.py, written by the original script with
+    to_netcdf(file_bm, unlimited_dims=['time_counter'])
+
+    Args:
+        file_basal_melt_mask: path of basal melt mask file
+        depth_nemo: level bound of the depth [m]
+    '''
+    ds_bm_mask = xr.open_dataarray(file_basal_melt_mask)
+
+    ds_zshelf = ds_bm_mask.where(ds_bm_mask > 0)
+    ds_zshelf.name = 'bmdepth'
+    ds_zshelf = ds_zshelf.fillna(0)
+    df_zshelf = ds_zshelf.values
+    df_zshelf[df_zshelf>0] = depth_nemo
+    ds_zshelf.attrs = {'long_name':'basal melt depth', 'units':'m'}
+    ds_zshelf = ds_zshelf.expand_dims({'time_counter': 1})
+    return ds_zshelf
+
+def write_depth_field(file_basal_melt_mask, file_zshelf, depth):
+    '''
+    Basal melt depth file of one depth as written by ForcingTemplate.write_depth_field (netCDF4 version of
+    zshelf_dataset, before the depths of many pairs were written at once by DepthDistribution.py)
+    '''
+    import ForcingTemplate as FT
+
+    values = FT.read_field(file_basal_melt_mask, FT.forcing_masks['sorunoff_f'])
+
+    file_tmp = f'{file_zshelf}.{os.getpid()}.tmp'
+    with netCDF4.Dataset(file_basal_melt_mask) as nc_mask, netCDF4.Dataset(file_tmp, 'w') as nc:
+        dims = nc_mask[FT.forcing_masks['sorunoff_f']].dimensions
+        nc.createDimension('time_counter', None)
+        FT.copy_coordinates(nc_mask, nc, dims, FT.forcing_masks['sorunoff_f'])
+        nc_var = nc.createVariable('bmdepth', 'f8', ('time_counter',) + dims, fill_value=np.nan)
+        nc_var.setncatts({'long_name':'basal melt depth', 'units':'m'})
+        nc_var[0] = np.where(values > 0, depth, 0.)
+    os.replace(file_tmp, file_zshelf)
@@ -0,0 +1,104 @@
+# Parallel batch computation of the sector temperatures (analysis/BatchThetaoSectors.py) on the synthetic experiment
+
+## Import modules
+import os
+import shutil
+import subprocess
+import sys
+
+import numpy as np
+import pandas as pd
+
+from helpers import year_min, n_years, exp_name
+
+path_analysis = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'analysis')
+sectors = ['eais','wedd','amun','ross','apen']
+year_max = year_min + n_years - 1
+
+def run_batch(start_dir, run_dir, n_workers=2):
+    '''
+    Run BatchThetaoSectors.py for all legs, returns the completed process and the output file
+    '''
+    process = subprocess.run([sys.executable, 'BatchThetaoSectors.py', str(year_min), str(year_max), exp_name,
+                              start_dir, run_dir, '1', str(n_years), str(n_workers)],
+                             cwd=path_analysis, capture_output=True, text=True)
+    return process, f'{start_dir}/fwf/interactive/forcing_files/{exp_name}/OceanSectorThetao_{exp_name}_{year_min}_{year_max}.csv'
+
+def runtime_copy(experiment, tmp_path):
+    '''
+    Runtime directory with the inputs of the synthetic experiment and no output
+    '''
+    start_dir = str(tmp_path)
+    shutil.copytree(f"{experiment['root']}/fwf/interactive/input", f'{start_dir}/fwf/interactive/input')
+    os.makedirs(f'{start_dir}/fwf/interactive/forcing_files/{exp_name}')
+    return start_dir
+
+def test_batch_matches_original(experiment, reference_means, tmp_path):
+    '''
+    All years in parallel vs. the sector means of the original scripts; years already in the output file are kept
+    '''
+    start_dir = runtime_copy(experiment, tmp_path)
+    process, output_thetao = run_batch(start_dir, experiment['root'])
+    assert process.returncode == 0, process.stdout + process.stderr
+
+    df_thetao = pd.read_csv(output_thetao, index_col=0, float_precision='round_trip')
+    assert list(df_thetao.index) == list(range(year_min, year_max+1))
+    np.testing.assert_allclose(df_thetao[sectors].values, [[means[sector] for sector in sectors] for means in reference_means],
+                               rtol=1e-12)
+
+    ## Running again with the first year changed in the file: nothing to do, file unchanged
+    df_thetao.loc[year_min] = 0.
+    df_thetao.to_csv(output_thetao)
+    with open(output_thetao) as f:
+        content = f.read()
+    process, output_thetao = run_batch(start_dir, experiment['root'])
+    assert process.returncode == 0 and '0 years to process' in process.stdout
+    with open(output_thetao) as f:
+        assert f.read() == content
+
+def test_batch_repeated_year(experiment, reference_means, tmp_path):
+    '''
+    A year appended twice to the output file is written once, with its last row
+    '''
+    start_dir = runtime_copy(experiment, tmp_path)
+    output_thetao = f'{start_dir}/fwf/interactive/forcing_files/{exp_name}/OceanSectorThetao_{exp_name}_{year_min}_{year_max}.csv'
+    df_thetao = pd.DataFrame([[0.]*len(sectors), [reference_means[0][sector] for sector in sectors]],
+                             index=pd.Index([year_min, year_min], name='year'), columns=sectors)
+    df_thetao.to_csv(output_thetao, float_format='%.17g')
+
+    process, output_thetao = run_batch(start_dir, experiment['root'])
+    assert process.returncode == 0 and f'{n_years-1} years to process, 1 years already' in process.stdout
+    df_thetao = pd.read_csv(output_thetao, index_col=0, float_precision='round_trip')
+    assert list(df_thetao.index) == list(range(year_min, year_max+1))
+    np.testing.assert_allclose(df_thetao[sectors].values, [[means[sector] for sector in sectors] for means in reference_means],
+                               rtol=1e-12)
+
+def test_batch_keeps_years_when_a_year_fails(experiment, reference_means, tmp_path):
+    '''
+    A year with unreadable NEMO output is reported and the script fails, the other years are written;
+    a second run with the output repaired only computes the failed year
+    '''
+    start_dir = runtime_copy(experiment, f'{tmp_path}/start')
+    run_dir = f'{tmp_path}/run'
+    for leg, file_thetao in enumerate(experiment['files_thetao'], 1):
+        path_nemo = f'{run_dir}/output/nemo/{str(leg).zfill(3)}'
+        os.makedirs(path_nemo)
+        os.symlink(file_thetao, f'{path_nemo}/{os.path.basename(file_thetao)}')
+    file_failed = f'{run_dir}/output/nemo/002/{os.path.basename(experiment["files_thetao"][1])}'
+    os.remove(file_failed)
+    with open(file_failed, 'w') as f:
+        f.write('not a netcdf file')
+
+    process, output_thetao = run_batch(start_dir, run_dir)
+    assert process.returncode != 0
+    assert f'{year_min+1} {file_failed}' in process.stdout
+    df_thetao = pd.read_csv(output_thetao, index_col=0, float_precision='round_trip')
+    assert list(df_thetao.index) == [year_min, year_min+2]
+
+    os.remove(file_failed)
+    os.symlink(experiment['files_thetao'][1], file_failed)
+    process, output_thetao = run_batch(start_dir, run_dir)
+    assert process.returncode == 0 and '1 years to process' in process.stdout
+    df_thetao = pd.read_csv(output_thetao, index_col=0, float_precision='round_trip')
+    np.testing.assert_allclose(df_thetao[sectors].values, [[means[sector] for sector in sectors] for means in reference_means],
+                               rtol=1e-12)
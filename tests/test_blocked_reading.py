@@ -0,0 +1,55 @@
+# Sector means computed block by block within a memory budget (NemoOutput.sector_means_blocked) vs. the area and
+# depth weighted means of the original scripts
+
+## Import modules
+import numpy as np
+import pytest
+
+import Coupler as CP
+import CouplerState as CS
+import NemoOutput as NO
+from helpers import year_min, n_years, coupler_run, couple_years, assert_same_forcing_file
+
+## Memory budgets [MB]: whole field, blocks of layers, blocks of rows of a layer, single rows
+memory_budgets = [None, 5., 0.05, 0.001]
+
+def test_blocks_cover_field():
+    '''
+    Every cell of the field is in exactly one block, and blocks fit in the budget unless a block is a single row
+    '''
+    shape = (20, 60, 360)
+    for memory_budget in memory_budgets:
+        count = np.zeros(shape, dtype=int)
+        for lev_slice, j_slice in NO.block_slices(shape, memory_budget):
+            count[lev_slice, j_slice] += 1
+            cells = (lev_slice.stop-lev_slice.start)*(j_slice.stop-j_slice.start)*shape[2]
+            if memory_budget is not None and j_slice.stop-j_slice.start > 1:
+                assert cells*NO.bytes_per_cell <= memory_budget*1.e6
+        assert (count == 1).all(), memory_budget
+
+def test_blocked_means_match_original(experiment, sector_index, reference_means):
+    '''
+    Means of every budget vs. area_weighted_mean followed by lev_weighted_mean, for every year; the operator is
+    reused between years
+    '''
+    for memory_budget in memory_budgets:
+        operator = None
+        for file_thetao, reference_mean in zip(experiment['files_thetao'], reference_means):
+            means, operator = NO.sector_means_blocked(file_thetao, sector_index, CP.sectors, memory_budget, operator)
+            for sector in CP.sectors:
+                assert means[sector] == pytest.approx(reference_mean[sector], rel=1e-12, abs=1e-12), f'{memory_budget} {sector}'
+
+def test_coupler_run_with_memory_budget(experiment, straight_run, tmp_path_factory, monkeypatch):
+    '''
+    Coupler run with a memory budget gives the sector temperatures and forcing of the run without, the NEMO output
+    is not opened with xarray
+    '''
+    monkeypatch.setattr(CP, 'memory_budget', 0.05)
+    monkeypatch.setattr(NO, 'open_thetao_subset', None)
+    files, static = coupler_run(experiment, tmp_path_factory)
+    state = couple_years(files, static, range(year_min, year_min+n_years))
+    state_straight = CS.open_state(straight_run[0]['path_state'])
+    for var in ['thetao', 'dBM', 'FWF_total']:
+        np.testing.assert_allclose(state[var], state_straight[var], rtol=1e-12, atol=1e-14, err_msg=var)
+    for year in range(year_min, year_min+n_years):
+        assert_same_forcing_file(CP.forcing_file(files, year), CP.forcing_file(straight_run[0], year))
@@ -0,0 +1,136 @@
+# Coupler daemon (CouplerDaemon.py) in watch and fifo mode vs. the coupler run year by year
+
+## Import modules
+import os
+import shutil
+import subprocess
+import sys
+import time
+
+import xarray as xr
+
+import Coupler as CP
+import CouplerState as CS
+from helpers import year_min, n_years, exp_name, assert_same_run
+
+path_scripts = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scripts')
+year_max = year_min + n_years - 1
+timeout = 60 # [s]
+
+def daemon_run(experiment, tmp_path, legs):
+    '''
+    Runtime directory with the inputs of the synthetic experiment and a run directory with the NEMO output of legs
+    '''
+    start_dir, run_dir = f'{tmp_path}/start', f'{tmp_path}/run'
+    shutil.copytree(f"{experiment['root']}/fwf", f'{start_dir}/fwf')
+    files = CP.coupler_files(year_min, year_max, exp_name, start_dir, run_dir)
+    for leg in legs:
+        copy_thetao(experiment, files, leg)
+    return files
+
+def copy_thetao(experiment, files, leg):
+    '''
+    Copy NEMO output file of a leg to the run directory at once
+    '''
+    file_thetao = CP.thetao_file(files, year_min+leg-1, leg)
+    os.makedirs(os.path.dirname(file_thetao), exist_ok=True)
+    shutil.copyfile(experiment['files_thetao'][leg-1], f'{file_thetao}.tmp')
+    os.replace(f'{file_thetao}.tmp', file_thetao)
+    return file_thetao
+
+def start_daemon(files, mode, file_log):
+    '''
+    Start CouplerDaemon.py for the experiment, output written to file_log
+    '''
+    with open(file_log, 'w') as f:
+        return subprocess.Popen([sys.executable, 'CouplerDaemon.py', str(year_min), str(year_max), exp_name,
+                                 files['path_output'].split('/fwf/')[0], files['run_dir'], mode],
+                                cwd=path_scripts, stdout=f, stderr=subprocess.STDOUT)
+
+def read_log(file_log):
+    '''
+    Output of the daemon
+    '''
+    with open(file_log) as f:
+        return f.read()
+
+def wait_until(condition, process, file_log):
+    '''
+    Wait until condition is true while the daemon is running
+    '''
+    start = time.time()
+    while not condition():
+        assert process.poll() is None, read_log(file_log)
+        assert time.time() - start < timeout
+        time.sleep(0.1)
+
+def test_watch_waits_for_complete_output(experiment, straight_run, tmp_path):
+    '''
+    Watch mode processes the complete files in order and waits while the file of the last year is unreadable or has
+    only part of the months, until all months are written or the run script writes the done marker
+    '''
+    files = daemon_run(experiment, tmp_path, range(1, n_years))
+    file_last = CP.thetao_file(files, year_max, n_years)
+    os.makedirs(os.path.dirname(file_last), exist_ok=True)
+    with open(file_last, 'wb') as f:
+        f.write(b'CDF\x02 file being copied')
+
+    file_log = f'{tmp_path}/CouplerDaemon.log'
+    process = start_daemon(files, 'watch', file_log)
+    try:
+        wait_until(lambda: os.path.isfile(CP.forcing_file(files, year_max-1)), process, file_log)
+
+        ## Unreadable, then 6 of 12 months
+        time.sleep(3)
+        with xr.open_dataset(experiment['files_thetao'][-1]) as ds:
+            ds.isel(time_counter=slice(0, 6)).to_netcdf(f'{file_last}.tmp')
+        os.replace(f'{file_last}.tmp', file_last)
+        time.sleep(5)
+        assert not os.path.isfile(CP.forcing_file(files, year_max))
+        assert process.poll() is None
+
+        ## Complete file with the done marker
+        copy_thetao(experiment, files, n_years)
+        open(f'{file_last}.done', 'w').close()
+        process.wait(timeout=timeout)
+    finally:
+        process.kill()
+    output = read_log(file_log)
+    assert process.returncode == 0, output
+    assert 'FINISHED FRESHWATER FORCING DAEMON' in output
+    assert_same_run(straight_run[0], files)
+
+def test_fifo_requests(experiment, straight_run, tmp_path):
+    '''
+    Fifo mode replies with the total forcing of every requested year, ERROR for a failed request, and stops on request
+    '''
+    files = daemon_run(experiment, tmp_path, range(1, n_years+1))
+    file_request = f"{files['path_output']}/CouplerDaemon.request"
+    file_reply = f"{files['path_output']}/CouplerDaemon.reply"
+
+    file_log = f'{tmp_path}/CouplerDaemon.log'
+    process = start_daemon(files, 'fifo', file_log)
+    try:
+        wait_until(lambda: os.path.exists(file_request) and os.path.exists(file_reply), process, file_log)
+        replies = []
+        for request in [f'{year} {year-year_min+1}' for year in range(year_min, year_max+1)] + [f'{year_max+1} {n_years+1}']:
+            with open(file_request, 'w') as f:
+                f.write(request + '\n')
+            with open(file_reply) as f:
+                replies.append(f.read().strip())
+        with open(file_request, 'w') as f:
+            f.write('stop\n')
+        process.wait(timeout=timeout)
+    finally:
+        process.kill()
+    output = read_log(file_log)
+    assert process.returncode == 0, output
+
+    state = CS.open_state(straight_run[0]['path_state'])
+    for k, reply in enumerate(replies[:-1]):
+        year, FWF_total_Gt = reply.split()
+        assert int(year) == year_min + k
+        assert float(FWF_total_Gt) == state['FWF_total'][k]
+    assert replies[-1] == f'ERROR {year_max+1} {n_years+1}' # no NEMO output
+    assert not os.path.exists(file_request) and not os.path.exists(file_reply)
+    assert_same_run(straight_run[0], files)
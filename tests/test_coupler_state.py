@@ -0,0 +1,123 @@
+# Binary coupler state store (CouplerState.py) vs. the csv files of the original driver script
+
+## Import modules
+import os
+import shutil
+import subprocess
+import sys
+
+import numpy as np
+import pandas as pd
+
+import Coupler as CP
+import CouplerState as CS
+import reference
+from config import gamma, ism, bm, running_mean_period, FWF_total_yearmin
+from helpers import year_min, n_years, exp_name, coupler_run, couple_years, assert_same_run
+
+year_max = year_min + n_years - 1
+path_scripts = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scripts')
+
+def read_monitoring(files, name):
+    '''
+    Read exported monitoring file
+    '''
+    suffix = 'Future' if name.startswith('Cumulative') else f'{year_min}_{year_max}'
+    return pd.read_csv(f"{files['path_output']}/{name}_{exp_name}_{suffix}.csv", index_col=0, float_precision='round_trip')
+
+def test_monitoring_matches_original(straight_run, reference_means, tmp_path):
+    '''
+    Monitoring files exported from the state store vs. the csv files the original driver script wrote year by year
+    '''
+    files, static = straight_run
+    df_thetao = read_monitoring(files, 'OceanSectorThetao')
+    np.testing.assert_allclose(df_thetao[CP.sectors].values, [[means[sector] for sector in CP.sectors] for means in reference_means],
+                               rtol=1e-12)
+
+    original = reference.coupler_monitoring(df_thetao, static['df_thetao_baseline'], files['path_lrfs'], ism, bm, gamma,
+                                            running_mean_period, FWF_total_yearmin, year_max, f'{tmp_path}/Future.csv')
+    names = {'thetao_rm': f'OceanSectorThetao_{running_mean_period}yRM', 'dBM': 'BasalMeltAnomaly',
+             'dFWF': 'FreshwaterForcingAnomaly', 'FWF_total': 'TotalFreshwaterForcing',
+             'future_fwf': 'CumulativeFreshwaterForcingAnomaly'}
+    for var, name in names.items():
+        df = read_monitoring(files, name)
+        assert list(df.index) == list(original[var].index), var
+        assert list(df.columns) == list(original[var].columns), var
+        np.testing.assert_allclose(df.values, original[var].values, rtol=1e-12, atol=1e-9, err_msg=var)
+
+def test_state_store_round_trip(tmp_path):
+    '''
+    Values written to the memory-mapped store are read back after reopening, years not computed are missing
+    '''
+    path_state = f'{tmp_path}/state'
+    state = CS.create_state(path_state, year_min, year_max, CP.sectors, [3, 2])
+    CS.init_running_mean(state, np.zeros(len(CP.sectors)))
+    assert CS.next_step(state) == 0
+    for t in range(2):
+        CS.update_running_mean(state, t, np.full(len(CP.sectors), t+1.))
+    CS.flush_state(state)
+    del state
+
+    state = CS.open_state(path_state)
+    assert state['meta']['running_mean_periods'] == [3, 2]
+    assert CS.next_step(state) == 2
+    np.testing.assert_array_equal(state['thetao_rm'][:2], [[1/3]*5, [1.]*5])
+    np.testing.assert_array_equal(state['thetao_rm_periods'][1,1], [1.5]*5)
+    assert np.isnan(state['thetao'][2]).all()
+    assert list(CS.state_dataframe(state, 'thetao').index) == [year_min, year_min+1]
+    assert list(CS.state_dataframe(state, 'thetao_rm_2').columns) == CP.sectors
+
+def test_missing_state_seeded_from_csv(experiment, straight_run, tmp_path_factory):
+    '''
+    A coupler state created from the monitoring csv files (exported with ExportMonitoring.py) continues as the straight run
+    '''
+    files, static = coupler_run(experiment, tmp_path_factory)
+    years = list(range(year_min, year_min+n_years))
+    couple_years(files, static, years[:-1])
+    CS.export_csv(CS.open_state(files['path_state']), files['path_output'], exp_name, running_mean_period)
+    shutil.rmtree(files['path_state'])
+    couple_years(files, static, years[-1:])
+    assert_same_run(straight_run[0], files)
+
+def run_prescribed(start_dir, run_dir, year):
+    '''
+    Run PrescribedFreshwaterForcing.py for one year
+    '''
+    return subprocess.run([sys.executable, 'PrescribedFreshwaterForcing.py', str(year_min), str(year_max), str(year),
+                           str(year-year_min+1), exp_name, start_dir, run_dir], cwd=path_scripts, capture_output=True, text=True)
+
+def test_prescribed_state_seeded_from_csv(experiment, tmp_path):
+    '''
+    Prescribed forcing: a missing state store is created from the monitoring csv files (exported with
+    ExportMonitoring.py) and continues as the straight run, only the temperatures are exported; without the csv
+    file the state store is not created
+    '''
+    paths = {}
+    for run, years in {'straight': range(year_min, year_max+1), 'seeded': [year_min, year_min+1, 'remove', year_max]}.items():
+        start_dir = f'{tmp_path}/{run}'
+        shutil.copytree(f"{experiment['root']}/fwf", f'{start_dir}/fwf')
+        paths[run] = f'{start_dir}/fwf/interactive/forcing_files/{exp_name}'
+        for year in years:
+            if year == 'remove':
+                process = subprocess.run([sys.executable, 'ExportMonitoring.py', str(year_min), str(year_max), exp_name, start_dir],
+                                         cwd=path_scripts, capture_output=True, text=True)
+                assert process.returncode == 0, process.stdout + process.stderr
+                shutil.rmtree(f'{paths[run]}/CouplerState_{exp_name}_{year_min}_{year_max}')
+                continue
+            process = run_prescribed(start_dir, experiment['root'], year)
+            assert process.returncode == 0, process.stdout + process.stderr
+
+    state_straight = CS.open_state(f'{paths["straight"]}/CouplerState_{exp_name}_{year_min}_{year_max}')
+    state_seeded = CS.open_state(f'{paths["seeded"]}/CouplerState_{exp_name}_{year_min}_{year_max}')
+    for var in state_straight:
+        if var != 'meta':
+            np.testing.assert_array_equal(state_seeded[var], state_straight[var], err_msg=var)
+    exported = sorted(file for file in os.listdir(paths['seeded']) if file.endswith('.csv'))
+    assert all(file.startswith('OceanSectorThetao') for file in exported), exported
+
+    ## No monitoring file: error, nothing written
+    os.remove(f'{paths["seeded"]}/OceanSectorThetao_{exp_name}_{year_min}_{year_max}.csv')
+    shutil.rmtree(f'{paths["seeded"]}/CouplerState_{exp_name}_{year_min}_{year_max}')
+    process = run_prescribed(f'{tmp_path}/seeded', experiment['root'], year_max)
+    assert process.returncode != 0 and 'FileNotFoundError' in process.stderr
+    assert not os.path.isdir(f'{paths["seeded"]}/CouplerState_{exp_name}_{year_min}_{year_max}')
@@ -0,0 +1,114 @@
+# Basal melt depth files of a table of depth pairs (DepthDistribution.py) vs. the layers of
+# ThetaoSectors.nearest_above/nearest_below and the depth files of the original script
+
+## Import modules
+import filecmp
+
+import netCDF4
+import numpy as np
+import pytest
+import xarray as xr
+
+import DepthDistribution as DD
+import ThetaoSectors as TS
+import reference
+from config import bm_dep1, bm_dep2
+
+@pytest.fixture(scope='module')
+def lev_bnds(experiment):
+    '''
+    Level bounds of the NEMO output of the synthetic experiment
+    '''
+    with netCDF4.Dataset(experiment['files_thetao'][0]) as nc:
+        return np.asarray(nc['olevel_bounds'][:], dtype='float64')
+
+def read_depth(file):
+    '''
+    Depth field of a basal melt depth file
+    '''
+    with netCDF4.Dataset(file) as nc:
+        return np.asarray(nc['bmdepth'][0])
+
+def test_snap_matches_nearest(lev_bnds):
+    '''
+    Snapped depths vs. the level bounds of nearest_above and nearest_below, for depths between and on the
+    bounds; depths without such a layer are an error
+    '''
+    depths = np.concatenate([np.arange(0.5, lev_bnds[-1,1], 7.3), lev_bnds[:,0], lev_bnds[:,1]])
+    tops, bottoms = [], []
+    for depth in depths:
+        lev_top, lev_bottom = TS.nearest_above(lev_bnds[:,0], depth), TS.nearest_below(lev_bnds[:,1], depth)
+        if lev_top is not None:
+            tops.append((depth, lev_bnds[lev_top,0]))
+            assert DD.snap_top(lev_bnds, depth) == lev_bnds[lev_top,0], depth
+        else:
+            with pytest.raises(ValueError, match='No layer starts below'):
+                DD.snap_top(lev_bnds, depth)
+        if lev_bottom is not None:
+            bottoms.append((depth, lev_bnds[lev_bottom,1]))
+            assert DD.snap_bottom(lev_bnds, depth) == lev_bnds[lev_bottom,1], depth
+        else:
+            with pytest.raises(ValueError, match='No layer ends above'):
+                DD.snap_bottom(lev_bnds, depth)
+
+    ## All depths at once
+    depth, expected = np.array(tops).T
+    np.testing.assert_array_equal(DD.snap_top(lev_bnds, depth), expected)
+    depth, expected = np.array(bottoms).T
+    np.testing.assert_array_equal(DD.snap_bottom(lev_bnds, depth), expected)
+
+def test_default_files_match_original(experiment, lev_bnds, tmp_path):
+    '''
+    Depth files of the default depth pair vs. the files of write_depth_field (byte by byte) and the dataset of
+    the original script
+    '''
+    files = experiment['files']
+    DD.write_depth_files(files['file_basal_melt_mask'], {'': (bm_dep1, bm_dep2)}, lev_bnds, tmp_path)
+    depths_nemo = [lev_bnds[TS.nearest_above(lev_bnds[:,0], bm_dep1),0], lev_bnds[TS.nearest_below(lev_bnds[:,1], bm_dep2),1]]
+    for file, depth_nemo in zip(DD.depth_files(tmp_path, ''), depths_nemo):
+        file_original = f'{tmp_path}/original.nc'
+        reference.write_depth_field(files['file_basal_melt_mask'], file_original, depth_nemo)
+        assert filecmp.cmp(file, file_original, shallow=False), file
+
+        with xr.open_dataset(file) as ds:
+            ds_zshelf = reference.zshelf_dataset(files['file_basal_melt_mask'], depth_nemo)
+            np.testing.assert_array_equal(ds['bmdepth'].values, ds_zshelf.values)
+            assert ds['bmdepth'].attrs == ds_zshelf.attrs
+
+def test_depths_per_sector(experiment, lev_bnds, tmp_path):
+    '''
+    Depth table with depths per sector (default for the other cells), a constant pair and a per cell pair
+    vs. the sector masks of the original scripts
+    '''
+    files = experiment['files']
+    file_table = f'{tmp_path}/depths.csv'
+    with open(file_table, 'w') as f:
+        f.write('label,sector,depth_top,depth_bottom\n# comment\nsect,amun,300,600\nsect,default,200,700\nconst,default,250,800\n')
+    table = DD.read_depth_table(file_table)
+    assert table == {'sect': {'amun': (300., 600.), 'default': (200., 700.)}, 'const': (250., 800.)}
+
+    with netCDF4.Dataset(files['file_basal_melt_mask']) as nc:
+        mask = np.asarray(nc['basal_melt_mask'][:]) > 0
+    depth_cell = np.where(np.indices(mask.shape)[1] < mask.shape[1]//2, 300., 400.)
+    table['cell'] = (depth_cell, 700.)
+    snapped = DD.write_depth_files(files['file_basal_melt_mask'], table, lev_bnds, tmp_path, files['file_area'])
+
+    with xr.open_dataset(files['file_area']) as ds_area:
+        in_amun = reference.mask_sector(ds_area, 'amun').values
+    assert np.any(mask & in_amun) and np.any(mask & ~in_amun)
+    expected = {'sect': [np.where(in_amun, DD.snap_top(lev_bnds, 300.), DD.snap_top(lev_bnds, 200.)),
+                         np.where(in_amun, DD.snap_bottom(lev_bnds, 600.), DD.snap_bottom(lev_bnds, 700.))],
+                'const': [DD.snap_top(lev_bnds, 250.), DD.snap_bottom(lev_bnds, 800.)],
+                'cell': [DD.snap_top(lev_bnds, depth_cell), DD.snap_bottom(lev_bnds, 700.)]}
+    for label, depths in expected.items():
+        for k, (file, depth) in enumerate(zip(DD.depth_files(tmp_path, label), depths)):
+            np.testing.assert_array_equal(read_depth(file), np.where(mask, depth, 0.), err_msg=file)
+            np.testing.assert_array_equal(snapped[label][k], np.broadcast_to(depth, mask.shape)[mask], err_msg=file)
+
+    ## Unknown sector, cells in none of the sectors of a table without default, no whole layer between the depths
+    with pytest.raises(ValueError, match='Unknown sectors'):
+        DD.write_depth_files(files['file_basal_melt_mask'], {'x': {'pig': (300, 600)}}, lev_bnds, tmp_path, files['file_area'])
+    with pytest.raises(ValueError, match='default'):
+        DD.write_depth_files(files['file_basal_melt_mask'], {'x': {'amun': (300, 600)}}, lev_bnds, tmp_path, files['file_area'])
+    with pytest.raises(ValueError, match='No whole layer'):
+        DD.write_depth_files(files['file_basal_melt_mask'], {'x': (400, 401)}, lev_bnds, tmp_path)
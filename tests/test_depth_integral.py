@@ -0,0 +1,106 @@
+# Depth window means of the cumulative depth integral (DepthIntegral.py, DepthWindowSensitivity.py) vs. the layer
+# weighted means of the original scripts
+
+## Import modules
+import os
+import shutil
+import subprocess
+import sys
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+import Coupler as CP
+import DepthIntegral as DI
+import SyntheticInputs as SYN
+import ThetaoSectors as TS
+import reference
+from helpers import year_min, exp_name
+
+path_analysis = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'analysis')
+
+def test_window_means_match_original():
+    '''
+    Window means vs. lev_weighted_mean for partial layers, windows on layer bounds and missing layers
+    '''
+    rng = np.random.default_rng(0)
+    lev_bnds = xr.DataArray(SYN.level_bounds(), dims=('lev', 'bnds'))
+    profiles = rng.normal(size=(5, lev_bnds.shape[0]))
+    profiles[:,60:] = np.nan
+    profiles[2,40:] = np.nan
+    da_profiles = xr.DataArray(profiles, dims=('profile', 'lev'), coords={'lev': np.arange(lev_bnds.shape[0])})
+    integral = DI.depth_integral(profiles, lev_bnds)
+    windows = [(2.5, 40.), (17.3, 250.), (312.5, 712.5), (float(lev_bnds[20,0]), float(lev_bnds[30,1])), (1000., 4000.)]
+
+    for depth_bnds in windows:
+        original = reference.lev_weighted_mean(da_profiles, lev_bnds, None, depth_bnds=depth_bnds).values
+        np.testing.assert_allclose(DI.window_mean(integral, *depth_bnds), original, rtol=1e-12, equal_nan=True,
+                                   err_msg=str(depth_bnds))
+
+    ## Windows per profile are the diagonal of all profiles over all windows
+    depth_top, depth_bottom = DI.centred_windows(rng.uniform(100., 900., 5*4), [50., 100., 200.])
+    depth_top, depth_bottom = depth_top.reshape(5, 4, 3), depth_bottom.reshape(5, 4, 3)
+    np.testing.assert_array_equal(DI.window_mean(integral, depth_top, depth_bottom, per_profile=True),
+                                  DI.window_mean(integral, depth_top, depth_bottom)[np.arange(5), np.arange(5)])
+
+def test_lev_weighted_mean_matches_original(experiment):
+    '''
+    Depth weighted mean of the area weighted means of every sector vs. the original layer selection and clipping
+    (of a copy of the level bounds); the level bounds are not modified
+    '''
+    with xr.open_dataset(experiment['files']['file_area']) as ds_area, \
+         reference.open_thetao(experiment['files_thetao'][0]) as ds:
+        ds_thetao_year = reference.annual_mean(ds)
+        lev_bnds = ds['olevel_bounds'].values.copy()
+        for sector in CP.sectors:
+            area_mean = reference.area_weighted_mean(ds_thetao_year, ds_area, sector)
+            np.testing.assert_allclose(TS.lev_weighted_mean(area_mean, ds['olevel_bounds'], sector).values,
+                                       reference.lev_weighted_mean(area_mean, ds['olevel_bounds'], sector).values,
+                                       rtol=1e-12, err_msg=sector)
+        np.testing.assert_array_equal(ds['olevel_bounds'].values, lev_bnds)
+
+def test_lev_weighted_mean_original_sector_loop(experiment):
+    '''
+    The original lev_weighted_mean clipped the level bounds in place, so in the loop over the sectors of the driver
+    scripts every sector after the first used the bounds clipped by the sectors before it. Differences of the
+    original loop with lev_weighted_mean, which uses the bounds of the file for every sector (K, first year of the
+    synthetic ORCA1 experiment)
+    '''
+    with xr.open_dataset(experiment['files']['file_area']) as ds_area, \
+         reference.open_thetao(experiment['files_thetao'][0]) as ds:
+        ds_thetao_year = reference.annual_mean(ds)
+        original = reference.original_sector_means(ds_thetao_year, ds['olevel_bounds'], ds_area, CP.sectors)
+        means = {sector: float(TS.lev_weighted_mean(reference.area_weighted_mean(ds_thetao_year, ds_area, sector),
+                                                    ds['olevel_bounds'], sector))
+                 for sector in CP.sectors}
+
+    differences = [original[sector] - means[sector] for sector in CP.sectors]
+    np.testing.assert_allclose(differences, [0., -0.0103, -0.0297, -0.0408, 0.0727], atol=1e-4)
+
+def test_window_sensitivity_matches_original(experiment, tmp_path):
+    '''
+    DepthWindowSensitivity.py: mean of every sector, shelf depth and window thickness vs. the original sector
+    mean over that window
+    '''
+    start_dir = str(tmp_path)
+    shutil.copytree(f"{experiment['root']}/fwf", f'{start_dir}/fwf')
+    process = subprocess.run([sys.executable, 'DepthWindowSensitivity.py', str(year_min), str(year_min), '1', exp_name,
+                              start_dir, experiment['root'], '50,120', '-50,0,35'],
+                             cwd=path_analysis, capture_output=True, text=True)
+    assert process.returncode == 0, process.stderr
+    df_windows = pd.read_csv(f'{start_dir}/fwf/interactive/forcing_files/{exp_name}/OceanSectorThetaoWindows_{exp_name}_{year_min}.csv',
+                             index_col=[0,1,2])
+    assert len(df_windows) == len(CP.sectors)*3*2
+
+    with xr.open_dataset(experiment['files']['file_area']) as ds_area, \
+         reference.open_thetao(experiment['files_thetao'][0]) as ds:
+        ds_thetao_year = reference.annual_mean(ds)
+        for sector in CP.sectors:
+            area_mean = reference.area_weighted_mean(ds_thetao_year, ds_area, sector)
+            for (offset, thickness), row in df_windows.loc[sector].iterrows():
+                shelf_depth = reference.shelf_depths[sector] + offset
+                assert row['shelf_depth'] == shelf_depth
+                depth_bnds = (shelf_depth - thickness/2, shelf_depth + thickness/2)
+                original = float(reference.lev_weighted_mean(area_mean, ds['olevel_bounds'], sector, depth_bnds=depth_bnds))
+                np.testing.assert_allclose(row['thetao'], original, rtol=1e-12, err_msg=f'{sector} {offset} {thickness}')
@@ -0,0 +1,144 @@
+# One-pass builder of the distribution masks (preprocessing/DistributionMasks.py) on a synthetic runoff_maps.nc:
+# thresholds, ocean masks, zshelf files and the cached steps
+
+## Import modules
+import os
+import shutil
+
+import netCDF4
+import numpy as np
+import pytest
+
+import DistributionMasks as DM
+
+## Antarctic ids of the runoff-mapper start at 66: arrival points south of 62S, calving points south of 66S
+id_antarctic = 70
+
+def write_runoff_maps(file_runoff):
+    '''
+    Runoff maps on a regular 2 degree grid (north to south, as runoff_maps.nc) with a few missing ids
+    '''
+    lat = np.arange(89., -90., -2.)
+    lon = np.arange(0., 360., 2.)
+    lat2d = np.broadcast_to(lat[:,None], (lat.size, lon.size))
+    ids = {'drainage_basin_id': np.where(lat2d < -60., id_antarctic, 20),
+           'arrival_point_id': np.where(lat2d < -62., id_antarctic, 10),
+           'calving_point_id': np.where(lat2d < -66., id_antarctic, 65)}
+    with netCDF4.Dataset(file_runoff, 'w') as nc:
+        nc.createDimension('lat', lat.size)
+        nc.createDimension('lon', lon.size)
+        nc.createVariable('lat', 'f8', ('lat',))[:] = lat
+        nc.createVariable('lon', 'f8', ('lon',))[:] = lon
+        for name, values in ids.items():
+            nc_var = nc.createVariable(name, 'i4', ('lat','lon'), fill_value=-999)
+            nc_var[:] = np.ma.masked_where((lat2d > 0.) & (lon[None,:] < 30.), values)
+
+def read_output(file, name=None):
+    '''
+    Field of an output file (first record of the zshelf files), default: the mask or zshelf of the file name
+    '''
+    if name is None:
+        base = os.path.basename(file)
+        name = 'zshelf' if base.startswith('zshelf') else base[:-len('_ORCA1_ocean.nc')]
+    with netCDF4.Dataset(file) as nc:
+        values = np.asarray(nc[name][:])
+    return values[0] if values.ndim == 3 else values
+
+def touch(file):
+    '''
+    Change the modification time of a file (contents unchanged)
+    '''
+    stat = os.stat(file)
+    os.utime(file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+def cache_state(path_cache):
+    '''
+    Files in the cache directory with their modification times
+    '''
+    return {file: os.stat(f'{path_cache}/{file}').st_mtime_ns for file in os.listdir(path_cache)}
+
+@pytest.fixture
+def inputs(experiment, tmp_path):
+    '''
+    Synthetic runoff_maps.nc, copy of the areacello file of the synthetic ORCA1 grid and an output directory
+    '''
+    file_runoff = f'{tmp_path}/runoff_maps.nc'
+    write_runoff_maps(file_runoff)
+    file_area = f'{tmp_path}/areacello.nc'
+    shutil.copy(experiment['files']['file_area'], file_area)
+    return file_runoff, file_area, f'{tmp_path}/output'
+
+def test_masks_match_thresholds(inputs):
+    '''
+    Masks on the runoff-mapper grid: ids of at least 66 (missing ids: 0); masks on the ORCA1 ocean: regridded mask
+    positive on ocean cells (area > 0), zshelf files: depth on the basal melt mask
+    '''
+    file_runoff, file_area, path_output = inputs
+    written = DM.build_distribution_masks(file_runoff, file_area, path_output, depths=(200, 700))
+    assert sorted(os.path.basename(file) for file in written) == ['basal_melt_mask_ORCA1_ocean.nc', 'calving_mask_ORCA1_ocean.nc',
+                                                                 'zshelf_200m.nc', 'zshelf_700m.nc']
+
+    masks, lat, lon = DM.source_masks(file_runoff, DM.mask_specs)
+    with netCDF4.Dataset(file_runoff) as nc:
+        for name, spec in DM.mask_specs.items():
+            ids = nc[spec['variable']][:]
+            np.testing.assert_array_equal(masks[name], np.where(np.ma.filled(ids, -1) >= spec['id_min'], 1., 0.), err_msg=name)
+            assert np.ma.count_masked(ids) > 0 and not masks[name][np.ma.getmaskarray(ids)].any()
+
+    with netCDF4.Dataset(file_area) as nc:
+        area = np.ma.filled(nc['areacello'][:].astype('float64'), np.nan)
+        lat_orca = np.asarray(nc['latitude'][:])
+    ocean = np.isfinite(area) & (area > 0)
+    for name, lat_edge in [('basal_melt_mask', -62.), ('calving_mask', -66.)]:
+        mask = read_output(f'{path_output}/{name}_ORCA1_ocean.nc', name)
+        assert set(np.unique(mask)) == {0., 1.}, name
+        assert not mask[~ocean].any(), name
+        # Away from the edge of the source mask the bilinear interpolation is 1 or 0
+        assert (ocean & (lat_orca < lat_edge - 2.)).any() and (mask[ocean & (lat_orca < lat_edge - 2.)] == 1.).all(), name
+        assert (mask[lat_orca > lat_edge + 2.] == 0.).all(), name
+
+    basal_melt_mask = read_output(f'{path_output}/basal_melt_mask_ORCA1_ocean.nc', 'basal_melt_mask')
+    for depth in [200, 700]:
+        np.testing.assert_array_equal(read_output(f'{path_output}/zshelf_{depth}m.nc', 'zshelf'),
+                                      np.where(basal_melt_mask > 0, float(depth), 0.))
+
+def test_cached_steps(inputs):
+    '''
+    A second run writes nothing; touching runoff_maps.nc thresholds and regrids again (with the cached remapping
+    weights), touching the area file only regrids again; a new depth only writes its zshelf file
+    '''
+    file_runoff, file_area, path_output = inputs
+    path_cache = f'{path_output}/cache'
+    DM.build_distribution_masks(file_runoff, file_area, path_output)
+    outputs = {file: read_output(f'{path_output}/{file}') for file in os.listdir(path_output) if file.endswith('.nc')}
+    cache = cache_state(path_cache)
+    weights = [file for file in cache if file.startswith('RemapWeights_')]
+    assert len(weights) == 1
+
+    ## Nothing changed: nothing written
+    assert DM.build_distribution_masks(file_runoff, file_area, path_output) == []
+    assert cache_state(path_cache) == cache
+
+    ## New runoff maps (same contents): new masks on the runoff-mapper grid and regridded masks, same weights
+    touch(file_runoff)
+    written = DM.build_distribution_masks(file_runoff, file_area, path_output)
+    assert sorted(written) == sorted(f'{path_output}/{file}' for file in outputs)
+    cache_new = cache_state(path_cache)
+    source = [file for file in cache_new if file.startswith('masks_source_')]
+    regridded = [file for file in cache_new if file.startswith('masks_ORCA1_')]
+    assert len(source) == 1 and source[0] not in cache
+    assert len(regridded) == 1 and regridded[0] not in cache
+    assert cache_new[weights[0]] == cache[weights[0]]
+    for file, values in outputs.items():
+        np.testing.assert_array_equal(read_output(f'{path_output}/{file}'), values, err_msg=file)
+
+    ## New area file: masks on the runoff-mapper grid are kept
+    touch(file_area)
+    DM.build_distribution_masks(file_runoff, file_area, path_output)
+    cache_area = cache_state(path_cache)
+    assert cache_area[source[0]] == cache_new[source[0]]
+    assert regridded[0] not in cache_area
+
+    ## Additional depth: only its zshelf file
+    written = DM.build_distribution_masks(file_runoff, file_area, path_output, depths=(200, 700, 1000))
+    assert written == [f'{path_output}/zshelf_1000m.nc']
@@ -0,0 +1,74 @@
+# Equivalence checks of the optimised freshwater forcing code against the reference computations,
+# on the synthetic ORCA1 inputs of benchmarks/SyntheticInputs.py (see conftest.py)
+
+## Import modules
+import warnings
+
+import numpy as np
+
+import SyntheticInputs as SYN
+import Coupler as CP
+import CouplerState as CS
+import Remapping as RM
+from helpers import year_min, n_years, coupler_run, couple_years, assert_same_run
+
+############################### Coupler ###############################
+
+def test_rerun_matches_straight_run(experiment, straight_run, tmp_path_factory):
+    '''
+    Computing years again (resubmitted legs) gives the same state and forcing files as the straight run
+    '''
+    files, static = coupler_run(experiment, tmp_path_factory)
+    years = list(range(year_min, year_min+n_years))
+    couple_years(files, static, years + years[1:] + years[-1:])
+    assert_same_run(straight_run[0], files)
+
+def test_rollback_matches_straight_run(experiment, straight_run, tmp_path_factory):
+    '''
+    Rolling back to the first year and computing the later years again gives the same state and forcing files
+    '''
+    files, static = coupler_run(experiment, tmp_path_factory)
+    years = list(range(year_min, year_min+n_years))
+    state = couple_years(files, static, years)
+    assert CP.rewind_coupler_state(files, static, state, year_min) == years[:0:-1]
+    assert CS.next_step(state) == 1
+    couple_years(files, static, years[1:])
+    assert_same_run(straight_run[0], files)
+
+############################### Remapping ###############################
+
+def test_bilinear_exact_on_linear_fields(tmp_path):
+    '''
+    Bilinear remapping reproduces fields that are linear in latitude and longitude
+    (destination points away from the periodic longitude boundary); destination points beyond the source
+    latitudes are missing, as with cdo remapbil
+    '''
+    src_lat = np.linspace(-89.5, 89.5, 180)
+    src_lon = np.arange(0.5, 360., 1.)
+    lat, lon = np.meshgrid(src_lat, src_lon, indexing='ij')
+    fields = np.stack([2. + 0.1*lat, -1. + 0.05*lon, 0.3*lat - 0.02*lon + 0.001*lat*lon])
+
+    dst_lat, dst_lon = SYN.grid_coordinates('ORCA1')
+    dst_lon = np.clip(dst_lon, src_lon[0], src_lon[-1])
+    weights = RM.load_weights('bilinear', src_lat, src_lon, dst_lat, dst_lon, str(tmp_path))
+    remapped = RM.remap(weights, fields)
+
+    outside = (dst_lat < src_lat[0]) | (dst_lat > src_lat[-1])
+    assert outside.any() and np.isnan(remapped[:,outside]).all()
+    reference = np.stack([2. + 0.1*dst_lat, -1. + 0.05*dst_lon, 0.3*dst_lat - 0.02*dst_lon + 0.001*dst_lat*dst_lon])
+    np.testing.assert_allclose(remapped[:,~outside], reference[:,~outside], rtol=1e-12, atol=1e-12)
+
+def test_conservative_weights_without_warnings(tmp_path):
+    '''
+    Conservative remapping weights of a curvilinear grid: no floating point warnings, weights sum to one per cell
+    '''
+    src_lat = np.linspace(-89.5, 89.5, 180)
+    src_lon = np.arange(0.5, 360., 1.)
+    j, i = np.meshgrid(np.linspace(-85., 85., 60), np.linspace(0., 356., 90), indexing='ij')
+    lat, lon = j + 3.*np.sin(np.radians(i)), i + 2.*np.cos(np.radians(j))
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        weights = RM.load_weights('conservative', src_lat, src_lon, lat, lon, str(tmp_path))
+    np.testing.assert_allclose(np.bincount(weights['rows'], weights['vals'], minlength=lat.size), 1., rtol=1e-12)
+    np.testing.assert_allclose(RM.remap(weights, np.full((180, 360), 3.)), 3., rtol=1e-12)
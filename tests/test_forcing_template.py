@@ -0,0 +1,117 @@
+# Forcing files written from the template (ForcingTemplate.py) vs. the files the original scripts wrote with
+# xarray to_netcdf
+
+## Import modules
+import netCDF4
+import numpy as np
+import xarray as xr
+
+import Coupler as CP
+import CouplerState as CS
+import ForcingTemplate as FT
+import reference
+from constants import spy, kg_per_Gt
+from helpers import year_min, n_years, assert_same_forcing_file
+
+def test_coupler_forcing_matches_original(straight_run, experiment, tmp_path):
+    '''
+    Forcing files of the coupler run vs. the dataset of ThetaoDrivenFreshwaterForcing.py for the total forcing of
+    every year
+    '''
+    files, static = straight_run
+    state = CS.open_state(files['path_state'])
+    for k, year in enumerate(range(year_min, year_min+n_years)):
+        with xr.open_dataset(experiment['files_thetao'][k]) as ds:
+            t_new = (ds.time_counter + np.timedelta64(365,'D')).values
+        file_original = f'{tmp_path}/FWF_LRF_y{year}.nc'
+        ds_FWF = reference.forcing_dataset(float(state['FWF_total'][k]), files['file_basal_melt_mask'],
+                                           files['file_calving_mask'], files['file_area'], t_new)
+        ds_FWF.to_netcdf(file_original, unlimited_dims=['time_counter'])
+        assert_same_forcing_file(CP.forcing_file(files, year), file_original)
+
+def test_initial_forcing_matches_original(straight_run, experiment, tmp_path):
+    '''
+    Initial forcing file (attributes of InitialiseFreshwaterForcing.py) with the time of the NEMO output
+    '''
+    files, static = straight_run
+    FWF_total_Gt = 2000.
+    with xr.open_dataset(experiment['files_thetao'][0]) as ds:
+        time = ds.time_counter.values
+    file_original = f'{tmp_path}/FWF_LRF_y{year_min}_original.nc'
+    reference.forcing_dataset(FWF_total_Gt, files['file_basal_melt_mask'], files['file_calving_mask'],
+                              files['file_area'], time, initial=True).to_netcdf(file_original, unlimited_dims=['time_counter'])
+
+    template = static['forcing_template']
+    file_forcing = f'{tmp_path}/FWF_LRF_y{year_min}.nc'
+    fluxes = {'sorunoff_f': 0.55*FWF_total_Gt*kg_per_Gt/spy/FT.mask_area(template, 'sorunoff_f'),
+              'socalving_f': 0.45*FWF_total_Gt*kg_per_Gt/spy/FT.mask_area(template, 'socalving_f')}
+    FT.write_forcing(template, files['file_forcing_template'], file_forcing, fluxes, time,
+                     FT.initial_attrs, FT.initial_global_attrs)
+    assert_same_forcing_file(file_forcing, file_original)
+
+def test_encode_time_matches_xarray(tmp_path):
+    '''
+    Time units and values chosen by xarray for daily, hourly and sub-second steps and for cftime calendars
+    '''
+    import cftime
+
+    times = [np.array(['1850-01-16T12:00', '1850-02-15T00:00', '1850-03-16T12:00'], dtype='datetime64[ns]'),
+             np.array(['1851-01-01', '1851-01-02'], dtype='datetime64[ns]'),
+             np.array(['1851-01-01T00:00:00.5', '1851-01-01T00:00:01'], dtype='datetime64[ns]'),
+             np.array([cftime.DatetimeNoLeap(1850, month, 16) for month in range(1, 13)]),
+             np.array([cftime.Datetime360Day(1850, 1, 1, 6), cftime.Datetime360Day(1850, 1, 2, 12)])]
+    for k, time in enumerate(times):
+        file = f'{tmp_path}/time_{k}.nc'
+        xr.Dataset(coords={'time_counter': time}).to_netcdf(file)
+        with netCDF4.Dataset(file) as nc:
+            values, units, calendar = FT.encode_time(time)
+            np.testing.assert_array_equal(values, nc['time_counter'][:])
+            assert (units, calendar) == (nc['time_counter'].units, nc['time_counter'].calendar)
+
+def test_layouts_decode_to_original_values(straight_run, experiment, tmp_path, capsys):
+    '''
+    Forcing files of every layout decode to the fluxes and times of the original file: float32 to single precision,
+    a single record to the flux of every month at the middle of the year; the template is rebuilt when the layout changes
+    '''
+    files, static = straight_run
+    state = CS.open_state(files['path_state'])
+    with xr.open_dataset(experiment['files_thetao'][0]) as ds:
+        t_new = (ds.time_counter + np.timedelta64(365,'D')).values
+    ds_original = reference.forcing_dataset(float(state['FWF_total'][0]), files['file_basal_melt_mask'],
+                                            files['file_calving_mask'], files['file_area'], t_new)
+    file_masks = {'sorunoff_f': files['file_basal_melt_mask'], 'socalving_f': files['file_calving_mask']}
+    file_template = f'{tmp_path}/FWF_LRF_template.nc'
+
+    layouts = [{'dtype': 'float32', 'format': 'NETCDF3_CLASSIC'},
+               {'dtype': 'float32', 'complevel': 4},
+               {'n_time': 1},
+               {'chunksizes': (1, 10, 20)}]
+    for k, layout in enumerate(layouts):
+        template = FT.load_forcing_template(file_masks, files['file_area'], file_template, layout)
+        assert 'Building' in capsys.readouterr().out, layout
+        file_forcing = f'{tmp_path}/FWF_LRF_{k}.nc'
+        fluxes = {var: float(state['FWF_total'][0])*share*kg_per_Gt/spy/FT.mask_area(template, var)
+                  for var, share in [('sorunoff_f', 0.55), ('socalving_f', 0.45)]}
+        FT.write_forcing(template, file_template, file_forcing, fluxes, t_new)
+
+        layout = dict(FT.default_layout, **layout)
+        with netCDF4.Dataset(file_forcing) as nc:
+            assert nc.data_model == layout['format']
+            assert nc['sorunoff_f'].dtype == np.dtype(layout['dtype'])
+            if layout['format'] == 'NETCDF4':
+                assert nc['sorunoff_f'].filters()['zlib'] == (layout['complevel'] > 0)
+            if layout['chunksizes'] is not None:
+                assert nc['sorunoff_f'].chunking() == list(layout['chunksizes'])
+        with xr.open_dataset(file_forcing) as ds:
+            rtol = 1e-12 if layout['dtype'] == 'float64' else 1e-6
+            for var in ['sorunoff_f', 'socalving_f']:
+                assert ds[var].sizes['time_counter'] == layout['n_time']
+                np.testing.assert_allclose(ds[var].values, ds_original[var].values[:layout['n_time']], rtol=rtol, err_msg=f'{var} {layout}')
+            if layout['n_time'] == 1:
+                np.testing.assert_array_equal(ds['time_counter'].values, t_new[:1] + (t_new[-1] - t_new[0])/2)
+            else:
+                np.testing.assert_array_equal(ds['time_counter'].values, t_new)
+
+    ## Unchanged layout: template reused
+    FT.load_forcing_template(file_masks, files['file_area'], file_template, layouts[-1])
+    assert 'Building' not in capsys.readouterr().out
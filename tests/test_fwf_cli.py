@@ -0,0 +1,108 @@
+# Command line interface (fwf.py), grid descriptor and netCDF4-only reading of the NEMO output vs. the original
+# initial forcing file and the xarray annual mean
+
+## Import modules
+import os
+import shutil
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+import xarray as xr
+
+import Coupler as CP
+import GridDescriptor as GD
+import NemoOutput as NO
+import fwf
+import reference
+from config import FWF_total_yearmin
+from helpers import year_min, exp_name, assert_same_forcing_file
+
+path_scripts = os.path.dirname(os.path.abspath(fwf.__file__))
+
+def run_fwf(args, cwd):
+    '''
+    Run fwf.py command in a new process, returns the completed process; the last line of its output tells whether
+    xarray and pandas were imported
+    '''
+    code = (f"import runpy, sys; sys.argv = {['fwf.py'] + args!r}; "
+            f"runpy.run_path('{path_scripts}/fwf.py', run_name='__main__'); "
+            f"print('xarray' in sys.modules, 'pandas' in sys.modules)")
+    return subprocess.run([sys.executable, '-c', code], cwd=cwd, capture_output=True, text=True)
+
+def test_initialise_matches_original(experiment, tmp_path):
+    '''
+    'fwf.py grid' and 'fwf.py initialise' without xarray and pandas: the initial forcing file of
+    InitialiseFreshwaterForcing.py with the time of the NEMO output of the first year
+    '''
+    start_dir = str(tmp_path)
+    shutil.copytree(f"{experiment['root']}/fwf", f'{start_dir}/fwf')
+    file_thetao = experiment['files_thetao'][0]
+
+    process = run_fwf(['grid', file_thetao, start_dir], path_scripts)
+    assert process.returncode == 0, process.stderr
+    process = run_fwf(['initialise', str(year_min), exp_name, start_dir], path_scripts)
+    assert process.returncode == 0, process.stderr
+    assert process.stdout.split('\n')[-2] == 'False False'
+
+    files = CP.coupler_files(year_min, year_min, exp_name, start_dir, experiment['root'])
+    with xr.open_dataset(file_thetao) as ds:
+        time = ds.time_counter.values
+    file_original = f'{tmp_path}/FWF_LRF_y{year_min}_original.nc'
+    reference.forcing_dataset(FWF_total_yearmin, files['file_basal_melt_mask'], files['file_calving_mask'], files['file_area'],
+                              time, initial=True).to_netcdf(file_original, unlimited_dims=['time_counter'])
+    assert_same_forcing_file(f"{files['path_output']}/FWF_LRF_y{year_min}.nc", file_original)
+
+def test_grid_descriptor(experiment, tmp_path):
+    '''
+    Level bounds and time of the records of the NEMO output; the time of another year (also across leap years) is
+    the time of the NEMO output of that year; a missing descriptor without NEMO output is an error
+    '''
+    file_thetao = experiment['files_thetao'][1]
+    file_descriptor = f'{tmp_path}/GridDescriptor_ORCA1.npz'
+    with pytest.raises(FileNotFoundError, match='fwf.py grid'):
+        GD.load_grid_descriptor(file_descriptor)
+    GD.load_grid_descriptor(file_descriptor, file_thetao)
+    descriptor = GD.load_grid_descriptor(file_descriptor)
+
+    with xr.open_dataset(file_thetao) as ds:
+        np.testing.assert_array_equal(descriptor['olevel_bounds'], ds['olevel_bounds'].values)
+        assert tuple(descriptor['grid_shape']) == ds['nav_lat'].shape
+
+    ## Descriptor of every year (1852 is a leap year) vs. the time of the NEMO output of every year
+    for file_source in experiment['files_thetao']:
+        descriptor = GD.build_grid_descriptor(file_source, file_descriptor)
+        for file_year in experiment['files_thetao']:
+            with xr.open_dataset(file_year) as ds:
+                year = int(ds.time_counter.dt.year[0])
+                np.testing.assert_array_equal(GD.time_template(descriptor, year), ds.time_counter.values)
+
+def test_read_annual_mean_matches_xarray(experiment, sector_index):
+    '''
+    Annual mean of the sector rows and layers read with netCDF4 vs. the month length weighted xarray mean of the
+    full file
+    '''
+    for file_thetao in experiment['files_thetao']:
+        total, lev_bnds, index_subset = NO.read_annual_mean(file_thetao, sector_index, CP.sectors)
+        with reference.open_thetao(file_thetao) as ds:
+            ds_thetao_year = reference.annual_mean(ds)
+            lev_min = int(np.flatnonzero(ds['olevel_bounds'].values[:,0] == lev_bnds[0,0])[0])
+            j_min = int(sector_index[CP.sectors[0]]['j'][0] - index_subset[CP.sectors[0]]['j'][0])
+            expected = ds_thetao_year.values[lev_min:lev_min+len(lev_bnds), j_min:j_min+total.shape[1]]
+        np.testing.assert_allclose(total, expected, rtol=1e-12, equal_nan=True)
+        for sector in CP.sectors:
+            np.testing.assert_array_equal(index_subset[sector]['j'] + j_min, sector_index[sector]['j'])
+
+def test_usage_and_startup():
+    '''
+    Usage without a command (error for an unknown command); the commands without xarray and pandas
+    '''
+    process = subprocess.run([sys.executable, 'fwf.py'], cwd=path_scripts, capture_output=True, text=True)
+    assert process.returncode == 0 and all(command in process.stdout for command in fwf.commands)
+    process = subprocess.run([sys.executable, 'fwf.py', 'initialize'], cwd=path_scripts, capture_output=True, text=True)
+    assert process.returncode == 1
+
+    for script in ['InitialiseFreshwaterForcing.py', 'PrescribedFreshwaterForcing.py']:
+        assert fwf.import_time(fwf.script_imports(script), repeat=1)[1] == ['False', 'False'], script
+    assert fwf.import_time(fwf.script_imports('ThetaoDrivenFreshwaterForcing.py'), repeat=1)[1][0] == 'True'
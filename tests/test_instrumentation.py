@@ -0,0 +1,154 @@
+# Stage log of the driver scripts (Instrumentation.py): records of the stages of a year, their summary and the
+# instrumented coupler run
+
+## Import modules
+import json
+import os
+import pstats
+import subprocess
+import sys
+import time
+
+import pytest
+
+import Coupler as CP
+import Instrumentation as IN
+from helpers import year_min, n_years, exp_name, coupler_run, assert_same_run
+
+path_scripts = os.path.dirname(os.path.abspath(IN.__file__))
+
+def read_records(file_log):
+    '''
+    Records of a stage log
+    '''
+    with open(file_log) as f:
+        return [json.loads(line) for line in f]
+
+def test_stage_records(tmp_path):
+    '''
+    Wall time and bytes written of every stage (also of a failing stage) and of the year, appended per year;
+    no records when switched off
+    '''
+    file_log = f'{tmp_path}/StageLog_test.jsonl'
+    for year in [1850, 1851]:
+        log = IN.open_stage_log(file_log, 'Test', year)
+        with IN.stage(log, 'sleep'):
+            time.sleep(0.05)
+        with IN.stage(log, 'write'):
+            with open(f'{tmp_path}/data.bin', 'wb') as f:
+                f.write(os.urandom(2*10**6))
+        with pytest.raises(ZeroDivisionError):
+            with IN.stage(log, 'fail'):
+                1/0
+        IN.close_stage_log(log)
+
+    records = read_records(file_log)
+    assert [(record['year'], record['stage']) for record in records] == \
+        [(year, stage) for year in [1850, 1851] for stage in ['sleep', 'write', 'fail', 'total']]
+    for record in records:
+        assert record['script'] == 'Test' and record['max_rss_mb'] > 0
+        if record['stage'] == 'sleep':
+            assert record['wall_s'] >= 0.05 and record['cpu_s'] < record['wall_s']
+        if record['stage'] in ['write', 'total'] and os.path.isfile('/proc/self/io'):
+            assert record['written_mb'] >= 2.
+    assert all(records[k+3]['wall_s'] >= sum(record['wall_s'] for record in records[k:k+3]) for k in [0, 4])
+
+    summary = IN.summarise_stage_log(file_log)
+    assert list(summary.loc['Test'].index) == ['sleep', 'write', 'fail', 'total']
+    assert (summary['years'] == 2).all()
+    assert summary.loc[('Test', 'total'), 'share [%]'] == pytest.approx(100.)
+    assert summary.loc[('Test', 'sleep'), 'wall total [s]'] == pytest.approx(sum(record['wall_s'] for record in records
+                                                                                 if record['stage'] == 'sleep'))
+
+    ## Switched off
+    assert IN.open_stage_log(None, 'Test', 1852) is None
+    with IN.stage(None, 'sleep'):
+        pass
+    IN.close_stage_log(None)
+    assert len(read_records(file_log)) == len(records)
+
+def test_rss_records(tmp_path):
+    '''
+    Resident memory at the end of a stage and its change during the stage, high-water mark of the process;
+    stage log with records from before rss_mb was added (peak_rss_mb only)
+    '''
+    import numpy as np
+    if not os.path.isfile('/proc/self/statm'):
+        pytest.skip('resident set size not available')
+    file_log = f'{tmp_path}/StageLog_test.jsonl'
+    log = IN.open_stage_log(file_log, 'Test', 1850)
+    with IN.stage(log, 'allocate'):
+        data = np.ones(100*2**20//8)
+    with IN.stage(log, 'free'):
+        del data
+    IN.close_stage_log(log)
+
+    records = {record['stage']: record for record in read_records(file_log)}
+    assert records['allocate']['rss_delta_mb'] >= 95. and records['free']['rss_delta_mb'] <= -95.
+    assert records['free']['rss_mb'] <= records['allocate']['rss_mb'] - 95.
+    # (the high-water mark is updated lazily by the kernel, up to a few pages behind)
+    assert records['free']['max_rss_mb'] >= records['allocate']['rss_mb'] - 2.
+
+    with open(file_log, 'a') as f:
+        f.write(json.dumps({'script': 'Old', 'year': 1850, 'stage': 'total', 'wall_s': 1., 'cpu_s': 1.,
+                            'peak_rss_mb': 500., 'read_mb': 0., 'written_mb': 0.}) + '\n')
+    summary = IN.summarise_stage_log(file_log)
+    assert summary.loc[('Old', 'total'), 'rss high-water [MB]'] == 500.
+    assert np.isnan(summary.loc[('Old', 'total'), 'rss max [MB]'])
+    assert summary.loc[('Test', 'allocate'), 'rss delta max [MB]'] == records['allocate']['rss_delta_mb']
+
+def test_profile(tmp_path):
+    '''
+    Profile of a year without stage log file
+    '''
+    file_profile = f'{tmp_path}/profile/Test_1850.prof'
+    log = IN.open_stage_log(None, 'Test', 1850, profile=True, file_profile=file_profile)
+    with IN.stage(log, 'sort'):
+        sorted(range(10**5), key=lambda k: -k)
+    IN.close_stage_log(log)
+    assert any('sorted' in str(function) for function in pstats.Stats(file_profile).stats)
+
+def test_failing_year(tmp_path, monkeypatch):
+    '''
+    Records and profile of a year that fails are written and the profiler is stopped
+    '''
+    import cProfile
+    import config
+    monkeypatch.setattr(config, 'stage_log', True)
+    monkeypatch.setattr(config, 'profile', True)
+    with pytest.raises(ZeroDivisionError):
+        with IN.year_log(str(tmp_path), 'test', 'Test', 1850) as log:
+            with IN.stage(log, 'fail'):
+                1/0
+    assert [record['stage'] for record in read_records(f'{tmp_path}/StageLog_test.jsonl')] == ['fail', 'total']
+    assert os.path.isfile(f'{tmp_path}/profile/Test_1850.prof')
+    assert log['profiler'] is not None and sys.getprofile() is None
+    profiler = cProfile.Profile() # fails while another profiler is active (python >= 3.12)
+    profiler.enable()
+    profiler.disable()
+
+def test_instrumented_coupler_run(experiment, straight_run, tmp_path_factory):
+    '''
+    Coupler run with stage log: same outputs as without, every stage of the coupler in the log, summarised by
+    'fwf.py stages'
+    '''
+    files, static = coupler_run(experiment, tmp_path_factory)
+    file_log = f"{files['path_output']}/StageLog_{exp_name}.jsonl"
+    for year in range(year_min, year_min+n_years):
+        log = IN.open_stage_log(file_log, 'ThetaoDrivenFreshwaterForcing', year)
+        with IN.stage(log, 'open_state'):
+            state = CP.open_coupler_state(files, static, year)
+        CP.couple_year(files, static, state, year, CP.thetao_file(files, year, year-year_min+1), log)
+        IN.close_stage_log(log)
+    assert_same_run(straight_run[0], files)
+
+    stages = [record['stage'] for record in read_records(file_log) if record['year'] == year_min]
+    assert stages[0] == 'open_state' and stages[-1] == 'total'
+    assert {'open_thetao', 'annual_mean', 'sector_mean', 'running_mean', 'basal_melt', 'lrf_update', 'flush_state',
+            'write_forcing'} <= set(stages)
+
+    start_dir = files['path_output'].split('/fwf/')[0]
+    process = subprocess.run([sys.executable, 'fwf.py', 'stages', exp_name, start_dir], cwd=path_scripts,
+                             capture_output=True, text=True)
+    assert process.returncode == 0, process.stderr
+    assert 'ThetaoDrivenFreshwaterForcing' in process.stdout and 'lrf_update' in process.stdout
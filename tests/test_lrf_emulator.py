@@ -0,0 +1,108 @@
+# Offline LRF emulator (LRFEmulator.py) vs. the year by year computation of the original driver script
+
+## Import modules
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import Coupler as CP
+import CouplerState as CS
+import FreshWaterForcing as FWF
+import LRFEmulator as LE
+import reference
+from config import gamma, ism, bm, running_mean_period, FWF_total_yearmin
+from helpers import year_min, exp_name
+
+def test_emulator_matches_original(experiment, tmp_path):
+    '''
+    Emulated experiment longer than the response functions vs. running_mean_backward, basal_melt_anomalies and
+    freshwater_flux_anomaly_df applied year by year
+    '''
+    files = experiment['files']
+    rng = np.random.default_rng(0)
+    n_years = 230
+    trend = np.linspace(0., 1.5, n_years)[:,None]
+    df_thetao = pd.DataFrame(0.5 + trend + rng.normal(0., 0.3, size=(n_years, len(CP.sectors))),
+                             index=np.arange(year_min, year_min+n_years), columns=CP.sectors)
+    df_thetao_baseline = pd.read_csv(files['file_baseline_thetao'], index_col=0)
+    RF = FWF.read_response_functions(files['path_lrfs'], ism, bm, CP.sectors)
+    assert RF.shape[1] < n_years
+
+    emulated = LE.emulate_experiment_df(df_thetao, df_thetao_baseline, RF, gamma, running_mean_period, FWF_total_yearmin)
+    original = reference.coupler_monitoring(df_thetao, df_thetao_baseline, files['path_lrfs'], ism, bm, gamma,
+                                            running_mean_period, FWF_total_yearmin, year_min+n_years-1, f'{tmp_path}/Future.csv')
+    for var in ['thetao_rm', 'dBM', 'dFWF', 'FWF_total', 'future_fwf']:
+        scale = np.nanmax(np.abs(original[var].values))
+        np.testing.assert_allclose(emulated[var].values, original[var].values, rtol=1e-10, atol=1e-12*scale, err_msg=var)
+
+def test_emulator_matches_coupler(straight_run):
+    '''
+    Offline emulator of the temperatures of the coupler run vs. the coupler run year by year
+    '''
+    files, static = straight_run
+    state = CS.open_state(files['path_state'])
+    df_thetao = CS.state_dataframe(state, 'thetao')
+    emulated = LE.emulate_experiment_df(df_thetao, static['df_thetao_baseline'], static['RF'], gamma,
+                                        running_mean_period, FWF_total_yearmin)
+    for var in ['thetao_rm', 'dBM', 'dFWF', 'FWF_total']:
+        coupled = CS.state_dataframe(state, var)
+        np.testing.assert_allclose(emulated[var].values, coupled.values, rtol=1e-12, atol=1e-12, err_msg=var)
+    np.testing.assert_allclose(emulated['future_fwf'].values, state['future_fwf'], rtol=1e-12, atol=1e-12)
+
+def test_emulate_script_repeated_year(experiment, straight_run, tmp_path):
+    '''
+    EmulateFreshwaterForcing.py on a csv file with a year appended twice by a resubmitted leg (last row used)
+    vs. the coupler run
+    '''
+    files, static = straight_run
+    state = CS.open_state(files['path_state'])
+    df_thetao = CS.state_dataframe(state, 'thetao')
+    df_repeated = pd.concat([df_thetao.iloc[:2], df_thetao.iloc[[1]] + 1., df_thetao.iloc[1:]])
+    file_csv = f'{tmp_path}/OceanSectorThetao_{exp_name}.csv'
+    df_repeated.to_csv(file_csv, float_format='%.17g')
+
+    path_scripts = os.path.dirname(os.path.abspath(LE.__file__))
+    process = subprocess.run([sys.executable, 'EmulateFreshwaterForcing.py', file_csv, exp_name, experiment['root'],
+                              f'{tmp_path}/emulated'], cwd=path_scripts, capture_output=True, text=True)
+    assert process.returncode == 0, process.stdout + process.stderr
+    year_max = df_thetao.index[-1]
+    for var in ['thetao_rm', 'dBM', 'dFWF', 'FWF_total']:
+        name = {**CS.state_variables, **CS.state_totals}[var].format(period=running_mean_period)
+        emulated = pd.read_csv(f'{tmp_path}/emulated/{name}_{exp_name}_{year_min}_{year_max}.csv', index_col=0)
+        coupled = CS.state_dataframe(state, var)
+        assert list(emulated.index) == list(coupled.index), var
+        np.testing.assert_allclose(emulated.values, coupled.values, rtol=1e-12, atol=1e-12, err_msg=var)
+
+def test_emulate_script_unordered_and_missing_years(experiment, straight_run, tmp_path):
+    '''
+    EmulateFreshwaterForcing.py on a csv file with the years out of order: same as the coupler run;
+    with a year missing: error
+    '''
+    files, static = straight_run
+    state = CS.open_state(files['path_state'])
+    df_thetao = CS.state_dataframe(state, 'thetao')
+    path_scripts = os.path.dirname(os.path.abspath(LE.__file__))
+
+    def emulate(df, path_emulated):
+        file_csv = f'{tmp_path}/OceanSectorThetao_{exp_name}.csv'
+        df.to_csv(file_csv, float_format='%.17g')
+        return subprocess.run([sys.executable, 'EmulateFreshwaterForcing.py', file_csv, exp_name, experiment['root'],
+                               path_emulated], cwd=path_scripts, capture_output=True, text=True)
+
+    process = emulate(df_thetao.iloc[::-1], f'{tmp_path}/emulated')
+    assert process.returncode == 0, process.stdout + process.stderr
+    name = CS.state_totals['FWF_total']
+    emulated = pd.read_csv(f'{tmp_path}/emulated/{name}_{exp_name}_{year_min}_{df_thetao.index[-1]}.csv', index_col=0)
+    assert list(emulated.index) == list(df_thetao.index)
+    np.testing.assert_allclose(emulated.values, CS.state_dataframe(state, 'FWF_total').values, rtol=1e-12, atol=1e-12)
+
+    process = emulate(df_thetao.drop(year_min+1), f'{tmp_path}/missing')
+    assert process.returncode != 0 and f'Years [{year_min+1}] are missing' in process.stderr
+    assert not os.path.exists(f'{tmp_path}/missing')
+    with pytest.raises(ValueError, match='not in increasing order'):
+        LE.emulate_experiment_df(df_thetao.iloc[::-1], static['df_thetao_baseline'], static['RF'], gamma,
+                                 running_mean_period, FWF_total_yearmin)
@@ -0,0 +1,111 @@
+# Cached loader of the monitoring csv files (analysis/MonitoringLoader.py) vs. the csv files read with pandas
+
+## Import modules
+import glob
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import MonitoringLoader as ML
+from helpers import exp_name
+
+def monitoring_copy(straight_run, path):
+    '''
+    Directory with the monitoring csv files of the coupler run
+    '''
+    os.makedirs(path)
+    for file in glob.glob(f"{straight_run[0]['path_output']}/*_{exp_name}_*.csv"):
+        shutil.copy(file, path)
+    return path
+
+def assert_matches_csv(df, path_output, label=exp_name):
+    '''
+    Every monitoring file is in the tidy frame with the values of the csv file
+    '''
+    files = ML.monitoring_files(path_output, exp_name)
+    assert set(df['variable']) == set(files)
+    for variable, file in files.items():
+        df_csv = pd.read_csv(f'{path_output}/{file}', index_col=0).rename(columns={'0': 'total'})
+        df_csv = df_csv[~df_csv.index.duplicated(keep='last')]
+        table = ML.wide(df, variable, experiments=[label])[label]
+        assert list(table.index) == list(df_csv.index), variable
+        np.testing.assert_array_equal(table[list(df_csv.columns)].values, df_csv.values, err_msg=variable)
+
+def test_loader_matches_csv_files(straight_run, tmp_path):
+    '''
+    Tidy frame of the csv files, from the csv files and from the cache; appended lines, rewritten and removed files
+    '''
+    path_output = monitoring_copy(straight_run, f'{tmp_path}/{exp_name}')
+    path_cache = f'{tmp_path}/cache'
+    df = ML.load_experiment(path_output, path_cache=path_cache)
+    assert 'OceanSectorThetao' in set(df['variable']) and 'TotalFreshwaterForcing' in set(df['variable'])
+    assert_matches_csv(df, path_output)
+
+    ## Unchanged: cache is used and not written
+    file_cache = ML.cache_files(path_cache, path_output, exp_name)[0]
+    mtime = os.stat(file_cache).st_mtime_ns
+    pd.testing.assert_frame_equal(ML.load_experiment(path_output, path_cache=path_cache), df)
+    assert os.stat(file_cache).st_mtime_ns == mtime
+
+    ## Line appended (next year), file rewritten with other values, file removed
+    files = ML.monitoring_files(path_output, exp_name)
+    file_thetao = f"{path_output}/{files['OceanSectorThetao']}"
+    df_csv = pd.read_csv(file_thetao, index_col=0)
+    with open(file_thetao, 'a') as f:
+        f.write(','.join([str(df_csv.index[-1]+1)] + ['0.25']*len(df_csv.columns)) + '\n')
+    file_dBM = f"{path_output}/{files['BasalMeltAnomaly']}"
+    (2*pd.read_csv(file_dBM, index_col=0)).to_csv(file_dBM)
+    os.remove(f"{path_output}/{files['TotalFreshwaterForcing']}")
+
+    df_updated = ML.load_experiment(path_output, path_cache=path_cache)
+    assert_matches_csv(df_updated, path_output)
+    pd.testing.assert_frame_equal(df_updated, ML.load_experiment(path_output, path_cache=f'{tmp_path}/cache_new'))
+
+def test_repeated_years(straight_run, tmp_path):
+    '''
+    Years appended twice by resubmitted legs: the values of the last line of the year, in a new cache and in
+    lines appended to a cached file
+    '''
+    path_output = monitoring_copy(straight_run, f'{tmp_path}/{exp_name}')
+    files = ML.monitoring_files(path_output, exp_name)
+    file_thetao = f"{path_output}/{files['OceanSectorThetao']}"
+    df_csv = pd.read_csv(file_thetao, index_col=0)
+    year_last = df_csv.index[-1]
+    with open(file_thetao, 'a') as f:
+        f.write(','.join([str(year_last)] + ['0.5']*len(df_csv.columns)) + '\n')
+    df = ML.load_experiment(path_output, path_cache=f'{tmp_path}/cache')
+    assert_matches_csv(df, path_output)
+    assert (ML.wide(df, 'OceanSectorThetao')[exp_name].loc[year_last] == 0.5).all()
+
+    with open(file_thetao, 'a') as f:
+        f.write(','.join([str(year_last)] + ['0.75']*len(df_csv.columns)) + '\n')
+        f.write(','.join([str(year_last+1)] + ['1.']*len(df_csv.columns)) + '\n')
+        f.write(','.join([str(year_last+1)] + ['1.25']*len(df_csv.columns)) + '\n')
+    df = ML.load_experiment(path_output, path_cache=f'{tmp_path}/cache')
+    assert_matches_csv(df, path_output)
+    table = ML.wide(df, 'OceanSectorThetao')[exp_name]
+    assert (table.loc[year_last] == 0.75).all() and (table.loc[year_last+1] == 1.25).all()
+
+def test_several_experiments(straight_run, tmp_path):
+    '''
+    Experiments with labels; duplicate labels and missing files are errors
+    '''
+    path_a = monitoring_copy(straight_run, f'{tmp_path}/a/{exp_name}')
+    path_b = monitoring_copy(straight_run, f'{tmp_path}/b/{exp_name}')
+    path_cache = f'{tmp_path}/cache'
+    df = ML.load_experiments({'a': (path_a, exp_name), 'b': (path_b, exp_name)}, path_cache=path_cache)
+    table = ML.wide(df, 'OceanSectorThetao')
+    assert list(table.columns.levels[0]) == ['a', 'b']
+    np.testing.assert_array_equal(table['a'].values, table['b'].values)
+    assert_matches_csv(df, path_a, label='a')
+
+    with pytest.raises(ValueError, match='more than once'):
+        ML.load_experiments([path_a, path_b], path_cache=path_cache)
+    df_same_label = pd.concat([ML.load_experiment(path_a, path_cache=path_cache), ML.load_experiment(path_b, path_cache=path_cache)])
+    with pytest.raises(ValueError, match='different labels'):
+        ML.wide(df_same_label, 'OceanSectorThetao')
+    with pytest.raises(FileNotFoundError, match='experiment name'):
+        ML.load_experiment(path_a, 'other', path_cache=path_cache)
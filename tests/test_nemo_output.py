@@ -0,0 +1,72 @@
+# Reading the NEMO output (NemoOutput.py) vs. the full grid_T_3D file as read by the original scripts
+
+## Import modules
+import numpy as np
+import pytest
+import xarray as xr
+
+import Coupler as CP
+import NemoOutput as NO
+import ThetaoSectors as TS
+import reference
+
+def test_subset_matches_full_file(experiment, sector_index):
+    '''
+    The rows and layers read for the sectors contain the values of all sector cells in their depth windows,
+    and the sector means of the subset are the sector means of the full file
+    '''
+    file_thetao = experiment['files_thetao'][0]
+    ds, index_subset = NO.open_thetao_subset(file_thetao, sector_index, CP.sectors)
+    ds_full = reference.open_thetao(file_thetao)
+    assert ds.sizes['j'] < ds_full.sizes['j'] and ds.sizes['lev'] < ds_full.sizes['lev']
+
+    lev_min = int(np.nonzero(ds_full['lev'].values == ds['lev'].values[0])[0][0])
+    thetao_subset = ds['thetao'].mean('time_counter')
+    thetao_full = ds_full['thetao'].mean('time_counter')
+    with xr.open_dataset(experiment['files']['file_area']) as ds_area:
+        for sector in CP.sectors:
+            depth_top, depth_bottom = reference.sel_depth_bnds(sector)
+            levs = np.nonzero((ds_full['olevel_bounds'].values[:,1] > depth_top) & (ds_full['olevel_bounds'].values[:,0] < depth_bottom))[0]
+            np.testing.assert_array_equal(
+                thetao_subset.values[levs-lev_min][:, index_subset[sector]['j'], index_subset[sector]['i']],
+                thetao_full.values[levs][:, sector_index[sector]['j'], sector_index[sector]['i']], err_msg=sector)
+
+            mean = TS.lev_weighted_mean(TS.area_weighted_mean(thetao_subset, None, sector, index_subset), ds['olevel_bounds'], sector)
+            assert float(mean) == pytest.approx(reference.sector_mean(thetao_full, ds_full['olevel_bounds'], ds_area, sector),
+                                                rel=1e-12), sector
+    ds.close()
+    ds_full.close()
+
+def test_annual_mean_weighted_with_month_lengths(experiment):
+    '''
+    Annual mean weights the monthly records with the month lengths, from the time bounds or from the calendar;
+    with equal record lengths it is the unweighted mean of the original scripts
+    '''
+    for file_thetao in experiment['files_thetao']:
+        with reference.open_thetao(file_thetao) as ds:
+            np.testing.assert_allclose(NO.annual_mean(ds).values, reference.annual_mean(ds).values, rtol=1e-12)
+            year = int(ds['time_counter'].dt.year[0])
+            lengths = [31, 29 if year % 4 == 0 else 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31]
+            np.testing.assert_array_equal(NO.record_lengths(ds), lengths)
+            np.testing.assert_array_equal(NO.record_lengths(ds.drop_vars('time_counter_bounds')), lengths)
+
+    ## Records of equal length, land cells missing in some records
+    rng = np.random.default_rng(0)
+    thetao = rng.normal(size=(12, 4, 5, 6))
+    thetao[:, :, 0, 0] = np.nan
+    thetao[3:7, 1, 2, 3] = np.nan
+    time = np.datetime64('1850-01-01', 'ns') + np.arange(12)*np.timedelta64(30, 'D')
+    ds = xr.Dataset({'thetao': (('time_counter','lev','j','i'), thetao),
+                     'time_counter_bounds': (('time_counter','axis_nbounds'), np.stack([time, time + np.timedelta64(30, 'D')], axis=1))},
+                    coords={'time_counter': time + np.timedelta64(15, 'D')})
+    mean = NO.annual_mean(ds)
+    np.testing.assert_allclose(mean.values, reference.annual_mean(ds, weighted=False).values, rtol=1e-12)
+    assert np.isnan(mean.values[:, 0, 0]).all()
+
+def test_read_time_matches_xarray(experiment):
+    '''
+    Time of the records read with netCDF4 vs. the time coordinate decoded by xarray
+    '''
+    for file_thetao in experiment['files_thetao']:
+        with xr.open_dataset(file_thetao) as ds:
+            np.testing.assert_array_equal(NO.read_time(file_thetao), ds.time_counter.values)
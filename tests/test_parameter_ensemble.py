@@ -0,0 +1,90 @@
+# Parameter ensemble (ParameterEnsemble.py, EnsembleFreshwaterForcing.py) vs. the year by year computation of the
+# original driver script for every parameter combination
+
+## Import modules
+import os
+import shutil
+import subprocess
+import sys
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+import Coupler as CP
+import FreshWaterForcing as FWF
+import ParameterEnsemble as PE
+import reference
+from config import ism, bm, FWF_total_yearmin
+from helpers import year_min
+
+path_scripts = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scripts')
+gamma = [0.04, 0.052]
+T_f = [-1.6, -1.9]
+period = [10, 30]
+
+def synthetic_thetao(n_years):
+    '''
+    Warming sector temperatures of n_years years with noise
+    '''
+    rng = np.random.default_rng(1)
+    trend = np.linspace(0., 1., n_years)[:,None]
+    return pd.DataFrame(0.5 + trend + rng.normal(0., 0.3, size=(n_years, len(CP.sectors))),
+                        index=np.arange(year_min, year_min+n_years), columns=CP.sectors)
+
+def test_parameter_grid():
+    '''
+    All combinations, the last parameter varying fastest
+    '''
+    grid_gamma, grid_T_f, grid_period = PE.parameter_grid(gamma, T_f, period)
+    assert list(zip(grid_gamma, grid_T_f, grid_period)) == [(g, t, p) for g in gamma for t in T_f for p in period]
+    assert grid_period.dtype.kind == 'i'
+
+def test_ensemble_matches_original(experiment, tmp_path):
+    '''
+    Every member of the ensemble vs. running_mean_backward, basal_melt_anomalies and freshwater_flux_anomaly_df
+    applied year by year with the parameters of the member
+    '''
+    files = experiment['files']
+    df_thetao = synthetic_thetao(40)
+    df_thetao_baseline = pd.read_csv(files['file_baseline_thetao'], index_col=0)
+    RF = FWF.read_response_functions(files['path_lrfs'], ism, bm, CP.sectors)
+
+    ds_ensemble = PE.ensemble_forcing_df(df_thetao, df_thetao_baseline, RF, *PE.parameter_grid(gamma, T_f, period),
+                                         FWF_total_yearmin)
+    assert ds_ensemble.sizes['param'] == len(gamma)*len(T_f)*len(period)
+    for param in range(ds_ensemble.sizes['param']):
+        member = ds_ensemble.isel(param=param)
+        original = reference.coupler_monitoring(df_thetao, df_thetao_baseline, files['path_lrfs'], ism, bm,
+                                                float(member['gamma']), int(member['period']), FWF_total_yearmin,
+                                                int(df_thetao.index[-1]), f'{tmp_path}/Future_{param}.csv',
+                                                T_f=float(member['T_f']))
+        for var in ['thetao_rm', 'dBM', 'dFWF']:
+            np.testing.assert_allclose(member[var].values, original[var].values, rtol=1e-10,
+                                       atol=1e-12*np.nanmax(np.abs(original[var].values)), err_msg=f'{var} member {param}')
+        np.testing.assert_allclose(member['FWF_total'].values, original['FWF_total']['0'].values, rtol=1e-12)
+
+def test_ensemble_script(experiment, tmp_path):
+    '''
+    EnsembleFreshwaterForcing.py writes the ensemble of a csv file of sector temperatures (own runtime directory
+    for the response function cache)
+    '''
+    files = experiment['files']
+    start_dir = f'{tmp_path}/run'
+    shutil.copytree(f"{experiment['root']}/fwf", f'{start_dir}/fwf')
+    df_thetao = synthetic_thetao(10)
+    file_thetao_csv = f'{tmp_path}/OceanSectorThetao.csv'
+    file_ensemble = f'{tmp_path}/Ensemble.nc'
+    df_thetao.to_csv(file_thetao_csv)
+
+    process = subprocess.run([sys.executable, 'EnsembleFreshwaterForcing.py', file_thetao_csv, start_dir,
+                              file_ensemble, ','.join(map(str, gamma)), ','.join(map(str, T_f)), ','.join(map(str, period))],
+                             cwd=path_scripts, capture_output=True, text=True)
+    assert process.returncode == 0, process.stderr
+
+    df_thetao_baseline = pd.read_csv(files['file_baseline_thetao'], index_col=0)
+    RF = FWF.read_response_functions(files['path_lrfs'], ism, bm, CP.sectors)
+    expected = PE.ensemble_forcing_df(df_thetao, df_thetao_baseline, RF, *PE.parameter_grid(gamma, T_f, period),
+                                      FWF_total_yearmin)
+    with xr.open_dataset(file_ensemble) as ds_ensemble:
+        xr.testing.assert_allclose(ds_ensemble, expected, rtol=1e-12)
@@ -0,0 +1,47 @@
+# Binary cache of the linear response functions (FreshWaterForcing.load_response_functions) vs. the text files read
+# as in the original driver script
+
+## Import modules
+import os
+import shutil
+
+import numpy as np
+
+import Coupler as CP
+import FreshWaterForcing as FWF
+import reference
+from config import ism, bm
+
+def test_cache_matches_text_files(experiment, tmp_path, capsys):
+    '''
+    Cached response functions are the values of the text files, compiled once and rebuilt when a text file or the
+    order of the sectors changes
+    '''
+    path_lrfs = f'{tmp_path}/RFunctions'
+    shutil.copytree(experiment['files']['path_lrfs'], path_lrfs, ignore=shutil.ignore_patterns('cache'))
+    dfRF = reference.response_functions(path_lrfs, ism, bm, CP.sectors)
+
+    RF = FWF.load_response_functions(path_lrfs, ism, bm, CP.sectors)
+    assert 'Compiling' in capsys.readouterr().out
+    np.testing.assert_array_equal(RF, dfRF.values.T.astype(float))
+
+    RF_cached = FWF.load_response_functions(path_lrfs, ism, bm, CP.sectors)
+    assert 'Compiling' not in capsys.readouterr().out
+    assert isinstance(RF_cached, np.memmap)
+    np.testing.assert_array_equal(RF_cached, RF)
+
+    ## Sectors in another order
+    sectors_reversed = CP.sectors[::-1]
+    RF_reversed = FWF.load_response_functions(path_lrfs, ism, bm, sectors_reversed)
+    assert 'Compiling' in capsys.readouterr().out
+    np.testing.assert_array_equal(RF_reversed, reference.response_functions(path_lrfs, ism, bm, sectors_reversed).values.T.astype(float))
+
+    ## Text file of one region replaced
+    file_R3 = f'{path_lrfs}/TotalFW/RF_{ism}_BM{bm}_R3.dat'
+    np.savetxt(file_R3, 2.*np.loadtxt(file_R3), fmt='%.8f')
+    stat = os.stat(file_R3)
+    os.utime(file_R3, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    RF_changed = FWF.load_response_functions(path_lrfs, ism, bm, CP.sectors)
+    assert 'Compiling' in capsys.readouterr().out
+    np.testing.assert_array_equal(RF_changed, reference.response_functions(path_lrfs, ism, bm, CP.sectors).values.T.astype(float))
+    assert not np.array_equal(RF_changed[CP.sectors.index('amun')], RF[CP.sectors.index('amun')])
@@ -0,0 +1,49 @@
+# Ring buffer running means (ThetaoSectors.running_mean_update) vs. running_mean_backward of the original scripts
+
+## Import modules
+import numpy as np
+import pandas as pd
+
+import Coupler as CP
+import ThetaoSectors as TS
+from config import running_mean_period
+from helpers import year_min, exp_name
+
+def test_ring_buffer_matches_backward_mean():
+    '''
+    Running means of several periods, shorter and longer than the experiment, updated year by year
+    vs. the backward mean over the years of the experiment padded with the baseline values
+    '''
+    rng = np.random.default_rng(0)
+    n_years = 40
+    periods = [30, 10, 50, 1, 7]
+    thetao = rng.normal(0.5, 0.3, size=(n_years, len(CP.sectors)))
+    df_thetao = pd.DataFrame(thetao, columns=CP.sectors).assign(year=np.arange(year_min, year_min+n_years))
+    df_thetao_baseline = pd.DataFrame([rng.normal(0.2, 0.1, len(CP.sectors))], columns=CP.sectors, index=[year_min])
+
+    buffer = np.empty((max(periods), len(CP.sectors)))
+    sums = np.empty((len(periods), len(CP.sectors)))
+    TS.running_mean_init(buffer, sums, periods, df_thetao_baseline.values[0])
+    for t in range(n_years):
+        running_means = TS.running_mean_update(buffer, sums, periods, t, thetao[t])
+        for p, period in enumerate(periods):
+            backward = TS.running_mean_backward(df_thetao, df_thetao_baseline, year_min+t, year_min, period)
+            np.testing.assert_allclose(running_means[p], backward.loc[year_min+t, CP.sectors].values.astype(float),
+                                       rtol=1e-12, err_msg=f'period {period} year {year_min+t}')
+
+def test_monitoring_periods_match_backward_mean(straight_run):
+    '''
+    Running means of the forcing period and the monitoring periods exported by the coupler vs. the backward mean
+    '''
+    files, static = straight_run
+    year_max = files['year_max']
+    df_thetao = pd.read_csv(f"{files['path_output']}/OceanSectorThetao_{exp_name}_{year_min}_{year_max}.csv",
+                            float_precision='round_trip')
+    assert static['running_mean_periods'][0] == running_mean_period and len(static['running_mean_periods']) > 1
+    for period in static['running_mean_periods']:
+        df_rm = pd.read_csv(f"{files['path_output']}/OceanSectorThetao_{period}yRM_{exp_name}_{year_min}_{year_max}.csv",
+                            index_col=0, float_precision='round_trip')
+        for year in range(year_min, year_max+1):
+            backward = TS.running_mean_backward(df_thetao, static['df_thetao_baseline'], year, year_min, period)
+            np.testing.assert_allclose(df_rm.loc[year, CP.sectors].values, backward.loc[year, CP.sectors].values.astype(float),
+                                       rtol=1e-12, err_msg=f'period {period} year {year}')
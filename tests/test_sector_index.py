@@ -0,0 +1,66 @@
+# Cached sector index (SectorIndex.py) vs. the sector masks of the original scripts
+
+## Import modules
+import os
+
+import numpy as np
+import pytest
+import xarray as xr
+
+import DataVariablesParameters as dvp
+import SectorIndex as SI
+import ThetaoSectors as TS
+import reference
+
+sectors = ['eais','wedd','amun','ross','apen']
+
+def test_sector_index_matches_original_masks(experiment, tmp_path):
+    '''
+    Cells of the index are the cells of the original sector masks with an area, and the area weighted means
+    over the index are the original area weighted means
+    '''
+    file_area = experiment['files']['file_area']
+    index = SI.load_sector_index(file_area, f'{tmp_path}/SectorIndex.npz', sectors)
+
+    with xr.open_dataset(file_area) as ds_area:
+        rng = np.random.default_rng(0)
+        field = xr.DataArray(rng.normal(1., 0.5, size=(3,) + ds_area.areacello.shape), dims=('lev','j','i'))
+        area = ds_area.areacello.values
+        for sector in sectors:
+            mask = reference.mask_sector(ds_area, sector).values & (np.nan_to_num(area) > 0)
+            assert set(zip(index[sector]['j'], index[sector]['i'])) == set(zip(*np.nonzero(mask))), sector
+            np.testing.assert_allclose(TS.area_weighted_mean(field, None, sector, index).values,
+                                       reference.area_weighted_mean(field, ds_area, sector).values, rtol=1e-12, err_msg=sector)
+
+def test_sector_index_rebuilt_when_inputs_change(experiment, tmp_path, monkeypatch, capsys):
+    '''
+    The index file is used while the area file and the sector definitions are unchanged, and rebuilt when one changes
+    '''
+    file_area = f'{tmp_path}/areacello.nc'
+    file_index = f'{tmp_path}/SectorIndex.npz'
+    with open(experiment['files']['file_area'], 'rb') as f_src, open(file_area, 'wb') as f_dst:
+        f_dst.write(f_src.read())
+
+    index = SI.load_sector_index(file_area, file_index, sectors)
+    assert 'Building' in capsys.readouterr().out
+    SI.load_sector_index(file_area, file_index, sectors)
+    assert 'Building' not in capsys.readouterr().out
+
+    ## Amundsen sector extended to the east: more cells
+    monkeypatch.setitem(dvp.sector_boxes, 'amun', [(None, -70, 210, 300)])
+    index_changed = SI.load_sector_index(file_area, file_index, sectors)
+    assert 'out of date' in capsys.readouterr().out
+    assert len(index_changed['amun']['j']) > len(index['amun']['j'])
+    np.testing.assert_array_equal(index_changed['ross']['j'], index['ross']['j'])
+    monkeypatch.undo()
+
+    ## Area file written again (new modification time)
+    stat = os.stat(file_area)
+    os.utime(file_area, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    index_rebuilt = SI.load_sector_index(file_area, file_index, sectors)
+    assert 'out of date' in capsys.readouterr().out
+    for sector in sectors:
+        np.testing.assert_array_equal(index_rebuilt[sector]['weights'], index[sector]['weights'])
+
+    with pytest.raises(ValueError, match='Unknown sector'):
+        SI.load_sector_index(file_area, file_index, sectors + ['weddell'])
@@ -0,0 +1,56 @@
+# Sparse volume operator (SectorOperator.py) vs. the area and depth weighted means of the original scripts
+
+## Import modules
+import pytest
+import xarray as xr
+
+import Coupler as CP
+import NemoOutput as NO
+import SectorOperator as SO
+import reference
+
+def test_volume_operator_matches_original(experiment, sector_index, reference_means):
+    '''
+    Volume operator applied to the annual mean read with xarray and with netCDF4 vs. area_weighted_mean followed by
+    lev_weighted_mean, for every year
+    '''
+    for file_thetao, reference_mean in zip(experiment['files_thetao'], reference_means):
+        thetao, lev_bnds, index = NO.read_annual_mean(file_thetao, sector_index, CP.sectors)
+        operator = SO.build_volume_operator(index, lev_bnds, CP.sectors, thetao.shape)
+        means = {'xarray': NO.sector_mean_thetao(file_thetao, sector_index, CP.sectors),
+                 'netcdf4': SO.apply_volume_operator(operator, thetao)}
+        for method, mean in means.items():
+            for sector in CP.sectors:
+                assert mean[sector] == pytest.approx(reference_mean[sector], rel=1e-12, abs=1e-12), f'{method} {sector} {file_thetao}'
+
+def test_volume_operator_per_sector(experiment, sector_index, reference_means):
+    '''
+    Operator built for a single sector gives the original mean of that sector
+    '''
+    file_thetao = experiment['files_thetao'][0]
+    thetao, lev_bnds, index = NO.read_annual_mean(file_thetao, sector_index, CP.sectors)
+    for sector in CP.sectors:
+        operator = SO.build_volume_operator(index, lev_bnds, [sector], thetao.shape)
+        assert SO.apply_volume_operator(operator, thetao)[sector] == pytest.approx(reference_means[0][sector], rel=1e-12)
+
+def test_original_bounds_clipped_in_place(experiment, sector_index):
+    '''
+    The original lev_weighted_mean clipped the level bounds of the NEMO file in place, so in the sector order of the
+    coupler every sector after the first used the bounds clipped by the sectors before it. The operator uses the
+    bounds of the file for every sector: same mean for the first sector, the differences below for the others (K,
+    first year of the synthetic ORCA1 experiment)
+    '''
+    file_thetao = experiment['files_thetao'][0]
+    thetao, lev_bnds, index = NO.read_annual_mean(file_thetao, sector_index, CP.sectors)
+    means = SO.apply_volume_operator(SO.build_volume_operator(index, lev_bnds, CP.sectors, thetao.shape), thetao)
+    with xr.open_dataset(experiment['files']['file_area']) as ds_area, reference.open_thetao(file_thetao) as ds:
+        ds_thetao_year = reference.annual_mean(ds)
+        original = reference.original_sector_means(ds_thetao_year, ds['olevel_bounds'], ds_area, CP.sectors)
+        ## A sector computed on its own is not affected
+        for sector in CP.sectors:
+            assert reference.original_sector_means(ds_thetao_year, ds['olevel_bounds'], ds_area, [sector])[sector] == \
+                pytest.approx(means[sector], rel=1e-12)
+
+    differences = {sector: original[sector] - means[sector] for sector in CP.sectors}
+    assert differences == pytest.approx({'eais': 0., 'wedd': -0.0103, 'amun': -0.0297, 'ross': -0.0408, 'apen': 0.0727},
+                                        abs=1e-4)
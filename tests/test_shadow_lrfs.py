@@ -0,0 +1,56 @@
+# Forcing spread of additional response functions (config.shadow_lrfs) vs. the forcing of every set of response
+# functions computed separately as in the original driver script
+
+## Import modules
+import numpy as np
+
+import Coupler as CP
+import CouplerState as CS
+import reference
+from config import gamma, ism, bm, running_mean_period, FWF_total_yearmin
+from helpers import year_min, n_years, coupler_run, couple_years, assert_same_run
+
+## Additional response functions: scaled copies of the response functions of the forcing
+shadow_scales = {('PISM_DMI', '08'): 0.5, ('IMAU_VUB', '16'): 2.}
+
+def write_shadow_lrfs(path_lrfs):
+    '''
+    Write the shadow response functions, scaled copies of the response functions of ism and bm
+    '''
+    for (ism_shadow, bm_shadow), scale in shadow_scales.items():
+        for region in reference.LRF_sector.values():
+            RF = np.loadtxt(f'{path_lrfs}/TotalFW/RF_{ism}_BM{bm}_{region}.dat')
+            np.savetxt(f'{path_lrfs}/TotalFW/RF_{ism_shadow}_BM{bm_shadow}_{region}.dat', scale*RF, fmt='%.8f')
+
+def test_spread_matches_separate_forcing(experiment, straight_run, tmp_path_factory, tmp_path, monkeypatch):
+    '''
+    Spread (min, median, max) of the coupler run vs. freshwater_flux_anomaly_df applied year by year with each set of
+    response functions; the forcing itself is the forcing of the run without shadow response functions
+    '''
+    monkeypatch.setattr(CP, 'shadow_lrfs', list(shadow_scales))
+    files, static = coupler_run(experiment, tmp_path_factory)
+    write_shadow_lrfs(files['path_lrfs'])
+    state = couple_years(files, static, range(year_min, year_min+n_years))
+    assert state['meta']['shadow_lrfs'] == [list(lrf) for lrf in shadow_scales]
+    assert_same_run(straight_run[0], files)
+
+    df_thetao = CS.state_dataframe(state, 'thetao')
+    dFWF_sets, FWF_total_sets = [], []
+    for k, (ism_set, bm_set) in enumerate([(ism, bm)] + list(shadow_scales)):
+        original = reference.coupler_monitoring(df_thetao, static['df_thetao_baseline'], files['path_lrfs'], ism_set, bm_set,
+                                                gamma, running_mean_period, FWF_total_yearmin, year_min+n_years-1,
+                                                f'{tmp_path}/Future_{k}.csv')
+        dFWF_sets.append(original['dFWF'].values)
+        FWF_total_sets.append(original['FWF_total']['0'].values)
+    dFWF_sets, FWF_total_sets = np.stack(dFWF_sets), np.stack(FWF_total_sets)
+
+    for k, stat in enumerate([np.min, np.median, np.max]):
+        np.testing.assert_allclose(state['dFWF_spread'][1:,k], stat(dFWF_sets[:,1:], axis=0), rtol=1e-12, err_msg=stat.__name__)
+        np.testing.assert_allclose(state['FWF_total_spread'][:,k], stat(FWF_total_sets, axis=0), rtol=1e-12, err_msg=stat.__name__)
+    assert np.isnan(state['dFWF_spread'][0]).all()
+
+    ## Exported spread (one column per sector and statistic)
+    df_spread = CS.state_dataframe(state, 'FWF_spread')
+    assert list(df_spread.index) == list(range(year_min, year_min+n_years))
+    np.testing.assert_allclose(df_spread['total_median'].values, np.median(FWF_total_sets, axis=0), rtol=1e-12)
+    np.testing.assert_allclose(df_spread['amun_max'].values[1:], dFWF_sets[:,1:,CP.sectors.index('amun')].max(axis=0), rtol=1e-12)
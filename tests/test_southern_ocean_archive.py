@@ -0,0 +1,83 @@
+# Southern Ocean archive of the coupler (SouthernOceanArchive.py) vs. the xarray annual mean of the NEMO output and
+# the layer weighted means of the original scripts
+
+## Import modules
+import numpy as np
+import pytest
+
+import Coupler as CP
+import CouplerState as CS
+import NemoOutput as NO
+import SouthernOceanArchive as SOA
+import reference
+from helpers import year_min, n_years, coupler_run, couple_years, assert_same_forcing_file
+
+region = {'lat_max': -60., 'depth_max': 1000.}
+
+@pytest.fixture(scope='module')
+def archive_run(experiment, tmp_path_factory):
+    '''
+    Coupler run of all years writing the archive, within a memory budget (without opening the NEMO output with xarray)
+    '''
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setattr(CP, 'southern_ocean_archive', region)
+        monkeypatch.setattr(CP, 'memory_budget', 0.05)
+        monkeypatch.setattr(NO, 'open_thetao_subset', None)
+        files, static = coupler_run(experiment, tmp_path_factory)
+        state = couple_years(files, static, range(year_min, year_min+n_years))
+    return files, static, state
+
+def test_archive_matches_annual_mean(experiment, straight_run, archive_run):
+    '''
+    Archived maps are the month length weighted annual means of the region (float32); the sector temperatures are
+    those of the run without archive
+    '''
+    files, static, state = archive_run
+    np.testing.assert_allclose(state['thetao'], CS.open_state(straight_run[0]['path_state'])['thetao'], rtol=1e-12)
+    for year in range(year_min, year_min+n_years):
+        assert_same_forcing_file(CP.forcing_file(files, year), CP.forcing_file(straight_run[0], year))
+
+    with SOA.open_archive(files['file_archive']) as ds_archive:
+        assert list(ds_archive['year'].values) == list(range(year_min, year_min+n_years))
+        n_lev, n_j = ds_archive.sizes['lev'], ds_archive.sizes['j']
+        for k, file_thetao in enumerate(experiment['files_thetao']):
+            with reference.open_thetao(file_thetao) as ds:
+                assert (ds['latitude'].values[n_j:] >= region['lat_max']).all()
+                assert ds['olevel_bounds'].values[n_lev-1,0] < region['depth_max'] <= ds['olevel_bounds'].values[n_lev,0]
+                expected = reference.annual_mean(ds).values[:n_lev,:n_j].astype('float32')
+            np.testing.assert_allclose(ds_archive['thetao'].values[k], expected, rtol=1e-6, equal_nan=True)
+
+def test_depth_mean_matches_original(archive_run):
+    '''
+    Depth window maps vs. lev_weighted_mean of the archived layers; mean over a period; windows below the archive
+    '''
+    files = archive_run[0]
+    depth_bnds = (312.5, 712.5)
+    maps = SOA.depth_mean(files['file_archive'], *depth_bnds)
+    with SOA.open_archive(files['file_archive']) as ds_archive:
+        lev_bnds = ds_archive['lev_bnds']
+        for t, year in enumerate(ds_archive['year'].values):
+            original = reference.lev_weighted_mean(ds_archive['thetao'].isel(year=t).astype('float64'), lev_bnds, None,
+                                                   depth_bnds=depth_bnds)
+            np.testing.assert_allclose(maps.sel(year=year).values, original.values, rtol=1e-6, equal_nan=True)
+
+    period = SOA.period_mean(files['file_archive'], *depth_bnds, year_min+1, year_min+n_years-1)
+    np.testing.assert_allclose(period.values, maps.isel(year=slice(1, None)).mean('year').values, rtol=1e-6)
+    with pytest.raises(ValueError, match='deeper than the archive'):
+        SOA.depth_mean(files['file_archive'], 900., 2000.)
+
+def test_archive_rerun_and_region(experiment, archive_run, sector_index):
+    '''
+    A year computed again replaces its record; another region is an error
+    '''
+    files = archive_run[0]
+    with SOA.open_archive(files['file_archive']) as ds_archive:
+        before = ds_archive['thetao'].values
+    SOA.archive_year(files['file_archive'], experiment['files_thetao'][1], year_min+1, sector_index, CP.sectors, **region)
+    with SOA.open_archive(files['file_archive']) as ds_archive:
+        assert ds_archive.sizes['year'] == n_years
+        np.testing.assert_array_equal(ds_archive['thetao'].values, before)
+
+    with pytest.raises(ValueError, match='another region'):
+        SOA.archive_year(files['file_archive'], experiment['files_thetao'][1], year_min+1, sector_index, CP.sectors,
+                         lat_max=-50., depth_max=1000.)